@@ -0,0 +1,113 @@
+"""Per-route admission control.
+
+Each limited route gets a concurrency limit and a bounded wait queue. A
+request that cannot start within its deadline, or that finds the queue
+full, is shed straight away with a 503 and Retry-After instead of tying
+up a worker. Routes can also ask whether they are under pressure and
+downgrade expensive work (e.g. serve cached data instead of calling
+Sheets) before anything gets shed.
+"""
+import threading
+import time
+
+
+class RouteLimiter:
+    def __init__(self, name, max_concurrent, max_queue, timeout):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+        self.degraded = 0
+
+    def acquire(self):
+        """Return True once a slot is free, or False if the request should be shed."""
+        with self._cond:
+            if self.active < self.max_concurrent:
+                self.active += 1
+                self.admitted += 1
+                return True
+
+            if self.waiting >= self.max_queue:
+                self.shed += 1
+                return False
+
+            self.waiting += 1
+            deadline = time.monotonic() + self.timeout
+            try:
+                while self.active >= self.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.shed += 1
+                        return False
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+
+            self.active += 1
+            self.admitted += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def note_degraded(self):
+        with self._cond:
+            self.degraded += 1
+
+    def under_pressure(self):
+        """True once requests are queuing, the cue to take cheaper paths.
+
+        Only the queue counts: a request asking this holds a slot itself, so
+        every slot being busy is just full use, not yet a backlog.
+        """
+        return self.waiting > 0
+
+    def stats(self):
+        with self._cond:
+            return {
+                "active": self.active,
+                "queue_depth": self.waiting,
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "shed": self.shed,
+                "degraded": self.degraded
+            }
+
+
+class AdmissionController:
+    def __init__(self, limits, retry_after=1):
+        self.retry_after = retry_after
+        self.limiters = {
+            name: RouteLimiter(name, **limit) for name, limit in limits.items()
+        }
+
+    def get(self, endpoint):
+        return self.limiters.get(endpoint)
+
+    def stats(self):
+        return {name: limiter.stats() for name, limiter in self.limiters.items()}
+
+    def prometheus(self):
+        """Counters and gauges in the Prometheus text exposition format."""
+        lines = []
+        metrics = [
+            ("streakflow_admission_active", "gauge", "active"),
+            ("streakflow_admission_queue_depth", "gauge", "queue_depth"),
+            ("streakflow_admission_admitted_total", "counter", "admitted"),
+            ("streakflow_admission_shed_total", "counter", "shed"),
+            ("streakflow_admission_degraded_total", "counter", "degraded"),
+        ]
+        stats = self.stats()
+        for metric, kind, key in metrics:
+            lines.append(f"# TYPE {metric} {kind}")
+            for route, values in stats.items():
+                lines.append(f'{metric}{{route="{route}"}} {values[key]}')
+        return "\n".join(lines) + "\n"
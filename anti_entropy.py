@@ -0,0 +1,265 @@
+"""Hash-tree consistency check between the storage backend and the Google Sheet.
+
+Both sides summarise their entries as a two-level hash tree: every entry
+contributes a 64-bit digest (the first 8 bytes of SHA-256 over
+"YYYY-MM-DD|mood"), a month's hash is the sum of its entries' digests
+modulo 2**64, and a year's hash is the sum of its months. Sums do not
+depend on order, so the sheet's insertion order does not matter and a
+tree can be updated one entry at a time. Each node also carries its entry
+count.
+
+The backend keeps its month nodes persisted (see storage.py), updated by
+record_entry() as entries are inserted, so a check reads one small node
+per month instead of scanning every entry. The first check on a backend
+without nodes backfills them from a full scan.
+
+A check compares the per-year hashes (a few hundred bytes), descends only
+into years that differ, compares their months, and fetches rows only for
+the months that still differ. A stored node that disagrees with the rows
+read for its month (e.g. an insert that raced the backfill) is corrected
+from those rows. Repairs copy entries missing from one side to the other;
+days whose moods disagree are reported, not overwritten.
+
+For the sheet, only the first valid row for a day counts, matching the
+first-wins rule of the backend. The Apps Script side lives in
+apps_script/Code.gs (?action=hashes, ?action=hashes&year=YYYY and
+?action=month&month=YYYY-MM).
+
+    python anti_entropy.py            # report differences
+    python anti_entropy.py --repair   # and copy missing entries across
+"""
+import hashlib
+from datetime import date, datetime
+
+import requests
+
+from schema import decode_entry, parse_date_str, to_epoch_day
+
+MASK = (1 << 64) - 1
+
+
+def entry_digest(date_str, mood):
+    return int.from_bytes(hashlib.sha256(f"{date_str}|{mood}".encode()).digest()[:8], "big")
+
+
+def digest_halves(date_str, mood):
+    """(high, low) 32-bit halves of an entry's digest, the form the backends sum."""
+    digest = entry_digest(date_str, mood)
+    return digest >> 32, digest & 0xFFFFFFFF
+
+
+def month_nodes(rows):
+    """{"YYYY-MM": [hi sum, lo sum, count]} for (date, mood) rows, as stored by the backends."""
+    nodes = {}
+    for date_str, mood in rows:
+        hi, lo = digest_halves(date_str, mood)
+        node = nodes.setdefault(date_str[:7], [0, 0, 0])
+        node[0] += hi
+        node[1] += lo
+        node[2] += 1
+    return nodes
+
+
+def record_entry(store, date_str, mood):
+    """Fold a newly inserted entry into the backend's month node."""
+    store.add_hash_node(date_str[:7], *digest_halves(date_str, mood))
+
+
+def _hex(value):
+    return f"{value:016x}"
+
+
+def first_per_day(rows):
+    """Valid [date, mood] rows, keeping the first row for each date."""
+    seen = set()
+    for row in rows:
+        if len(row) < 2:
+            continue
+        date_str, mood = row[0], str(row[1])
+        try:
+            parse_date_str(date_str)
+        except ValueError:
+            continue
+        if date_str not in seen:
+            seen.add(date_str)
+            yield date_str, mood
+
+
+class HashTree:
+    def __init__(self):
+        # "YYYY-MM" -> [digest sum, entry count]
+        self.months = {}
+
+    @classmethod
+    def from_nodes(cls, nodes):
+        """From stored {"YYYY-MM": (hi, lo, count)} month nodes."""
+        tree = cls()
+        tree.months = {month: [((hi << 32) + lo) & MASK, n] for month, (hi, lo, n) in nodes.items() if n}
+        return tree
+
+    @classmethod
+    def from_rows(cls, rows):
+        tree = cls()
+        for date_str, mood in rows:
+            tree.add(date_str, mood)
+        return tree
+
+    def add(self, date_str, mood):
+        node = self.months.setdefault(date_str[:7], [0, 0])
+        node[0] = (node[0] + entry_digest(date_str, mood)) & MASK
+        node[1] += 1
+
+    def years(self):
+        """{"YYYY": [hash, count]}, the top level of the tree."""
+        sums = {}
+        for month, (value, count) in self.months.items():
+            node = sums.setdefault(month[:4], [0, 0])
+            node[0] = (node[0] + value) & MASK
+            node[1] += count
+        return {year: [_hex(value), count] for year, (value, count) in sorted(sums.items())}
+
+    def year_months(self, year):
+        """{"YYYY-MM": [hash, count]} for one year."""
+        return {
+            month: [_hex(value), count]
+            for month, (value, count) in sorted(self.months.items()) if month.startswith(f"{year}-")
+        }
+
+
+class SheetHashes:
+    """The sheet's side of the tree, served by the Apps Script."""
+
+    def __init__(self, url, timeout=30):
+        self.url = url
+        self.timeout = timeout
+        self.bytes_received = 0
+
+    def _get(self, params):
+        response = requests.get(self.url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        self.bytes_received += len(response.content)
+        body = response.json()
+        if body.get("status") != "success":
+            raise RuntimeError(f"Apps Script error: {body.get('message', 'unknown')}")
+        return body
+
+    def years(self):
+        return self._get({"action": "hashes"})["years"]
+
+    def year_months(self, year):
+        return self._get({"action": "hashes", "year": year})["months"]
+
+    def month_rows(self, month):
+        return list(first_per_day(self._get({"action": "month", "month": month})["data"]))
+
+
+def _differing(local, remote):
+    return sorted(key for key in set(local) | set(remote) if local.get(key) != remote.get(key))
+
+
+def _month_range(month):
+    year, number = int(month[:4]), int(month[5:7])
+    start = date(year, number, 1)
+    end = date(year + 1, 1, 1) if number == 12 else date(year, number + 1, 1)
+    return to_epoch_day(start), to_epoch_day(end)
+
+
+def compare(local, sheet, month_rows):
+    """Walk both trees and diff the months that disagree.
+
+    `local` is the backend's HashTree, `sheet` a SheetHashes, and
+    `month_rows(month)` returns the backend's (date, mood) pairs for one
+    "YYYY-MM" month.
+    """
+    report = {"consistent": True, "years": [], "months": [],
+              "missing_in_store": [], "missing_in_sheet": [], "conflicts": []}
+
+    for year in _differing(local.years(), sheet.years()):
+        report["years"].append(year)
+        for month in _differing(local.year_months(year), sheet.year_months(year)):
+            report["months"].append(month)
+            ours = dict(month_rows(month))
+            theirs = dict(sheet.month_rows(month))
+            for date_str in sorted(set(ours) | set(theirs)):
+                if date_str not in ours:
+                    report["missing_in_store"].append([date_str, theirs[date_str]])
+                elif date_str not in theirs:
+                    report["missing_in_sheet"].append([date_str, ours[date_str]])
+                elif ours[date_str] != theirs[date_str]:
+                    report["conflicts"].append({"date": date_str, "store": ours[date_str], "sheet": theirs[date_str]})
+
+    report["consistent"] = not report["years"]
+    report["bytes_from_sheet"] = sheet.bytes_received
+    return report
+
+
+def store_pairs(docs):
+    for doc in docs:
+        entry = decode_entry(doc)
+        yield entry["date"], entry["mood"]
+
+
+def load_nodes(store, scan=None):
+    """The backend's month nodes, backfilled from `scan()` (default store.scan) if it has none yet."""
+    nodes = store.hash_nodes()
+    if nodes is None:
+        nodes = month_nodes(store_pairs((scan or store.scan)()))
+        store.set_hash_nodes(nodes, complete=True)
+    return nodes
+
+
+def check(store, sheet_url, scan=None):
+    """Compare the backend's persisted tree with the sheet; `scan` is only used to backfill it."""
+    nodes = load_nodes(store, scan)
+
+    def month_rows(month):
+        rows = list(store_pairs(store.scan(*_month_range(month))))
+        node = month_nodes(rows).get(month, [0, 0, 0])
+        if list(nodes.get(month, (0, 0, 0))) != node:
+            store.set_hash_nodes({month: node})
+        return rows
+
+    return compare(HashTree.from_nodes(nodes), SheetHashes(sheet_url), month_rows)
+
+
+def repair(report, insert_entry, append_to_sheet):
+    """Copy missing entries across; returns how many were written to each side."""
+    stored = 0
+    for date_str, mood in report["missing_in_store"]:
+        if insert_entry(datetime.strptime(date_str, "%Y-%m-%d"), mood):
+            stored += 1
+    appended = 0
+    for date_str, mood in report["missing_in_sheet"]:
+        result = append_to_sheet({"type": "mydata", "date": date_str, "mood": mood})
+        if result.get("status") == "success":
+            appended += 1
+        else:
+            print(f"Could not append {date_str} to the sheet: {result.get('message', 'unknown error')}")
+    return {"stored": stored, "appended": appended}
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Compare (and repair) the storage backend and the Google Sheet")
+    parser.add_argument("--repair", action="store_true", help="copy entries missing on either side across")
+    args = parser.parse_args()
+
+    # Uses the same STORAGE_BACKEND / MONGO_URI / SQLITE_PATH / GOOGLE_SCRIPT_URL settings as the app
+    import app
+
+    if not app.GOOGLE_SCRIPT_URL:
+        parser.error("GOOGLE_SCRIPT_URL is not set")
+
+    report = check(app.store, app.GOOGLE_SCRIPT_URL, app.scan_entries)
+    print(json.dumps(report, indent=2))
+    if args.repair and not report["consistent"]:
+        def insert_entry(date_obj, mood):
+            if not app.store.upsert(date_obj, mood):
+                return False
+            app.after_insert(date_obj, mood)
+            return True
+
+        print(repair(report, insert_entry, app.send_to_google_sheets))
+        app.edge_cache.purge(["entries"])
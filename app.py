@@ -1,9 +1,36 @@
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, g, has_request_context, request, jsonify
 from pymongo import MongoClient
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+from pymongo.write_concern import WriteConcern
 from datetime import datetime, timedelta
 import os
+import pytz
 import requests
+import hmac
 import json
+import threading
+import time
+
+from admission import AdmissionController
+from anti_entropy import record_entry
+from archive import ArchiveTier
+from binary_snapshot import SnapshotEntries
+from calendar_index import CalendarIndex, CalendarIndexStore
+from downsample import METHODS as DOWNSAMPLE_METHODS
+from edge_cache import EdgeCache, FastlyPurger, WebhookPurger, compress_response
+from group_commit import GroupCommitTimeout, GroupCommitter
+from habits import counts_towards_streak, habit_stats, load_habits, parse_value, window_by_day
+from idempotency import (IdempotencyCache, MAX_KEY_LENGTH, MemoryIdempotencyStore, MongoIdempotencyStore,
+                         SQLiteIdempotencyStore, request_fingerprint)
+from insights import InsightEngine
+from jobs import JobRunner, MemoryJobQueue, MongoJobQueue, SQLiteJobQueue
+from notes import parse_note, query_terms, snippet
+from profiling import RequestProfiler
+from reports import REPORTS
+from schema import MOOD_CODES, decode_entry, entry_day, epoch_day_to_str, parse_date_str, to_epoch_day
+from sheets_sync import SheetsMirror, entries_from_sheet_rows
+from storage import MemoryStore, MongoStore, SQLiteStore
+from streaks import StreakTracker, evaluate, local_today, runs_from_days
 
 app = Flask(__name__)
 
@@ -17,9 +44,203 @@ GOOGLE_SCRIPT_URL = os.getenv("GOOGLE_SCRIPT_URL")
 if not GOOGLE_SCRIPT_URL:
     print("Warning: GOOGLE_SCRIPT_URL is not set. Data will only be saved to MongoDB.")
 
-client = MongoClient(MONGO_URI)
-db = client["streakflow"]
-collection = db["entries"]
+# Incremental sheet sync: only rows past the last seen one are fetched and parsed.
+# Works with any Apps Script; see apps_script/Code.gs for the incremental handler.
+SHEETS_INCREMENTAL = os.getenv("SHEETS_INCREMENTAL", "1").lower() in ("1", "true", "yes")
+sheets_mirror = SheetsMirror(GOOGLE_SCRIPT_URL) if GOOGLE_SCRIPT_URL and SHEETS_INCREMENTAL else None
+
+# Where entries live: "mongo", "sqlite" (one local WAL-mode file, for single-node
+# deployments without a network database) or "memory" (lost on restart). See storage.py.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "streakflow.db")
+if STORAGE_BACKEND not in ("mongo", "sqlite", "memory"):
+    raise ValueError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}. Use mongo, sqlite or memory.")
+
+# Database holding every collection; change it for scratch runs (e.g. bench/loadtest.py)
+MONGO_DB = os.getenv("MONGO_DB", "streakflow")
+
+client = db = collection = meta = archive_tier = None
+if STORAGE_BACKEND == "mongo":
+    client = MongoClient(MONGO_URI)
+    db = client[MONGO_DB]
+    collection = db["entries"]
+    meta = db["meta"]
+
+    # Closed years live in compressed yearly blocks (see archive.py); readers span both tiers
+    archive_tier = ArchiveTier(collection, db["archive"])
+
+# "compact" stores {"d": epoch_day, "m": mood_code}; "legacy" keeps {"date", "mood"}.
+# Readers understand both, so switch writers first and then run migrate_schema.py.
+STORAGE_SCHEMA = os.getenv("STORAGE_SCHEMA", "legacy").lower()
+COMPACT_SCHEMA = STORAGE_SCHEMA == "compact"
+
+# Bitset calendar index kept alongside `collection` (see calendar_index.py). Other
+# backends build it in memory per request, which is cheap with local reads.
+CALENDAR_INDEX = os.getenv("CALENDAR_INDEX", "1").lower() in ("1", "true", "yes")
+calendar_store = CalendarIndexStore(db["calendar_index"]) if db is not None else None
+
+# Streaks are judged in this timezone: a streak ends once a whole local day passes
+# without an entry. The stored timezone can be changed with POST /streaks/timezone.
+STREAK_TIMEZONE = os.getenv("STREAK_TIMEZONE", "UTC")
+pytz.timezone(STREAK_TIMEZONE)  # fail fast on a typo
+# Background sweep at each local midnight (and at least this often, in seconds); 0 disables it
+STREAK_SWEEP_INTERVAL = float(os.getenv("STREAK_SWEEP_INTERVAL", "3600"))
+
+# The home page embeds a snapshot of the dashboard state, rebuilt when the data
+# version changes or, to pick up edits made directly in the sheet, after a TTL
+SNAPSHOT_TTL = float(os.getenv("SNAPSHOT_TTL", "60"))
+
+# Edge caching of /, /data and /insights (see edge_cache.py): shared caches keep
+# responses for EDGE_S_MAXAGE seconds and may serve them stale while revalidating for
+# another EDGE_STALE_WHILE_REVALIDATE. Writes purge by surrogate key through
+# EDGE_PURGE_URL (POSTed {"keys": [...]}) or Fastly's API when FASTLY_SERVICE_ID is
+# set. Off by default without a purger, since cached copies would then outlive writes.
+EDGE_CACHE = os.getenv("EDGE_CACHE")
+EDGE_S_MAXAGE = int(os.getenv("EDGE_S_MAXAGE", "60"))
+EDGE_STALE_WHILE_REVALIDATE = int(os.getenv("EDGE_STALE_WHILE_REVALIDATE", "300"))
+EDGE_KEY_HEADER = os.getenv("EDGE_KEY_HEADER", "Surrogate-Key")
+EDGE_PURGE_URL = os.getenv("EDGE_PURGE_URL")
+EDGE_PURGE_TOKEN = os.getenv("EDGE_PURGE_TOKEN")
+FASTLY_SERVICE_ID = os.getenv("FASTLY_SERVICE_ID")
+FASTLY_API_TOKEN = os.getenv("FASTLY_API_TOKEN")
+
+# JSON and HTML responses of at least this many bytes are sent brotli- or
+# gzip-compressed when the client accepts it; 0 disables compression
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+
+# Memory-mapped binary snapshot of the entries (see binary_snapshot.py). Workers map
+# it at startup and only scan years changed since it was written, instead of the
+# whole backend. The app rewrites it every BINARY_SNAPSHOT_INTERVAL seconds (0 leaves
+# it to `python binary_snapshot.py --write`, e.g. from cron or a deploy step).
+BINARY_SNAPSHOT_PATH = os.getenv("BINARY_SNAPSHOT_PATH")
+BINARY_SNAPSHOT_INTERVAL = float(os.getenv("BINARY_SNAPSHOT_INTERVAL", "3600"))
+
+# /data?stream=1 encodes entries straight from the Mongo cursor in chunks of this many
+DATA_STREAM_CHUNK = int(os.getenv("DATA_STREAM_CHUNK", "500"))
+
+# /chart-series ranges in days (None = all history) and the largest point budget
+CHART_RANGES = {"30d": 30, "90d": 90, "1y": 365, "5y": 5 * 365, "all": None}
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "1000"))
+
+# Per-route admission control: concurrency limit, bounded wait queue and the
+# longest a request may wait (seconds) before it is shed with a 503. Limits are
+# per worker process, so they matter with threaded workers (gunicorn --threads).
+# Override per endpoint with ADMISSION_LIMITS='{"data": {"max_concurrent": 2}}'.
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "1").lower() in ("1", "true", "yes")
+ADMISSION_LIMITS = {
+    "home": {"max_concurrent": 8, "max_queue": 16, "timeout": 1.0},
+    "submit_entry": {"max_concurrent": 8, "max_queue": 32, "timeout": 5.0},
+    "data": {"max_concurrent": 4, "max_queue": 8, "timeout": 2.0},
+    "chart_series": {"max_concurrent": 2, "max_queue": 4, "timeout": 2.0},
+    "calendar_stats": {"max_concurrent": 4, "max_queue": 8, "timeout": 2.0},
+    "search_notes": {"max_concurrent": 4, "max_queue": 8, "timeout": 2.0},
+    "dashboard_insights": {"max_concurrent": 4, "max_queue": 8, "timeout": 2.0}
+}
+for endpoint, limit in json.loads(os.getenv("ADMISSION_LIMITS", "{}")).items():
+    ADMISSION_LIMITS[endpoint] = {**ADMISSION_LIMITS.get(endpoint, {"max_concurrent": 4, "max_queue": 8, "timeout": 2.0}), **limit}
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+admission = AdmissionController(ADMISSION_LIMITS if ADMISSION_CONTROL else {}, retry_after=ADMISSION_RETRY_AFTER)
+
+edge_purger = None
+if FASTLY_SERVICE_ID and FASTLY_API_TOKEN:
+    edge_purger = FastlyPurger(FASTLY_SERVICE_ID, FASTLY_API_TOKEN)
+elif EDGE_PURGE_URL:
+    edge_purger = WebhookPurger(EDGE_PURGE_URL, EDGE_PURGE_TOKEN)
+edge_cache = EdgeCache(EDGE_S_MAXAGE, EDGE_STALE_WHILE_REVALIDATE, EDGE_KEY_HEADER, edge_purger)
+if EDGE_CACHE is None:
+    EDGE_CACHE = edge_purger is not None
+else:
+    EDGE_CACHE = EDGE_CACHE.lower() in ("1", "true", "yes")
+    if EDGE_CACHE and edge_purger is None:
+        print("Warning: EDGE_CACHE is on without EDGE_PURGE_URL or FASTLY_SERVICE_ID. "
+              "Cached pages can be stale for up to EDGE_S_MAXAGE + EDGE_STALE_WHILE_REVALIDATE seconds.")
+
+# Habits tracked alongside mood; override or add with HABITS='{"water": {"kind": "number", "goal": 8}}'
+HABITS = load_habits(os.getenv("HABITS"))
+HABIT_WINDOW_DAYS = int(os.getenv("HABIT_WINDOW_DAYS", "30"))
+HABIT_MAX_WINDOW_DAYS = int(os.getenv("HABIT_MAX_WINDOW_DAYS", "366"))
+
+# Background jobs for heavy reports (see jobs.py). The queue lives in the storage
+# backend; JOB_PROCESSES=1 runs reports in a process pool instead of threads.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_PROCESSES = os.getenv("JOB_PROCESSES", "").lower() in ("1", "true", "yes")
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "600"))
+# Longest a request may block waiting for a result with ?wait=
+JOB_MAX_WAIT = float(os.getenv("JOB_MAX_WAIT", "10"))
+
+# Idempotency-Key support for /submit (see idempotency.py): the first outcome for a
+# key is replayed to retries for IDEMPOTENCY_TTL seconds, and a duplicate arriving
+# while the original runs waits up to IDEMPOTENCY_WAIT seconds for it. The lease
+# must outlast a slow submit, Google Sheets call included.
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_WAIT = float(os.getenv("IDEMPOTENCY_WAIT", "15"))
+IDEMPOTENCY_LEASE = float(os.getenv("IDEMPOTENCY_LEASE", "30"))
+
+# Optional journal note on /submit, searchable with /search (see notes.py)
+NOTE_MAX_LENGTH = int(os.getenv("NOTE_MAX_LENGTH", "1000"))
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+SEARCH_MAX_PAGE_SIZE = int(os.getenv("SEARCH_MAX_PAGE_SIZE", "50"))
+
+# Debug profiling endpoints exist only when a token is configured
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN")
+
+# Per-route read routing. Dashboard and analytics reads may go to secondaries
+# with bounded staleness; writes, the duplicate check, reads shortly after a
+# client's own write and reads that fill a data-version-keyed cache stay on the primary. Override per endpoint with e.g.
+# READ_ROUTING='{"data": "nearest", "calendar_stats": "primary"}'.
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest
+}
+READ_ROUTING = {
+    "home": "secondaryPreferred",
+    "data": "secondaryPreferred",
+    "chart_series": "secondaryPreferred",
+    "calendar_stats": "secondaryPreferred",
+    "habits_dashboard": "secondaryPreferred",
+    "search_notes": "secondaryPreferred",
+    "dashboard_insights": "secondaryPreferred"
+}
+READ_ROUTING.update(json.loads(os.getenv("READ_ROUTING", "{}")))
+for endpoint, mode in READ_ROUTING.items():
+    if mode not in READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference {mode!r} for {endpoint} in READ_ROUTING")
+
+# MongoDB requires at least 90 seconds when a staleness bound is set
+READ_MAX_STALENESS = max(int(os.getenv("READ_MAX_STALENESS", "90")), 90)
+# Hedged reads only take effect on sharded clusters; other deployments ignore them
+HEDGED_READS = os.getenv("HEDGED_READS", "1").lower() in ("1", "true", "yes")
+# How long after a /submit the same client keeps reading from the primary
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", str(READ_MAX_STALENESS + 30)))
+
+# Optional group-commit mode: /submit calls arriving within a short window are
+# merged into one bulk_write. Only useful with threaded workers (gunicorn --threads).
+GROUP_COMMIT = os.getenv("GROUP_COMMIT", "").lower() in ("1", "true", "yes")
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "3"))
+GROUP_COMMIT_MAX_BATCH = int(os.getenv("GROUP_COMMIT_MAX_BATCH", "256"))
+GROUP_COMMIT_W = os.getenv("GROUP_COMMIT_W")
+# Longest a /submit waits for its batch before answering 503 (default: 3x the driver's
+# server selection timeout); an entry committed after that still gets its side effects
+GROUP_COMMIT_TIMEOUT = float(os.getenv("GROUP_COMMIT_TIMEOUT", "0"))
+
+group_committer = None
+if GROUP_COMMIT and collection is not None:
+    write_concern = None
+    if GROUP_COMMIT_W:
+        w = int(GROUP_COMMIT_W) if GROUP_COMMIT_W.isdigit() else GROUP_COMMIT_W
+        write_concern = WriteConcern(w=w)
+    group_committer = GroupCommitter(
+        collection,
+        window_ms=GROUP_COMMIT_WINDOW_MS,
+        max_batch=GROUP_COMMIT_MAX_BATCH,
+        write_concern=write_concern,
+        compact=COMPACT_SCHEMA,
+        timeout=GROUP_COMMIT_TIMEOUT or 3 * client.options.server_selection_timeout,
+        on_late_commit=lambda date_obj, mood: after_late_insert(date_obj, mood)
+    )
 
 def send_to_google_sheets(data):
     if not GOOGLE_SCRIPT_URL:
@@ -65,6 +286,22 @@ def fetch_google_sheets_data():
         print(f"Error fetching Google Sheets data: {str(e)}")
         return []
 
+def current_limiter():
+    return admission.get(request.endpoint) if has_request_context() else None
+
+def fetch_google_sheets_entries():
+    """Validated sheet entries in date order, [] if the sheet is unavailable"""
+    # Under load, skip the Apps Script call: serve the last synced rows, or
+    # let the caller fall back to MongoDB
+    limiter = current_limiter()
+    if limiter and limiter.under_pressure():
+        limiter.note_degraded()
+        return sheets_mirror.cached_entries() if sheets_mirror else []
+
+    if sheets_mirror:
+        return sheets_mirror.sync()
+    return entries_from_sheet_rows(fetch_google_sheets_data())
+
 HTML = """
 <!DOCTYPE html>
 <html lang="en">
@@ -288,6 +525,17 @@ HTML = """
       max-height: 300px !important;
     }
 
+    .range-select {
+      margin-left: 8px;
+      padding: 4px 8px;
+      font-size: 0.9rem;
+      font-family: inherit;
+      color: #ffffff;
+      background: rgba(255, 255, 255, 0.05);
+      border: 1px solid rgba(255, 255, 255, 0.1);
+      border-radius: 8px;
+    }
+
     .mood-grid {
       display: grid;
       grid-template-columns: repeat(auto-fit, minmax(100px, 1fr));
@@ -535,7 +783,13 @@ HTML = """
     <div class="glass-card">
       <div class="chart-title">
         <i class="fas fa-line-chart"></i>
-        30-Day Progress
+        Progress
+        <select id="progressRange" class="range-select">
+          <option value="30d">30 days</option>
+          <option value="90d">90 days</option>
+          <option value="1y">1 year</option>
+          <option value="all">All time</option>
+        </select>
       </div>
       <div class="chart-container">
         <canvas id="progressChart"></canvas>
@@ -594,15 +848,21 @@ HTML = """
   </div>
 
   <div class="success-popup" id="popup">
-    <i class="fas fa-check-circle"></i> Entry submitted successfully!
+    <i class="fas fa-check-circle"></i> <span id="popupText">Entry submitted successfully!</span>
   </div>
 
+  <script src="/outbox.js"></script>
+  <script>
+    window.__INITIAL_STATE__ = {{ initial_state|tojson }};
+  </script>
   <script>
     // Set today's date as default
     document.getElementById('date').valueAsDate = new Date();
     
     let progressChart = null;
     let moodChart = null;
+    let progressRange = '30d';
+    let currentState = null;
 
     const moodEmojis = {
       happy: '😊',
@@ -616,56 +876,13 @@ HTML = """
       sad: '#ff6b6b'
     };
 
-    function generateInsights(data) {
-      const insights = [];
-      const { logs, streak } = data;
-      
-      if (streak >= 7) {
-        insights.push({
-          icon: 'fas fa-fire',
-          text: `Amazing! You've maintained a ${streak}-day streak. Keep up the excellent work!`,
-          type: 'success'
-        });
-      }
-
-      const recentMoods = logs.slice(-7);
-      const happyCount = recentMoods.filter(entry => entry.mood === 'happy').length;
-      
-      if (happyCount >= 5) {
-        insights.push({
-          icon: 'fas fa-sun',
-          text: `You've been feeling great lately! ${happyCount} happy days in the last week.`,
-          type: 'positive'
-        });
-      } else if (happyCount <= 2) {
-        insights.push({
-          icon: 'fas fa-heart',
-          text: 'Remember to take care of yourself. Consider activities that bring you joy.',
-          type: 'care'
-        });
-      }
-
-      if (logs.length >= 30) {
-        const last30Days = logs.slice(-30);
-        const moodCounts = { happy: 0, neutral: 0, sad: 0 };
-        last30Days.forEach(entry => moodCounts[entry.mood]++);
-        
-        const dominantMood = Object.keys(moodCounts).reduce((a, b) => 
-          moodCounts[a] > moodCounts[b] ? a : b
-        );
-        
-        insights.push({
-          icon: 'fas fa-chart-pie',
-          text: `Over the last 30 days, your most common mood has been ${dominantMood}. ${moodEmojis[dominantMood]}`,
-          type: 'analysis'
-        });
-      }
-
-      return insights;
-    }
-
     function renderInsights(insights) {
       const container = document.getElementById('insightsContainer');
+
+      // Skip the DOM rebuild when nothing changed
+      const key = insights.map(insight => insight.text).join('|');
+      if (container.dataset.key === key) return;
+      container.dataset.key = key;
       
       if (insights.length === 0) {
         container.innerHTML = '<div class="insight-item"><div class="insight-icon"><i class="fas fa-info"></i></div><div>Keep tracking to unlock personalized insights!</div></div>';
@@ -685,6 +902,10 @@ HTML = """
     function renderRecentEntries(logs) {
       const container = document.getElementById('recentEntries');
       const recentLogs = logs.slice(-10).reverse();
+
+      const key = recentLogs.map(entry => entry.date + entry.mood).join('|');
+      if (container.dataset.key === key) return;
+      container.dataset.key = key;
       
       if (recentLogs.length === 0) {
         container.innerHTML = '<div style="text-align: center; color: #a0a0a0; padding: 20px;">No entries yet. Start tracking your mood!</div>';
@@ -721,30 +942,291 @@ HTML = """
       return 'neutral';
     }
 
+    // Ranges beyond 30 days come downsampled from the server instead of raw logs
+    async function loadProgressRange(range) {
+      try {
+        const response = await fetch(`/chart-series?range=${range}&points=120`);
+        const series = await response.json();
+        if (!progressChart || range !== progressRange) return;
+
+        const scoreMoods = { 1: 'sad', 2: 'neutral', 3: 'happy' };
+        const dataset = progressChart.data.datasets[0];
+        progressChart.data.labels = series.points.map(point => new Date(point.date).toLocaleDateString('en-US', { month: 'short', day: 'numeric', year: '2-digit' }));
+        dataset.data = series.points.map(point => point.score);
+        dataset.pointBackgroundColor = series.points.map(point => moodColors[scoreMoods[Math.round(point.score)]]);
+        dataset.pointRadius = series.points.length > 60 ? 2 : 6;
+        progressChart.update();
+      } catch (error) {
+        console.error('Error loading progress range:', error);
+      }
+    }
+
+    document.getElementById("progressRange").addEventListener("change", function () {
+      progressRange = this.value;
+      if (currentState) updateProgressChart(currentState);
+    });
+
+    // Reduce a full /data response to the same shape as the server-rendered initial state
+    function summarize(data) {
+      const counts = { happy: 0, neutral: 0, sad: 0 };
+      data.logs.forEach(entry => counts[entry.mood]++);
+
+      return {
+        streak: data.streak,
+        total: data.logs.length,
+        counts,
+        trend: calculateMoodTrend(data.logs),
+        logs: data.logs.slice(-30)
+      };
+    }
+
+    // Insights are evaluated on the server (see insights.py) and cached per data version
+    async function fetchInsights() {
+      const response = await fetch('/insights');
+      const body = await response.json();
+      return body.insights || [];
+    }
+
     async function updateUI() {
       try {
-        const response = await fetch('/data');
-        const data = await response.json();
-        
+        const [data, insights] = await Promise.all([
+          fetch('/data?stream=1').then(response => response.json()),
+          fetchInsights().catch(() => currentState ? currentState.insights : [])
+        ]);
+        render({ ...summarize(data), insights });
+      } catch (error) {
+        console.error('Error updating UI:', error);
+      }
+    }
+
+    async function refreshInsights() {
+      try {
+        const insights = await fetchInsights();
+        if (currentState) {
+          currentState = { ...currentState, insights };
+          renderInsights(insights);
+        }
+      } catch (error) {
+        console.error('Error loading insights:', error);
+      }
+    }
+
+    // Apply a submitted entry to the current state before the server confirms it.
+    // Returns null when the date is already shown, since the server will reject it.
+    function applyEntry(state, entry) {
+      if (state.logs.some(log => log.date === entry.date)) return null;
+
+      const logs = [...state.logs, entry].sort((a, b) => a.date.localeCompare(b.date));
+      const newest = state.logs.length ? state.logs[state.logs.length - 1].date : null;
+      const isNewest = logs[logs.length - 1] === entry;
+
+      let streak = state.streak;
+      if (!newest) {
+        streak = 1;
+      } else if (isNewest) {
+        const gap = (new Date(entry.date) - new Date(newest)) / 86400000;
+        streak = gap === 1 ? state.streak + 1 : 1;
+      }
+
+      const counts = { ...state.counts };
+      if (entry.mood in counts) counts[entry.mood]++;
+
+      return {
+        ...state,
+        streak,
+        total: state.total + 1,
+        counts,
+        trend: calculateMoodTrend(logs),
+        logs: logs.slice(-30),
+        // A backdated entry can join streaks we cannot see from 30 days of logs
+        exact: isNewest
+      };
+    }
+
+    function createProgressChart() {
+      const progressCtx = document.getElementById("progressChart").getContext('2d');
+      
+      return new Chart(progressCtx, {
+        type: "line",
+        data: {
+          labels: [],
+          datasets: [{
+            label: "Mood Score",
+            data: [],
+            borderColor: "#00ff88",
+            backgroundColor: "rgba(0,255,136,0.1)",
+            tension: 0.4,
+            fill: true,
+            pointBackgroundColor: [],
+            pointBorderColor: "#ffffff",
+            pointBorderWidth: 2,
+            pointRadius: 6,
+            pointHoverRadius: 8
+          }]
+        },
+        options: {
+          responsive: true,
+          maintainAspectRatio: false,
+          plugins: {
+            legend: { display: false },
+            tooltip: {
+              backgroundColor: 'rgba(0, 0, 0, 0.8)',
+              titleColor: '#ffffff',
+              bodyColor: '#ffffff',
+              borderColor: '#00ff88',
+              borderWidth: 1,
+              callbacks: {
+                label: function(context) {
+                  const moodNames = { 1: 'Sad', 2: 'Neutral', 3: 'Happy' };
+                  return `Mood: ${moodNames[Math.round(context.parsed.y)]}`;
+                }
+              }
+            }
+          },
+          scales: {
+            x: {
+              ticks: { color: '#a0a0a0', maxTicksLimit: 8 },
+              grid: { color: 'rgba(255, 255, 255, 0.1)' }
+            },
+            y: {
+              min: 0.5,
+              max: 3.5,
+              ticks: { 
+                color: '#a0a0a0',
+                callback: function(value) {
+                  const labels = { 1: '😞', 2: '😐', 3: '😊' };
+                  return labels[value] || '';
+                }
+              },
+              grid: { color: 'rgba(255, 255, 255, 0.1)' }
+            }
+          },
+          elements: {
+            point: {
+              hoverBorderWidth: 3
+            }
+          }
+        }
+      });
+    }
+
+    function createMoodChart() {
+      const moodCtx = document.getElementById("moodChart").getContext('2d');
+
+      return new Chart(moodCtx, {
+        type: "doughnut",
+        data: {
+          labels: ["😊 Happy", "😐 Neutral", "😞 Sad"],
+          datasets: [{
+            data: [0, 0, 0],
+            backgroundColor: ["#00ff88", "#ffdd00", "#ff6b6b"],
+            borderWidth: 0,
+            cutout: '60%'
+          }]
+        },
+        options: {
+          responsive: true,
+          maintainAspectRatio: false,
+          plugins: {
+            legend: {
+              position: 'bottom',
+              labels: {
+                color: '#ffffff',
+                padding: 20,
+                usePointStyle: true,
+                font: { size: 14 }
+              }
+            },
+            tooltip: {
+              backgroundColor: 'rgba(0, 0, 0, 0.8)',
+              titleColor: '#ffffff',
+              bodyColor: '#ffffff',
+              borderColor: '#00ff88',
+              borderWidth: 1,
+              callbacks: {
+                label: function(context) {
+                  const total = context.dataset.data.reduce((a, b) => a + b, 0);
+                  const percentage = Math.round((context.parsed / total) * 100);
+                  return `${context.label}: ${context.parsed} (${percentage}%)`;
+                }
+              }
+            }
+          }
+        }
+      });
+    }
+
+    function updateProgressChart(state) {
+      if (!progressChart) return;
+      if (progressRange !== '30d') {
+        loadProgressRange(progressRange);
+        return;
+      }
+
+      const last30Days = state.logs;
+      const dataset = progressChart.data.datasets[0];
+      progressChart.data.labels = last30Days.map(entry => new Date(entry.date).toLocaleDateString('en-US', { month: 'short', day: 'numeric' }));
+      dataset.data = last30Days.map(entry => ({ sad: 1, neutral: 2, happy: 3 })[entry.mood]);
+      dataset.pointBackgroundColor = last30Days.map(entry => moodColors[entry.mood]);
+      dataset.pointRadius = 6;
+      progressChart.update();
+    }
+
+    function updateMoodChart(state) {
+      if (!moodChart) return;
+      moodChart.data.datasets[0].data = [state.counts.happy, state.counts.neutral, state.counts.sad];
+      moodChart.update();
+    }
+
+    // Charts below the fold are only built once they scroll into view
+    function whenVisible(element, callback) {
+      if (!('IntersectionObserver' in window)) {
+        callback();
+        return;
+      }
+      const observer = new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) {
+          observer.disconnect();
+          callback();
+        }
+      }, { rootMargin: '200px' });
+      observer.observe(element);
+    }
+
+    whenVisible(document.getElementById("progressChart"), () => {
+      progressChart = createProgressChart();
+      if (currentState) updateProgressChart(currentState);
+    });
+
+    whenVisible(document.getElementById("moodChart"), () => {
+      moodChart = createMoodChart();
+      if (currentState) updateMoodChart(currentState);
+    });
+
+    function render(state) {
+      currentState = state;
+      try {
         // Update statistics
-        document.getElementById("streakCount").textContent = data.streak;
-        document.getElementById("totalEntries").textContent = data.logs.length;
+        document.getElementById("streakCount").textContent = state.streak;
+        document.getElementById("totalEntries").textContent = state.total;
         
-        const moodCounts = { happy: 0, neutral: 0, sad: 0 };
-        data.logs.forEach(entry => moodCounts[entry.mood]++);
+        const moodCounts = state.counts;
         
         document.getElementById("happyDays").textContent = moodCounts.happy;
         
-        // Calculate and display mood trend
-        const trend = calculateMoodTrend(data.logs);
+        // Display mood trend
+        const trend = state.trend;
         const trendElement = document.getElementById("avgMood");
-        trendElement.innerHTML = `<span class="trend-indicator trend-${trend}">
-          <i class="fas fa-${trend === 'up' ? 'arrow-up' : trend === 'down' ? 'arrow-down' : 'minus'}"></i>
-          ${trend === 'up' ? 'Improving' : trend === 'down' ? 'Declining' : 'Stable'}
-        </span>`;
+        if (trendElement.dataset.trend !== trend) {
+          trendElement.dataset.trend = trend;
+          trendElement.innerHTML = `<span class="trend-indicator trend-${trend}">
+            <i class="fas fa-${trend === 'up' ? 'arrow-up' : trend === 'down' ? 'arrow-down' : 'minus'}"></i>
+            ${trend === 'up' ? 'Improving' : trend === 'down' ? 'Declining' : 'Stable'}
+          </span>`;
+        }
 
         // Update mood distribution
-        const total = data.logs.length;
+        const total = state.total;
         if (total > 0) {
           document.getElementById("happyCount").textContent = moodCounts.happy;
           document.getElementById("neutralCount").textContent = moodCounts.neutral;
@@ -755,62 +1237,59 @@ HTML = """
           document.getElementById("sadPercent").textContent = `${Math.round((moodCounts.sad / total) * 100)}%`;
         }
 
-        // Destroy existing charts
-        if (progressChart) progressChart.destroy();
-        if (moodChart) moodChart.destroy();
-
-        // Create progress chart
-        const last30Days = data.logs.slice(-30);
-        const progressCtx = document.getElementById("progressChart").getContext('2d');
-        
-        progressChart = new Chart(progressCtx, {
-          type: "line",
-          data: {
-            labels: last30Days.map(entry => new Date(entry.date).toLocaleDateString('en-US', { month: 'short', day: 'numeric' })),
-            datasets: [{
-              label: "Mood Score",
-              data: last30Days.map(entry => ({ sad: 1, neutral: 2, happy: 3 })[entry.mood]),
-              borderColor: "#00ff88",
-              backgroundColor: "rgba(0,255,136,0.1)",
-              tension: 0.4,
-              fill: true,
-              pointBackgroundColor: last30Days.map(entry => moodColors[entry.mood]),
-              pointBorderColor: "#ffffff",
-              pointBorderWidth: 2,
-              pointRadius: 6,
-              pointHoverRadius: 8
-            }]
-          },
-          options: {
-            responsive: true,
-            maintainAspectRatio: false,
-            plugins: {
-              legend: { display: false },
-              tooltip: {
-                backgroundColor: 'rgba(0, 0, 0, 0.8)',
-                titleColor: '#ffffff',
-                bodyColor: '#ffffff',
-                borderColor: '#00ff88',
-                borderWidth: 1,
-                callbacks: {
-                  label: function(context) {
-                    const total = context.dataset.data.reduce((a, b) => a + b, 0);
-                    const percentage = Math.round((context.parsed / total) * 100);
-                    return `${context.label}: ${context.parsed} (${percentage}%)`;
-                  }
-                }
-              }
-            }
-          }
-        });
+        // Update charts in place
+        updateProgressChart(state);
+        updateMoodChart(state);
 
         // Render recent entries and insights
-        renderRecentEntries(data.logs);
-        renderInsights(generateInsights(data));
+        renderRecentEntries(state.logs);
+        renderInsights(state.insights || []);
 
       } catch (error) {
-        console.error('Error updating UI:', error);
+        console.error('Error rendering UI:', error);
+      }
+    }
+
+    function showPopup(text) {
+      const popup = document.getElementById("popup");
+      document.getElementById("popupText").textContent = text;
+      popup.classList.add("show");
+      setTimeout(() => {
+        popup.classList.remove("show");
+      }, 3000);
+    }
+
+    // Replay queued offline entries: via Background Sync when the browser has
+    // it, otherwise from the page whenever the connection comes back
+    async function requestOutboxSync() {
+      if ('serviceWorker' in navigator && navigator.serviceWorker.controller) {
+        const registration = await navigator.serviceWorker.ready;
+        if ('sync' in registration) {
+          await registration.sync.register('submit-queue');
+          return;
+        }
       }
+      if (navigator.onLine) flushFromPage();
+    }
+
+    async function flushFromPage() {
+      try {
+        if (await flushOutbox()) updateUI();
+      } catch (error) {
+        console.error('Error replaying queued entries:', error);
+      }
+    }
+
+    if ('serviceWorker' in navigator) {
+      navigator.serviceWorker.register('/sw.js').catch(error => console.error('Service worker registration failed:', error));
+      navigator.serviceWorker.addEventListener('message', event => {
+        if (event.data && event.data.type === 'outbox-flushed') updateUI();
+      });
+    }
+
+    if ('indexedDB' in window) {
+      window.addEventListener('online', () => requestOutboxSync());
+      if (navigator.onLine) requestOutboxSync();
     }
 
     document.getElementById("entryForm").addEventListener("submit", async function (e) {
@@ -830,6 +1309,11 @@ HTML = """
       submitText.style.display = "none";
       submitLoading.style.display = "inline-block";
 
+      // Show the entry right away and roll back if the server disagrees
+      const previousState = currentState;
+      const optimisticState = previousState ? applyEntry(previousState, { date, mood }) : null;
+      if (optimisticState) render(optimisticState);
+
       try {
         const response = await fetch('/submit', {
           method: 'POST',
@@ -840,21 +1324,40 @@ HTML = """
         });
 
         const result = await response.json();
+
+        if (!response.ok) {
+          throw new Error(result.error || `HTTP ${response.status}`);
+        }
         
         // Show success popup
-        const popup = document.getElementById("popup");
-        popup.classList.add("show");
-        setTimeout(() => {
-          popup.classList.remove("show");
-        }, 3000);
+        showPopup("Entry submitted successfully!");
         
         // Reset form
         document.getElementById("mood").value = "";
         
-        // Update UI
-        await updateUI();
+        // Reconcile: a 201 confirms the optimistic state; anything else
+        // (e.g. an existing entry for that date) needs the server's view
+        if (response.status !== 201 || !optimisticState || !optimisticState.exact) {
+          if (optimisticState && response.status !== 201) render(previousState);
+          updateUI();
+        } else {
+          refreshInsights();
+        }
         
       } catch (error) {
+        // fetch rejects with a TypeError only when the request never got an answer
+        if (error instanceof TypeError && 'indexedDB' in window) {
+          try {
+            await queueSubmission({ date, mood });
+            requestOutboxSync();
+            document.getElementById("mood").value = "";
+            showPopup("You're offline. Entry saved and will sync automatically.");
+            return;
+          } catch (queueError) {
+            console.error('Error queuing entry:', queueError);
+          }
+        }
+        if (optimisticState) render(previousState);
         console.error('Error submitting entry:', error);
         alert('Error submitting entry. Please try again.');
       } finally {
@@ -864,48 +1367,533 @@ HTML = """
       }
     });
 
-    // Initialize UI on page load
-    updateUI();
+    // Paint from the server-rendered state, then sync with /data once the page is idle
+    if (window.__INITIAL_STATE__) {
+      render(window.__INITIAL_STATE__);
+      (window.requestIdleCallback || setTimeout)(() => updateUI());
+    } else {
+      updateUI();
+    }
   </script>
 </body>
 </html>
 """
 
-def calculate_streak(entries):
-    if not entries:
-        return 0
-    
-    # Sort entries by date (newest first)
-    entries.sort(key=lambda x: datetime.strptime(x['date'], '%Y-%m-%d'), reverse=True)
-    
-    if len(entries) == 1:
-        return 1
-    
-    streak = 1
-    current_date = datetime.strptime(entries[0]['date'], '%Y-%m-%d')
-    
-    for i in range(1, len(entries)):
-        previous_date = datetime.strptime(entries[i]['date'], '%Y-%m-%d')
-        diff = (current_date - previous_date).days
-        
-        if diff == 1:
-            streak += 1
-            current_date = previous_date
-        elif diff == 0:
-            # Same date, skip
-            continue
+OUTBOX_JS = """
+// IndexedDB outbox for submissions made while offline, shared by the page and
+// the service worker. Keyed by date, so re-queuing a date replaces it.
+const OUTBOX_DB = 'streakflow';
+const OUTBOX_STORE = 'outbox';
+
+function openOutbox() {
+  return new Promise((resolve, reject) => {
+    const request = indexedDB.open(OUTBOX_DB, 1);
+    request.onupgradeneeded = () => request.result.createObjectStore(OUTBOX_STORE, { keyPath: 'date' });
+    request.onsuccess = () => resolve(request.result);
+    request.onerror = () => reject(request.error);
+  });
+}
+
+function outboxOp(mode, op) {
+  return openOutbox().then(db => new Promise((resolve, reject) => {
+    const tx = db.transaction(OUTBOX_STORE, mode);
+    const request = op(tx.objectStore(OUTBOX_STORE));
+    tx.oncomplete = () => resolve(request ? request.result : undefined);
+    tx.onerror = () => reject(tx.error);
+  }));
+}
+
+function queueSubmission(entry) {
+  return outboxOp('readwrite', store => store.put({ date: entry.date, mood: entry.mood, queuedAt: Date.now() }));
+}
+
+// Replays queued submissions in date order. The server deduplicates by date,
+// so an entry that did reach it before a dropped response just comes back 200.
+async function flushOutbox() {
+  const queued = await outboxOp('readonly', store => store.getAll());
+  let sent = 0;
+  for (const entry of queued) {
+    const response = await fetch('/submit', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ date: entry.date, mood: entry.mood })
+    });
+    // Server errors stay queued for the next attempt; rejected input is dropped
+    if (response.status >= 500) throw new Error(`HTTP ${response.status}`);
+    await outboxOp('readwrite', store => store.delete(entry.date));
+    sent++;
+  }
+  return sent;
+}
+"""
+
+SERVICE_WORKER_JS = """
+importScripts('/outbox.js');
+
+// Bump when the shell changes so old caches are dropped on activate
+const CACHE = 'streakflow-v1';
+const SHELL = [
+  '/',
+  '/outbox.js',
+  'https://cdnjs.cloudflare.com/ajax/libs/Chart.js/4.4.0/chart.min.js',
+  'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css'
+];
+
+self.addEventListener('install', event => {
+  event.waitUntil(
+    caches.open(CACHE)
+      .then(cache => Promise.all(SHELL.map(url =>
+        fetch(url, { mode: 'cors' }).then(response => response.ok && cache.put(url, response)).catch(() => null)
+      )))
+      .then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener('activate', event => {
+  event.waitUntil(
+    caches.keys()
+      .then(keys => Promise.all(keys.filter(key => key !== CACHE).map(key => caches.delete(key))))
+      .then(() => self.clients.claim())
+  );
+});
+
+// Shell: answer from cache at once and refresh it in the background
+function staleWhileRevalidate(request, key) {
+  return caches.open(CACHE).then(cache => cache.match(key).then(cached => {
+    const network = fetch(request).then(response => {
+      if (response.ok) cache.put(key, response.clone());
+      return response;
+    });
+    if (cached) {
+      network.catch(() => null);
+      return cached;
+    }
+    return network;
+  }));
+}
+
+// Data: always try the network, fall back to the last known response offline
+function networkFirst(request, key) {
+  return caches.open(CACHE).then(cache => fetch(request)
+    .then(response => {
+      if (response.ok) cache.put(key, response.clone());
+      return response;
+    })
+    .catch(() => cache.match(key).then(cached => cached || Response.error())));
+}
+
+self.addEventListener('fetch', event => {
+  const request = event.request;
+  if (request.method !== 'GET') return;
+
+  const url = new URL(request.url);
+  const sameOrigin = url.origin === self.location.origin;
+
+  if (sameOrigin && url.pathname === '/data') {
+    event.respondWith(networkFirst(request, '/data'));
+  } else if (sameOrigin && (url.pathname === '/' || url.pathname === '/outbox.js')) {
+    event.respondWith(staleWhileRevalidate(request, url.pathname));
+  } else if (SHELL.includes(request.url)) {
+    event.respondWith(staleWhileRevalidate(request, request.url));
+  }
+});
+
+self.addEventListener('sync', event => {
+  if (event.tag === 'submit-queue') {
+    event.waitUntil(flushOutbox().then(sent => {
+      if (!sent) return;
+      return self.clients.matchAll().then(clients =>
+        clients.forEach(client => client.postMessage({ type: 'outbox-flushed', sent }))
+      );
+    }));
+  }
+});
+"""
+
+_read_collections = {}
+
+def read_preference_for(mode):
+    if mode == "primary":
+        return Primary()
+    options = {"max_staleness": READ_MAX_STALENESS}
+    if HEDGED_READS:
+        options["hedge"] = {"enabled": True}
+    return READ_PREFERENCES[mode](**options)
+
+def recently_wrote():
+    try:
+        return time.time() - float(request.cookies.get("sf_last_write", 0)) < READ_YOUR_WRITES_SECONDS
+    except ValueError:
+        return False
+
+def pin_reads_to_primary():
+    """Send the rest of this request's reads to the primary.
+
+    Called before filling a cache keyed on the data version: the version is
+    read from the primary, so the data cached under it must be as well, or a
+    lagging secondary's copy would be kept under the new version until the
+    next write.
+    """
+    if has_request_context():
+        g.read_primary = True
+
+def reads(target=None):
+    """`target` (default `collection`) with the read preference routed for the current request"""
+    if target is None:
+        target = collection
+    mode = "primary"
+    if has_request_context():
+        mode = READ_ROUTING.get(request.endpoint, "primary")
+        if mode != "primary" and (recently_wrote() or g.get("read_primary")):
+            mode = "primary"
+
+    key = (target.name, mode)
+    routed = _read_collections.get(key)
+    if routed is None:
+        routed = target.with_options(read_preference=read_preference_for(mode))
+        _read_collections[key] = routed
+    return routed
+
+if STORAGE_BACKEND == "mongo":
+    store = MongoStore(
+        collection,
+        meta,
+        archive_tier,
+        compact=COMPACT_SCHEMA,
+        group_committer=group_committer,
+        reads=reads,
+        batch_size=DATA_STREAM_CHUNK,
+        metrics=db["metrics"],
+        streaks=db["streaks"],
+        notes=db["notes"],
+        hash_tree=db["hash_tree"]
+    )
+elif STORAGE_BACKEND == "sqlite":
+    store = SQLiteStore(SQLITE_PATH)
+else:
+    store = MemoryStore()
+
+if STORAGE_BACKEND == "mongo":
+    job_queue = MongoJobQueue(db["jobs"])
+elif STORAGE_BACKEND == "sqlite":
+    job_queue = SQLiteJobQueue(SQLITE_PATH)
+else:
+    job_queue = MemoryJobQueue()
+
+if STORAGE_BACKEND == "mongo":
+    idempotency_store = MongoIdempotencyStore(db["idempotency"])
+elif STORAGE_BACKEND == "sqlite":
+    idempotency_store = SQLiteIdempotencyStore(SQLITE_PATH)
+else:
+    idempotency_store = MemoryIdempotencyStore()
+idempotency = IdempotencyCache(idempotency_store, IDEMPOTENCY_TTL, IDEMPOTENCY_LEASE, IDEMPOTENCY_WAIT)
+
+entry_snapshot = SnapshotEntries(store, BINARY_SNAPSHOT_PATH, BINARY_SNAPSHOT_INTERVAL or None) if BINARY_SNAPSHOT_PATH else None
+
+def scan_entries():
+    """Every stored entry in day order, from the binary snapshot when there is one"""
+    if entry_snapshot is not None:
+        # The snapshot keeps the years changed since it was written per data version
+        pin_reads_to_primary()
+        return entry_snapshot.scan()
+    return store.scan()
+
+# The mood entries plus every habit other than mood (which mirrors the entries)
+STREAK_SERIES = ["mood"] + [habit for habit in HABITS if habit != "mood"]
+
+def streak_history(series):
+    """Qualifying epoch-days for a series in ascending order, for (re)building its streak state"""
+    if series == "mood":
+        return (entry_day(doc) for doc in scan_entries())
+    definition = HABITS[series]
+    return (
+        day for day, habit, value in store.scan_metrics()
+        if habit == series and counts_towards_streak(definition, value)
+    )
+
+streak_tracker = StreakTracker(
+    store,
+    streak_history,
+    default_timezone=STREAK_TIMEZONE,
+    on_change=lambda: streaks_changed(),
+    sweep_interval=STREAK_SWEEP_INTERVAL or None
+)
+
+job_runner = JobRunner(
+    job_queue,
+    {kind: run for kind, (_, run) in REPORTS.items()},
+    load_input=lambda: load_entries(),
+    workers=JOB_WORKERS,
+    use_processes=JOB_PROCESSES,
+    result_ttl=JOB_RESULT_TTL
+)
+
+def get_data_version():
+    return store.data_version()
+
+def bump_data_version():
+    return store.bump_data_version()
+
+def streaks_changed():
+    """A sweep or timezone change altered a visible streak"""
+    bump_data_version()
+    edge_cache.purge(["streak"])
+
+def after_insert(date_obj, mood):
+    """Keep derived data in step with a newly inserted entry"""
+    if CALENDAR_INDEX and calendar_store is not None:
+        try:
+            calendar_store.record(date_obj, mood)
+        except Exception as e:
+            print(f"Error updating calendar index: {str(e)}")
+
+    try:
+        streak_tracker.record("mood", to_epoch_day(date_obj))
+    except Exception as e:
+        print(f"Error updating streak state: {str(e)}")
+
+    try:
+        record_entry(store, date_obj.strftime("%Y-%m-%d"), mood)
+    except Exception as e:
+        print(f"Error updating hash tree: {str(e)}")
+
+    # Mood is also one of the habits, so it shows up in the same window scan
+    if mood in MOOD_CODES and "mood" in HABITS:
+        try:
+            store.set_metric("mood", date_obj, MOOD_CODES[mood])
+        except Exception as e:
+            print(f"Error recording mood habit: {str(e)}")
+
+    version = bump_data_version()
+
+    # Appending the newest entry updates the insight aggregates in place
+    insight_engine.add(date_obj.strftime("%Y-%m-%d"), mood, version - 1, version)
+
+    # Lets this client read its own write from the primary for a while
+    if has_request_context():
+        g.wrote = True
+
+def after_late_insert(date_obj, mood):
+    """What /submit does after a grouped write that committed once its request had given up"""
+    after_insert(date_obj, mood)
+    edge_cache.purge(["entries"])
+    send_to_google_sheets({"type": "mydata", "date": date_obj.strftime("%Y-%m-%d"), "mood": mood})
+
+def calculate_mood_trend(entries):
+    """Server-side port of calculateMoodTrend in the page script"""
+    if len(entries) < 7:
+        return "neutral"
+
+    recent = entries[-7:]
+    earlier = entries[-14:-7]
+
+    if not earlier:
+        return "neutral"
+
+    recent_avg = sum(MOOD_CODES.get(entry["mood"], 2) for entry in recent) / len(recent)
+    earlier_avg = sum(MOOD_CODES.get(entry["mood"], 2) for entry in earlier) / len(earlier)
+
+    if recent_avg > earlier_avg + 0.2:
+        return "up"
+    if recent_avg < earlier_avg - 0.2:
+        return "down"
+    return "neutral"
+
+insight_engine = InsightEngine()
+_insights_lock = threading.Lock()
+_insights_cache = {"key": None, "insights": None}
+
+def get_insights(entries=None, version=None, streak=None):
+    """(insights, streak) for the current data version; rules read only the engine's aggregates
+
+    Without `streak`, the streak is the engine's own, taken from the same
+    entries as the aggregates.
+    """
+    if version is None:
+        version = get_data_version()
+    # Rebuilt on a version the engine did not follow, and after a TTL for sheet edits
+    if insight_engine.version != version or time.monotonic() - insight_engine.built_at > SNAPSHOT_TTL:
+        pin_reads_to_primary()
+        insight_engine.rebuild(load_entries() if entries is None else entries, version, time.monotonic())
+    if streak is None:
+        streak = insight_engine.streak(local_today(streak_tracker.timezone()))
+
+    key = (insight_engine.version, insight_engine.built_at, streak)
+    with _insights_lock:
+        if _insights_cache["key"] == key:
+            return _insights_cache["insights"], streak
+    insights = insight_engine.evaluate(streak)
+    with _insights_lock:
+        _insights_cache.update(key=key, insights=insights)
+    return insights, streak
+
+def build_snapshot(entries, streak):
+    """Dashboard state in the shape the page script renders"""
+    counts = {mood: 0 for mood in MOOD_CODES}
+    for entry in entries:
+        if entry["mood"] in counts:
+            counts[entry["mood"]] += 1
+
+    return {
+        "streak": streak,
+        "total": len(entries),
+        "counts": counts,
+        "trend": calculate_mood_trend(entries),
+        "logs": entries[-30:]
+    }
+
+_snapshot_lock = threading.Lock()
+_snapshot_cache = {"version": None, "built_at": 0, "state": None}
+
+def get_snapshot():
+    version = get_data_version()
+    with _snapshot_lock:
+        cached = dict(_snapshot_cache)
+    if cached["version"] == version and time.monotonic() - cached["built_at"] < SNAPSHOT_TTL:
+        return cached["state"]
+
+    # A slightly stale first paint beats queuing behind a rebuild; the page syncs anyway
+    limiter = current_limiter()
+    if cached["state"] is not None and limiter and limiter.under_pressure():
+        limiter.note_degraded()
+        return cached["state"]
+
+    pin_reads_to_primary()
+    entries, streak = load_entries_and_streak()
+    state = build_snapshot(entries, streak)
+    state["insights"], _ = get_insights(entries, version, streak)
+    state["version"] = version
+    with _snapshot_lock:
+        _snapshot_cache.update(version=version, built_at=time.monotonic(), state=state)
+    return state
+
+@app.before_request
+def admit_request():
+    limiter = current_limiter()
+    if limiter is None:
+        return None
+
+    if not limiter.acquire():
+        response = jsonify({"error": "Server is busy, please retry shortly"})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(admission.retry_after)
+        return response
+    g.admission = limiter
+
+@app.after_request
+def schedule_admission_release(response):
+    # Streamed bodies are generated after the request context is torn down,
+    # so hold their slot until the body has been sent
+    if response.is_streamed:
+        limiter = g.pop("admission", None)
+        if limiter:
+            response.call_on_close(limiter.release)
+    return response
+
+@app.teardown_request
+def release_admission(exc):
+    limiter = g.pop("admission", None)
+    if limiter:
+        limiter.release()
+
+@app.route("/metrics")
+def metrics():
+    return Response(admission.prometheus(), mimetype="text/plain; version=0.0.4")
+
+@app.after_request
+def remember_write(response):
+    if g.get("wrote"):
+        response.set_cookie(
+            "sf_last_write", str(time.time()),
+            max_age=READ_YOUR_WRITES_SECONDS, httponly=True, samesite="Lax"
+        )
+    return response
+
+@app.after_request
+def finish_edge_response(response):
+    # Responses to a client's own write set a cookie and stay uncached; so do reads
+    # from a client that just wrote, which an edge copy from before the purge could miss
+    keys = g.get("edge_keys")
+    if EDGE_CACHE and keys:
+        if g.get("wrote") or recently_wrote():
+            edge_cache.mark_private(response)
         else:
-            # Gap in streak
-            break
-    
-    return streak
+            edge_cache.mark(response, keys)
+    if COMPRESS_MIN_SIZE:
+        compress_response(response, request.accept_encodings, COMPRESS_MIN_SIZE)
+    return response
+
+_home_template = None
+
+@app.route("/sw.js")
+def service_worker():
+    response = Response(SERVICE_WORKER_JS, mimetype="application/javascript")
+    # Browsers must revalidate the worker script to notice new versions
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+@app.route("/outbox.js")
+def outbox_script():
+    return Response(OUTBOX_JS, mimetype="application/javascript")
 
 @app.route("/")
 def home():
-    return render_template_string(HTML)
+    global _home_template
+    if _home_template is None:
+        _home_template = app.jinja_env.from_string(HTML)
+
+    try:
+        initial_state = get_snapshot()
+        g.edge_keys = ("home", "entries", "streak")
+    except Exception as e:
+        # The page still works without it; it just fetches /data itself
+        print(f"Error building initial state: {str(e)}")
+        initial_state = None
+
+    return _home_template.render(initial_state=initial_state)
 
 @app.route("/submit", methods=["POST"])
 def submit_entry():
+    key = request.headers.get("Idempotency-Key")
+    if key is None:
+        return save_submission()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return jsonify({"error": f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters"}), 400
+
+    try:
+        outcome, stored = idempotency.begin(key, request_fingerprint(request.method, request.path, request.get_data()))
+    except Exception as e:
+        # Without the key store, running the request beats refusing it
+        print(f"Error checking idempotency key: {str(e)}")
+        return save_submission()
+
+    if outcome == "mismatch":
+        return jsonify({"error": "Idempotency-Key was already used for a different request"}), 422
+    if outcome == "busy":
+        response = jsonify({"error": "A request with this Idempotency-Key is still in progress"})
+        response.status_code = 409
+        response.headers["Retry-After"] = str(admission.retry_after)
+        return response
+    if outcome == "replay":
+        response = Response(stored["body"], status=stored["status"], mimetype=stored["mimetype"])
+        response.headers["Idempotent-Replayed"] = "true"
+        # The original response (and its cookie) may never have reached the client
+        if stored["status"] == 201:
+            g.wrote = True
+        return response
+
+    try:
+        response = app.make_response(save_submission())
+    except Exception:
+        idempotency.release(key)
+        raise
+    try:
+        idempotency.complete(key, response.status_code, response.get_data(as_text=True), response.mimetype)
+    except Exception as e:
+        print(f"Error saving idempotent response: {str(e)}")
+    return response
+
+def save_submission():
     try:
         data = request.get_json()
         
@@ -924,14 +1912,34 @@ def submit_entry():
         except ValueError:
             return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
 
-        # Check for duplicate entry for the same date in MongoDB
-        existing_entry = collection.find_one({"date": date_obj})
-        if existing_entry:
-            return jsonify({"message": "Entry already exists for this date"}), 200
+        try:
+            note = parse_note(data.get("note"), NOTE_MAX_LENGTH)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        # Insert new entry to MongoDB
-        collection.insert_one({"date": date_obj, "mood": mood})
-        mongodb_msg = "Entry saved to MongoDB"
+        # Duplicate check and insert in one step; the first entry for a day wins
+        try:
+            inserted = store.upsert(date_obj, mood)
+        except GroupCommitTimeout as e:
+            # The entry may still be saved; a retry then finds it as an existing entry
+            response = jsonify({"error": f"Write not confirmed in time: {str(e)}"})
+            response.status_code = 503
+            response.headers["Retry-After"] = str(admission.retry_after)
+            return response
+        if not inserted:
+            return jsonify({"message": "Entry already exists for this date"}), 200
+        mongodb_msg = f"Entry saved to {store.label}"
+
+        after_insert(date_obj, mood)
+        # Notes are stored apart from the entry, so /data never carries them
+        if note:
+            try:
+                store.set_note(date_obj, note)
+            except Exception as e:
+                print(f"Error saving note: {str(e)}")
+                mongodb_msg += f" (note not saved: {str(e)})"
+        # Every cached page showing entries is now stale, and nothing else is
+        edge_cache.purge(["entries"])
 
         # Send to Google Sheets
         sheets_data = {
@@ -954,333 +1962,401 @@ def submit_entry():
     except Exception as e:
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
+def load_entries(sheets_entries=None):
+    """Entries in ascending date order, from Google Sheets if available else the storage backend"""
+    # Try to fetch data from Google Sheets first
+    if sheets_entries is None:
+        sheets_entries = fetch_google_sheets_entries()
+    
+    if sheets_entries:
+        # Use Google Sheets data for calculations
+        return sheets_entries
+    
+    else:
+        # Fallback to the storage backend if Google Sheets is not available;
+        # scan() is already in date order with one entry per day
+        return [decode_entry(doc) for doc in scan_entries()]
+
+def sheet_streak(entries):
+    """Mood streak of sheet entries, judged in the streak timezone like the stored streak state"""
+    run, _, last_day = runs_from_days(to_epoch_day(parse_date_str(entry["date"])) for entry in entries)
+    return evaluate({"run": run, "last_day": last_day}, local_today(streak_tracker.timezone()))
+
+def load_entries_and_streak(sheets_entries=None):
+    """(entries, mood streak), both from the same source so the logs and the streak agree"""
+    if sheets_entries is None:
+        sheets_entries = fetch_google_sheets_entries()
+    if sheets_entries:
+        return sheets_entries, sheet_streak(sheets_entries)
+    # Kept up to date on every write and expired at local midnight, so this is a single read
+    return load_entries(sheets_entries), streak_tracker.get("mood")["streak"]
+
+def stream_data_json(docs, streak):
+    """Encode /data chunk by chunk; the streak comes from the streak state"""
+    yield '{"logs":['
+    chunk = []
+    first = True
+    for doc in docs:
+        chunk.append(json.dumps(decode_entry(doc), separators=(",", ":")))
+        if len(chunk) >= DATA_STREAM_CHUNK:
+            yield ("" if first else ",") + ",".join(chunk)
+            first = False
+            chunk = []
+
+    if chunk:
+        yield ("" if first else ",") + ",".join(chunk)
+    yield '],"streak":%d}' % streak
+
 @app.route("/data")
 def data():
     try:
-        # Try to fetch data from Google Sheets first
-        sheets_data = fetch_google_sheets_data()
-        
-        if sheets_data:
-            # Use Google Sheets data for calculations
-            entries = []
-            for row in sheets_data:
-                if len(row) >= 2:  # Ensure we have at least date and mood
-                    try:
-                        # Assuming Google Sheets data format: [date, mood, ...]
-                        date_str = row[0]
-                        mood_str = row[1]
-                        
-                        # Validate date format
-                        datetime.strptime(date_str, "%Y-%m-%d")
-                        
-                        entries.append({
-                            "date": date_str,
-                            "mood": mood_str
-                        })
-                    except (ValueError, IndexError):
-                        continue  # Skip invalid entries
-            
-            # Calculate streak using Google Sheets data
-            streak = calculate_streak(entries)
-            
-            return jsonify({"logs": entries, "streak": streak})
+        g.edge_keys = ("data", "entries", "streak")
+        sheets_entries = fetch_google_sheets_entries()
+        # Sheets responses are already fully buffered, so only the backend path streams
+        if request.args.get("stream") == "1" and not sheets_entries:
+            streak = streak_tracker.get("mood")["streak"]
+            return Response(stream_data_json(scan_entries(), streak), mimetype="application/json")
+        entries, streak = load_entries_and_streak(sheets_entries)
         
-        else:
-            # Fallback to MongoDB data if Google Sheets is not available
-            entries = list(collection.find({}, {"_id": 0}).sort("date", 1))
-            
-            # Convert datetime objects to strings for JSON serialization
-            for entry in entries:
-                entry["date"] = entry["date"].strftime("%Y-%m-%d")
-            
-            # Calculate streak using MongoDB data
-            streak = calculate_streak(entries)
-            
-            return jsonify({"logs": entries, "streak": streak})
+        return jsonify({"logs": entries, "streak": streak})
     
     except Exception as e:
+        g.pop("edge_keys", None)
         return jsonify({"error": f"Server error: {str(e)}"})
 
-if __name__ == "__main__":
-    app.run(debug=True): 'rgba(0, 0, 0, 0.8)',
-                titleColor: '#ffffff',
-                bodyColor: '#ffffff',
-                borderColor: '#00ff88',
-                borderWidth: 1,
-                callbacks: {
-                  label: function(context) {
-                    const moodNames = { 1: 'Sad', 2: 'Neutral', 3: 'Happy' };
-                    return `Mood: ${moodNames[context.parsed.y]}`;
-                  }
-                }
-              }
-            },
-            scales: {
-              x: {
-                ticks: { color: '#a0a0a0', maxTicksLimit: 8 },
-                grid: { color: 'rgba(255, 255, 255, 0.1)' }
-              },
-              y: {
-                min: 0.5,
-                max: 3.5,
-                ticks: { 
-                  color: '#a0a0a0',
-                  callback: function(value) {
-                    const labels = { 1: '😞', 2: '😐', 3: '😊' };
-                    return labels[value] || '';
-                  }
-                },
-                grid: { color: 'rgba(255, 255, 255, 0.1)' }
-              }
-            },
-            elements: {
-              point: {
-                hoverBorderWidth: 3
-              }
-            }
-          }
-        });
-
-        // Create mood distribution chart
-        const moodCtx = document.getElementById("moodChart").getContext('2d');
-        moodChart = new Chart(moodCtx, {
-          type: "doughnut",
-          data: {
-            labels: ["😊 Happy", "😐 Neutral", "😞 Sad"],
-            datasets: [{
-              data: [moodCounts.happy, moodCounts.neutral, moodCounts.sad],
-              backgroundColor: ["#00ff88", "#ffdd00", "#ff6b6b"],
-              borderWidth: 0,
-              cutout: '60%'
-            }]
-          },
-          options: {
-            responsive: true,
-            maintainAspectRatio: false,
-            plugins: {
-              legend: {
-                position: 'bottom',
-                labels: {
-                  color: '#ffffff',
-                  padding: 20,
-                  usePointStyle: true,
-                  font: { size: 14 }
-                }
-              },
-tooltip: {
-                backgroundColor: 'rgba(0, 0, 0, 0.8)',
-                titleColor: '#ffffff',
-                bodyColor: '#ffffff',
-                borderColor: '#00ff88',
-                borderWidth: 1,
-                callbacks: {
-                  label: function(context) {
-                    const total = context.dataset.data.reduce((a, b) => a + b, 0);
-                    const percentage = Math.round((context.parsed / total) * 100);
-                    return `${context.label}: ${context.parsed} (${percentage}%)`;
-                  }
-                }
-              }
-            }
-          }
-        });
-
-        // Render recent entries and insights
-        renderRecentEntries(data.logs);
-        renderInsights(generateInsights(data));
+@app.route("/search")
+def search_notes():
+    terms = query_terms(request.args.get("q"))
+    if not terms:
+        return jsonify({"error": "Missing search query"}), 400
+    try:
+        page = max(int(request.args.get("page", 1)), 1)
+        per_page = min(max(int(request.args.get("per_page", SEARCH_PAGE_SIZE)), 1), SEARCH_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "Invalid page or per_page"}), 400
 
-      } catch (error) {
-        console.error('Error updating UI:', error);
-      }
-    }
+    try:
+        total, hits = store.search_notes(terms, per_page, (page - 1) * per_page)
+    except Exception as e:
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
 
-    document.getElementById("entryForm").addEventListener("submit", async function (e) {
-      e.preventDefault();
-      
-      const date = document.getElementById("date").value;
-      const mood = document.getElementById("mood").value;
-      
-      if (!date || !mood) {
-        alert('Please fill in all fields');
-        return;
-      }
+    return jsonify({
+        "query": " ".join(terms),
+        "total": total,
+        "page": page,
+        "per_page": per_page,
+        "results": [
+            {"date": epoch_day_to_str(day), "snippet": snippet(text, terms), "score": score}
+            for day, text, score in hits
+        ]
+    })
+
+@app.route("/insights")
+def dashboard_insights():
+    try:
+        insights, streak = get_insights()
+        g.edge_keys = ("insights", "entries", "streak")
+        return jsonify({"insights": insights, "streak": streak})
+    except Exception as e:
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
 
-      // Show loading state
-      const submitText = document.getElementById("submitText");
-      const submitLoading = document.getElementById("submitLoading");
-      submitText.style.display = "none";
-      submitLoading.style.display = "inline-block";
+_series_lock = threading.Lock()
+_series_cache = {}
+
+def build_chart_series(entries, days, points, method):
+    series = [
+        (to_epoch_day(parse_date_str(entry["date"])), MOOD_CODES[entry["mood"]])
+        for entry in entries if entry["mood"] in MOOD_CODES
+    ]
+    if days is not None and series:
+        start = to_epoch_day(datetime.now()) - days + 1
+        series = [point for point in series if point[0] >= start]
+
+    sampled = DOWNSAMPLE_METHODS[method](series, points)
+    return [{"date": epoch_day_to_str(round(x)), "score": round(y, 2)} for x, y in sampled]
+
+@app.route("/chart-series")
+def chart_series():
+    range_name = request.args.get("range", "1y")
+    method = request.args.get("method", "lttb")
+    if range_name not in CHART_RANGES:
+        return jsonify({"error": f"Invalid range. Use one of: {', '.join(CHART_RANGES)}"}), 400
+    if method not in DOWNSAMPLE_METHODS:
+        return jsonify({"error": f"Invalid method. Use one of: {', '.join(DOWNSAMPLE_METHODS)}"}), 400
+    try:
+        points = min(max(int(request.args.get("points", 200)), 3), CHART_MAX_POINTS)
+    except ValueError:
+        return jsonify({"error": "Invalid points"}), 400
 
-      try {
-        const response = await fetch('/submit', {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json'
-          },
-          body: JSON.stringify({ date, mood })
-        });
+    try:
+        version = get_data_version()
+        key = (range_name, points, method)
+        with _series_lock:
+            cached = _series_cache.get(key)
+        if cached and cached["version"] == version and time.monotonic() - cached["built_at"] < SNAPSHOT_TTL:
+            return jsonify(cached["payload"])
+
+        pin_reads_to_primary()
+        payload = {
+            "range": range_name,
+            "method": method,
+            "version": version,
+            "points": build_chart_series(load_entries(), CHART_RANGES[range_name], points, method)
+        }
+        with _series_lock:
+            # Keys are bounded by ranges x methods x point budgets; drop stale ones wholesale
+            if len(_series_cache) >= 64:
+                _series_cache.clear()
+            _series_cache[key] = {"version": version, "built_at": time.monotonic(), "payload": payload}
+        return jsonify(payload)
 
-        const result = await response.json();
-        
-        // Show success popup
-        const popup = document.getElementById("popup");
-        popup.classList.add("show");
-        setTimeout(() => {
-          popup.classList.remove("show");
-        }, 3000);
-        
-        // Reset form
-        document.getElementById("mood").value = "";
-        
-        // Update UI
-        await updateUI();
-        
-      } catch (error) {
-        console.error('Error submitting entry:', error);
-        alert('Error submitting entry. Please try again.');
-      } finally {
-        // Hide loading state
-        submitText.style.display = "inline";
-        submitLoading.style.display = "none";
-      }
-    });
+    except Exception as e:
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
 
-    // Initialize UI on page load
-    updateUI();
-  </script>
-</body>
-</html>
-"""
+@app.route("/calendar")
+def calendar_stats():
+    if not CALENDAR_INDEX:
+        return jsonify({"error": "Calendar index is disabled"}), 404
 
-def calculate_streak(entries):
-    if not entries:
-        return 0
-    
-    # Sort entries by date (newest first)
-    entries.sort(key=lambda x: datetime.strptime(x['date'], '%Y-%m-%d'), reverse=True)
-    
-    if len(entries) == 1:
-        return 1
-    
-    streak = 1
-    current_date = datetime.strptime(entries[0]['date'], '%Y-%m-%d')
-    
-    for i in range(1, len(entries)):
-        previous_date = datetime.strptime(entries[i]['date'], '%Y-%m-%d')
-        diff = (current_date - previous_date).days
-        
-        if diff == 1:
-            streak += 1
-            current_date = previous_date
-        elif diff == 0:
-            # Same date, skip
-            continue
+    try:
+        today = datetime.now().date()
+        year = int(request.args.get("year", today.year))
+        month = int(request.args.get("month", today.month))
+        if not 1 <= month <= 12:
+            return jsonify({"error": "Invalid month"}), 400
+
+        if calendar_store is not None:
+            index = calendar_store.load(store.scan)
         else:
-            # Gap in streak
-            break
-    
-    return streak
+            index = CalendarIndex.from_docs(scan_entries())
+        return jsonify({
+            "streak": streak_tracker.get("mood")["streak"],
+            "longest_streak": index.longest_streak(),
+            "missing_days": index.missing_days(year, month, until=today),
+            "mood_counts": index.mood_counts(),
+            "total": index.total()
+        })
+
+    except ValueError:
+        return jsonify({"error": "Invalid year or month"}), 400
+    except Exception as e:
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
 
-@app.route("/")
-def home():
-    return render_template_string(HTML)
+_habit_stats_lock = threading.Lock()
+_habit_stats_cache = {"version": None, "stats": None}
+
+def get_habit_stats(version):
+    """Per-habit streaks and stats, recomputed in one pass only when the data version changes"""
+    with _habit_stats_lock:
+        if _habit_stats_cache["version"] == version:
+            return _habit_stats_cache["stats"]
+    pin_reads_to_primary()
+    stats = habit_stats(store.scan_metrics(), HABITS)
+    with _habit_stats_lock:
+        _habit_stats_cache.update(version=version, stats=stats)
+    return stats
+
+@app.route("/habits/<habit>", methods=["POST"])
+def submit_habit(habit):
+    if habit not in HABITS:
+        return jsonify({"error": f"Unknown habit. Use one of: {', '.join(HABITS)}"}), 404
+    if habit == "mood":
+        # Moods go through /submit so they also reach Google Sheets and the calendar index
+        return jsonify({"error": "Log moods with /submit"}), 400
 
-@app.route("/submit", methods=["POST"])
-def submit_entry():
     try:
         data = request.get_json()
-        
-        if not data:
-            return jsonify({"error": "No data provided"}), 400
-            
-        mood = data.get("mood")
-        date_str = data.get("date")
-
-        if not mood or not date_str:
-            return jsonify({"error": "Missing mood or date"}), 400
+        if not data or "value" not in data or not data.get("date"):
+            return jsonify({"error": "Missing value or date"}), 400
 
-        # Convert date string to datetime for MongoDB
         try:
-            date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-        except ValueError:
+            date_obj = datetime.strptime(data["date"], "%Y-%m-%d")
+        except (TypeError, ValueError):
             return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
 
-        # Check for duplicate entry for the same date in MongoDB
-        existing_entry = collection.find_one({"date": date_obj})
-        if existing_entry:
-            return jsonify({"message": "Entry already exists for this date"}), 200
+        try:
+            value = parse_value(HABITS[habit], data["value"])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        # Insert new entry to MongoDB
-        collection.insert_one({"date": date_obj, "mood": mood})
-        mongodb_msg = "Entry saved to MongoDB"
+        # Unlike moods, re-logging a habit for a day overwrites the value
+        store.set_metric(habit, date_obj, value)
+        try:
+            streak_tracker.record(habit, to_epoch_day(date_obj), counts_towards_streak(HABITS[habit], value))
+        except Exception as e:
+            print(f"Error updating streak state: {str(e)}")
+        bump_data_version()
+        g.wrote = True
+        return jsonify({"message": f"{habit} saved for {data['date']}"}), 201
 
-        # Send to Google Sheets
-        sheets_data = {
-            "type": "mydata",
-            "date": date_str,
-            "mood": mood
+    except Exception as e:
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+@app.route("/habits")
+def habits_dashboard():
+    """Every habit for a date window (one indexed scan) plus cached per-habit stats"""
+    try:
+        today = datetime.now().date()
+        end = parse_date_str(request.args["to"]) if request.args.get("to") else today
+        start = parse_date_str(request.args["from"]) if request.args.get("from") else end - timedelta(days=HABIT_WINDOW_DAYS - 1)
+    except ValueError:
+        return jsonify({"error": "Invalid from or to date. Use YYYY-MM-DD"}), 400
+    if start > end or (end - start).days >= HABIT_MAX_WINDOW_DAYS:
+        return jsonify({"error": f"Window must be 1 to {HABIT_MAX_WINDOW_DAYS} days"}), 400
+
+    try:
+        version = get_data_version()
+        rows = store.scan_metrics(to_epoch_day(start), to_epoch_day(end) + 1)
+        stats = get_habit_stats(version)
+        # Cached stats know the runs; whether each is still current depends on today
+        streaks = streak_tracker.get_all(STREAK_SERIES)
+        stats = {
+            habit: dict(values, streak=streaks[habit]["streak"]) if habit in streaks else values
+            for habit, values in stats.items()
         }
-        sheets_result = send_to_google_sheets(sheets_data)
+        return jsonify({
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "version": version,
+            "habits": HABITS,
+            "days": window_by_day(rows),
+            "stats": stats
+        })
 
-        if sheets_result.get("status") == "success":
-            d2_value = sheets_result.get("d2Value", "N/A")
-            return jsonify({
-                'message': f'{mongodb_msg} and Google Sheets. D2 Value: {d2_value}'
-            }), 201
-        else:
-            return jsonify({
-                'message': f'{mongodb_msg}. Google Sheets: {sheets_result.get("message", "Not configured")}'
-            }), 201
+    except Exception as e:
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
 
+@app.route("/streaks")
+def streaks():
+    try:
+        return jsonify({"timezone": streak_tracker.timezone(), "streaks": streak_tracker.get_all(STREAK_SERIES)})
     except Exception as e:
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
-@app.route("/data")
-def data():
+@app.route("/streaks/timezone", methods=["POST"])
+def set_streak_timezone():
+    data = request.get_json(silent=True) or {}
     try:
-        # Try to fetch data from Google Sheets first
-        sheets_data = fetch_google_sheets_data()
-        
-        if sheets_data:
-            # Use Google Sheets data for calculations
-            entries = []
-            for row in sheets_data:
-                if len(row) >= 2:  # Ensure we have at least date and mood
-                    try:
-                        # Assuming Google Sheets data format: [date, mood, ...]
-                        date_str = row[0]
-                        mood_str = row[1]
-                        
-                        # Validate date format
-                        datetime.strptime(date_str, "%Y-%m-%d")
-                        
-                        entries.append({
-                            "date": date_str,
-                            "mood": mood_str
-                        })
-                    except (ValueError, IndexError):
-                        continue  # Skip invalid entries
-            
-            # Calculate streak using Google Sheets data
-            streak = calculate_streak(entries)
-            
-            return jsonify({"logs": entries, "streak": streak})
-        
-        else:
-            # Fallback to MongoDB data if Google Sheets is not available
-            entries = list(collection.find({}, {"_id": 0}).sort("date", 1))
-            
-            # Convert datetime objects to strings for JSON serialization
-            for entry in entries:
-                entry["date"] = entry["date"].strftime("%Y-%m-%d")
-            
-            # Calculate streak using MongoDB data
-            streak = calculate_streak(entries)
-            
-            return jsonify({"logs": entries, "streak": streak})
-    
+        streak_tracker.set_timezone(data.get("timezone") or "")
+    except pytz.UnknownTimeZoneError:
+        return jsonify({"error": "Unknown timezone. Use an IANA name such as Europe/London"}), 400
     except Exception as e:
-        return jsonify({"error": f"Server error: {str(e)}"})
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+    g.wrote = True
+    return jsonify({"timezone": streak_tracker.timezone()})
+
+def job_response(job):
+    body = {
+        "id": job["_id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "version": job["version"],
+        "status_url": f"/jobs/{job['_id']}"
+    }
+    if job["status"] == "done":
+        body["result"] = job["result"]
+        return jsonify(body), 200
+    if job["status"] == "failed":
+        body["error"] = job["error"]
+        return jsonify(body), 500
+    response = jsonify(body)
+    response.status_code = 202
+    response.headers["Location"] = body["status_url"]
+    response.headers["Retry-After"] = "1"
+    return response
+
+def requested_wait():
+    try:
+        return min(max(float(request.args.get("wait", 0)), 0), JOB_MAX_WAIT)
+    except ValueError:
+        return 0
+
+@app.route("/jobs/<kind>", methods=["POST"])
+def submit_job(kind):
+    if kind not in REPORTS:
+        return jsonify({"error": f"Unknown report. Use one of: {', '.join(REPORTS)}"}), 404
+
+    parse_params, _ = REPORTS[kind]
+    try:
+        params = parse_params(request.get_json(silent=True) or {}, streak_tracker.timezone())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        job = job_runner.submit(kind, params, get_data_version())
+        wait = requested_wait()
+        if wait and job["status"] not in ("done", "failed"):
+            job = job_runner.wait(job["_id"], wait)
+        return job_response(job)
+
+    except Exception as e:
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    try:
+        wait = requested_wait()
+        job = job_runner.wait(job_id, wait) if wait else job_runner.get(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+
+        # CSV reports can be downloaded directly once finished
+        if request.args.get("format") == "csv" and job["status"] == "done" and "csv" in (job["result"] or {}):
+            return Response(job["result"]["csv"], mimetype="text/csv", headers={
+                "Content-Disposition": f'attachment; filename="streakflow-{job["_id"]}.csv"'
+            })
+        return job_response(job)
+
+    except Exception as e:
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+if PROFILING_TOKEN:
+    profiler = RequestProfiler()
+
+    def require_profiling_token():
+        token = request.headers.get("X-Debug-Token", "")
+        if not hmac.compare_digest(token, PROFILING_TOKEN):
+            return jsonify({"error": "Forbidden"}), 403
+        return None
+
+    @app.before_request
+    def start_profiling():
+        if profiler.claim(request.endpoint):
+            g.profile = profiler.start()
+            g.profile_started = time.perf_counter()
+
+    @app.after_request
+    def finish_profiling(response):
+        if "profile" in g:
+            token, started, path = g.profile, g.profile_started, request.full_path
+            # Stop once the body has been sent, so streamed responses are covered too
+            response.call_on_close(lambda: profiler.stop(token, path, time.perf_counter() - started))
+        return response
+
+    @app.route("/debug/profile", methods=["GET", "POST"])
+    def debug_profile():
+        denied = require_profiling_token()
+        if denied:
+            return denied
+
+        if request.method == "POST":
+            body = request.get_json(silent=True) or {}
+            endpoint = body.get("endpoint", "data")
+            if endpoint not in app.view_functions:
+                return jsonify({"error": f"Unknown endpoint: {endpoint}"}), 400
+            try:
+                count = min(max(int(body.get("count", 1)), 1), 100)
+            except (TypeError, ValueError):
+                return jsonify({"error": "Invalid count"}), 400
+            profiler.arm(endpoint, count, bool(body.get("memory", False)))
+            return jsonify(profiler.status()), 202
+
+        # GET returns and clears the captured profiles
+        results = profiler.drain()
+        if request.args.get("format") == "collapsed":
+            lines = [line for result in results for line in result["collapsed"]]
+            return Response("\n".join(lines) + "\n", mimetype="text/plain")
+        return jsonify({"status": profiler.status(), "results": results})
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,203 @@
+/**
+ * Reference Apps Script handler for StreakFlow's Google Sheets mirror.
+ *
+ * POST  {type: "mydata", date, mood}   appends a row and returns D2
+ * GET   ?action=fetch                   returns every row
+ * GET   ?action=fetch&since=N&revision=R
+ *        returns only rows after the first N data rows, as long as R still
+ *        matches the sheet's revision; otherwise the whole sheet with since=0
+ * GET   ?action=hashes                  per-year hash tree nodes
+ * GET   ?action=hashes&year=YYYY        that year's per-month nodes
+ * GET   ?action=month&month=YYYY-MM     that month's rows, first row per day
+ *
+ * The hashes must match anti_entropy.py: an entry's digest is the first 8
+ * bytes of SHA-256 over "YYYY-MM-DD|mood" read as an unsigned integer, and a
+ * month or year hash is the sum of its digests modulo 2^64, as 16 hex digits.
+ * Only the first valid row for each date counts.
+ *
+ * The revision changes whenever an existing row is edited or removed (see
+ * onEdit/onChange below), which tells the app its merged copy is stale.
+ * Install onChange as an installable trigger: Triggers > Add trigger >
+ * onChange > From spreadsheet > On change.
+ */
+
+var SHEET_NAME = 'Sheet1';
+var HEADER_ROWS = 1;
+
+function getSheet_() {
+  return SpreadsheetApp.getActiveSpreadsheet().getSheetByName(SHEET_NAME);
+}
+
+function getRevision_() {
+  var props = PropertiesService.getScriptProperties();
+  var revision = props.getProperty('revision');
+  if (!revision) {
+    revision = String(Date.now());
+    props.setProperty('revision', revision);
+  }
+  return revision;
+}
+
+function bumpRevision_() {
+  PropertiesService.getScriptProperties().setProperty('revision', String(Date.now()));
+}
+
+function json_(body) {
+  return ContentService.createTextOutput(JSON.stringify(body))
+    .setMimeType(ContentService.MimeType.JSON);
+}
+
+function formatDate_(value) {
+  if (Object.prototype.toString.call(value) === '[object Date]') {
+    return Utilities.formatDate(value, Session.getScriptTimeZone(), 'yyyy-MM-dd');
+  }
+  return String(value);
+}
+
+function readRows_(startRow, count) {
+  if (count <= 0) return [];
+  var values = getSheet_().getRange(startRow, 1, count, 2).getValues();
+  return values.map(function (row) { return [formatDate_(row[0]), String(row[1])]; });
+}
+
+var HASH_MASK = (BigInt(1) << BigInt(64)) - BigInt(1);
+
+function isValidDate_(value) {
+  var match = /^(\d{4})-(\d{2})-(\d{2})$/.exec(value);
+  if (!match) return false;
+  var d = new Date(Date.UTC(+match[1], +match[2] - 1, +match[3]));
+  return d.getUTCFullYear() === +match[1] && d.getUTCMonth() === +match[2] - 1 && d.getUTCDate() === +match[3];
+}
+
+function firstPerDay_(rows) {
+  var seen = {};
+  return rows.filter(function (row) {
+    if (!isValidDate_(row[0]) || seen[row[0]]) return false;
+    seen[row[0]] = true;
+    return true;
+  });
+}
+
+function entryDigest_(date, mood) {
+  var bytes = Utilities.computeDigest(Utilities.DigestAlgorithm.SHA_256, date + '|' + mood, Utilities.Charset.UTF_8);
+  var value = BigInt(0);
+  for (var i = 0; i < 8; i++) {
+    value = (value << BigInt(8)) | BigInt(bytes[i] & 0xff);
+  }
+  return value;
+}
+
+function hex_(value) {
+  return ('0000000000000000' + value.toString(16)).slice(-16);
+}
+
+// {"YYYY-MM": [hash, count]}, cached until the sheet's revision or length changes
+function monthHashes_() {
+  var total = Math.max(getSheet_().getLastRow() - HEADER_ROWS, 0);
+  var key = 'hashes:' + getRevision_() + ':' + total;
+  var cache = CacheService.getScriptCache();
+  var cached = cache.get(key);
+  if (cached) return JSON.parse(cached);
+
+  var sums = {};
+  firstPerDay_(readRows_(HEADER_ROWS + 1, total)).forEach(function (row) {
+    var month = row[0].slice(0, 7);
+    var node = sums[month] || (sums[month] = [BigInt(0), 0]);
+    node[0] = (node[0] + entryDigest_(row[0], row[1])) & HASH_MASK;
+    node[1] += 1;
+  });
+
+  var months = {};
+  Object.keys(sums).forEach(function (month) {
+    months[month] = [hex_(sums[month][0]), sums[month][1]];
+  });
+  cache.put(key, JSON.stringify(months), 21600);
+  return months;
+}
+
+function hashes_(year) {
+  var months = monthHashes_();
+  if (year) {
+    var selected = {};
+    Object.keys(months).sort().forEach(function (month) {
+      if (month.slice(0, 4) === year) selected[month] = months[month];
+    });
+    return json_({ status: 'success', year: year, months: selected });
+  }
+
+  var sums = {};
+  Object.keys(months).forEach(function (month) {
+    var node = sums[month.slice(0, 4)] || (sums[month.slice(0, 4)] = [BigInt(0), 0]);
+    node[0] = (node[0] + BigInt('0x' + months[month][0])) & HASH_MASK;
+    node[1] += months[month][1];
+  });
+  var years = {};
+  Object.keys(sums).sort().forEach(function (y) {
+    years[y] = [hex_(sums[y][0]), sums[y][1]];
+  });
+  return json_({ status: 'success', revision: getRevision_(), years: years });
+}
+
+function monthRows_(month) {
+  var total = Math.max(getSheet_().getLastRow() - HEADER_ROWS, 0);
+  var rows = firstPerDay_(readRows_(HEADER_ROWS + 1, total)).filter(function (row) {
+    return row[0].slice(0, 7) === month;
+  });
+  return json_({ status: 'success', month: month, data: rows });
+}
+
+function doGet(e) {
+  var params = (e && e.parameter) || {};
+  if (params.action === 'hashes') {
+    return hashes_(params.year);
+  }
+  if (params.action === 'month') {
+    return monthRows_(params.month);
+  }
+  if (params.action !== 'fetch') {
+    return json_({ status: 'error', message: 'Unknown action' });
+  }
+
+  var sheet = getSheet_();
+  var total = Math.max(sheet.getLastRow() - HEADER_ROWS, 0);
+  var revision = getRevision_();
+
+  var since = parseInt(params.since, 10);
+  if (isNaN(since) || since < 0 || since > total || params.revision !== revision) {
+    since = 0;
+  }
+
+  return json_({
+    status: 'success',
+    since: since,
+    total: total,
+    revision: revision,
+    data: readRows_(HEADER_ROWS + since + 1, total - since)
+  });
+}
+
+function doPost(e) {
+  var body = JSON.parse(e.postData.contents);
+  if (body.type !== 'mydata') {
+    return json_({ status: 'error', message: 'Unknown type' });
+  }
+
+  var sheet = getSheet_();
+  // Appends do not change the revision: incremental fetches pick them up via `since`
+  sheet.appendRow([body.date, body.mood]);
+
+  return json_({ status: 'success', d2Value: sheet.getRange('D2').getValue() });
+}
+
+function onEdit(e) {
+  // Any manual edit above the last row rewrites rows the app has already merged
+  if (e && e.range && e.range.getRow() <= getSheet_().getLastRow()) {
+    bumpRevision_();
+  }
+}
+
+function onChange(e) {
+  if (e && ['REMOVE_ROW', 'INSERT_ROW', 'REMOVE_COLUMN', 'INSERT_COLUMN', 'OTHER'].indexOf(e.changeType) !== -1) {
+    bumpRevision_();
+  }
+}
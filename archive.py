@@ -0,0 +1,159 @@
+"""Hot/cold tiering for entries.
+
+Closed years are moved out of the hot `entries` collection into one
+document per year in `archive`, holding a zlib-compressed block of
+(day-of-year offset, mood code) records, 3 bytes each before compression.
+Moods without a code keep their text in a small side map. Readers merge
+both tiers, so the hot collection and its indexes only hold recent data
+as accounts age. Run the job from cron or by hand:
+
+    MONGO_URI=... python archive.py --keep-years 1
+"""
+import argparse
+import os
+import struct
+import zlib
+from datetime import date, datetime, timezone
+
+from pymongo import ASCENDING, MongoClient
+
+from schema import MOOD_CODES, MOOD_NAMES, entry_day, epoch_day_to_datetime, to_epoch_day
+
+RECORD = struct.Struct("<HB")
+
+
+def encode_block(records):
+    """Compress sorted (offset, code) pairs."""
+    return zlib.compress(b"".join(RECORD.pack(offset, code) for offset, code in records), 9)
+
+
+def decode_block(block):
+    return list(RECORD.iter_unpack(zlib.decompress(block)))
+
+
+def year_filter(year):
+    """Hot documents for a year, in either schema."""
+    return {"$or": [
+        {"d": {"$gte": to_epoch_day(date(year, 1, 1)), "$lt": to_epoch_day(date(year + 1, 1, 1))}},
+        {"date": {"$gte": datetime(year, 1, 1), "$lt": datetime(year + 1, 1, 1)}}
+    ]}
+
+
+class ArchiveTier:
+    def __init__(self, hot, archive):
+        self.hot = hot
+        self.archive = archive
+
+    def docs_from_archive(self, doc):
+        """Expand one archived year back into stored-form entry documents."""
+        start = to_epoch_day(date(doc["_id"], 1, 1))
+        other = doc.get("other", {})
+        for offset, code in decode_block(doc["block"]):
+            day = start + offset
+            if code in MOOD_NAMES:
+                yield {"d": day, "m": code}
+            else:
+                yield {"date": epoch_day_to_datetime(day), "mood": other.get(str(offset), "")}
+
+    def iter_docs(self, archive=None, start=None, end=None):
+        """Archived entries in date order, optionally limited to epoch-days [start, end)."""
+        if archive is None:
+            archive = self.archive
+        years = {}
+        if start is not None:
+            years["$gte"] = epoch_day_to_datetime(start).year
+        if end is not None:
+            years["$lte"] = epoch_day_to_datetime(end - 1).year
+        for doc in archive.find({"_id": years} if years else {}).sort("_id", ASCENDING):
+            for entry in self.docs_from_archive(doc):
+                day = entry_day(entry)
+                if (start is None or day >= start) and (end is None or day < end):
+                    yield entry
+
+    def contains(self, date_obj):
+        doc = self.archive.find_one({"_id": date_obj.year})
+        if doc is None:
+            return False
+        offset = to_epoch_day(date_obj) - to_epoch_day(date(date_obj.year, 1, 1))
+        return any(record_offset == offset for record_offset, _ in decode_block(doc["block"]))
+
+    def closed_years(self, keep_years=0, today=None):
+        """Years with hot entries that are old enough to archive."""
+        cutoff_year = (today or date.today()).year - keep_years
+        cutoff = date(cutoff_year, 1, 1)
+        query = {"$or": [
+            {"d": {"$lt": to_epoch_day(cutoff)}},
+            {"date": {"$lt": datetime(cutoff_year, 1, 1)}}
+        ]}
+        years = set()
+        for doc in self.hot.find(query, {"_id": 0, "d": 1, "date": 1}):
+            years.add(doc["date"].year if "date" in doc else epoch_day_to_datetime(doc["d"]).year)
+        return sorted(years)
+
+    def archive_year(self, year, dry_run=False):
+        """Fold a year's hot entries into its archive block and remove them.
+
+        Only the documents read here are deleted, so entries inserted while
+        the job runs stay hot until the next run. If the job dies between the
+        write and the delete, readers see the same day in both tiers and
+        de-duplicate it.
+        """
+        hot_docs = list(self.hot.find(year_filter(year)))
+        if not hot_docs:
+            return 0
+
+        start = to_epoch_day(date(year, 1, 1))
+        records = {}
+        other = {}
+        existing = self.archive.find_one({"_id": year})
+        if existing:
+            records.update(dict(decode_block(existing["block"])))
+            other.update(existing.get("other", {}))
+
+        for doc in hot_docs:
+            offset = entry_day(doc) - start
+            # Keep the first entry for a day, matching /submit's duplicate rule;
+            # a later one must not touch its code or its text in `other`
+            if offset in records:
+                continue
+            if "d" in doc:
+                code = doc.get("m", 0)
+            else:
+                code = MOOD_CODES.get(doc["mood"], 0)
+                if not code:
+                    other.setdefault(str(offset), doc["mood"])
+            records[offset] = code
+
+        if dry_run:
+            return len(hot_docs)
+
+        self.archive.replace_one({"_id": year}, {
+            "_id": year,
+            "count": len(records),
+            "block": encode_block(sorted(records.items())),
+            "other": other,
+            "archived_at": datetime.now(timezone.utc)
+        }, upsert=True)
+        self.hot.delete_many({"_id": {"$in": [doc["_id"] for doc in hot_docs]}})
+        return len(hot_docs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive closed years of entries into compressed yearly blocks")
+    parser.add_argument("--keep-years", type=int, default=0, help="closed years to keep in the hot collection")
+    parser.add_argument("--dry-run", action="store_true", help="report what would move without writing")
+    args = parser.parse_args()
+
+    mongo_uri = os.environ.get("MONGO_URI")
+    if not mongo_uri:
+        raise SystemExit("MONGO_URI is not set. Please set it as an environment variable.")
+
+    db = MongoClient(mongo_uri)[os.getenv("MONGO_DB", "streakflow")]
+    tier = ArchiveTier(db["entries"], db["archive"])
+    for year in tier.closed_years(args.keep_years):
+        moved = tier.archive_year(year, dry_run=args.dry_run)
+        print(f"{year}: {'would move' if args.dry_run else 'moved'} {moved} entries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Compare /submit write throughput with and without group commit.
+
+Runs against a scratch collection on MONGO_URI (it is dropped before each
+run), with many threads submitting distinct dates plus a share of duplicates:
+
+    MONGO_URI=mongodb://localhost:27017 python bench/bench_group_commit.py --threads 32
+"""
+import argparse
+import itertools
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pymongo import MongoClient
+from pymongo.write_concern import WriteConcern
+
+from group_commit import GroupCommitter
+
+
+def direct_submit(collection, date_obj, mood):
+    # Same two round trips as the default /submit path
+    if collection.find_one({"date": date_obj}):
+        return False
+    collection.insert_one({"date": date_obj, "mood": mood})
+    return True
+
+
+def run(label, submit, threads, per_thread, duplicate_every):
+    counter = itertools.count()
+    start_date = datetime(2000, 1, 1)
+    results = {"inserted": 0, "duplicate": 0}
+    lock = threading.Lock()
+
+    def worker():
+        inserted = duplicate = 0
+        for _ in range(per_thread):
+            n = next(counter)
+            # Every Nth submission reuses an earlier date to exercise the duplicate path
+            if duplicate_every and n % duplicate_every == 0 and n > 0:
+                n -= 1
+            if submit(start_date + timedelta(days=n), "happy"):
+                inserted += 1
+            else:
+                duplicate += 1
+        with lock:
+            results["inserted"] += inserted
+            results["duplicate"] += duplicate
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    total = threads * per_thread
+    print(f"{label:<14} {total / elapsed:10.0f} submits/s  "
+          f"({results['inserted']} inserted, {results['duplicate']} duplicate, {elapsed:.2f}s)")
+    return total / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--per-thread", type=int, default=200)
+    parser.add_argument("--window-ms", type=float, default=3)
+    parser.add_argument("--max-batch", type=int, default=256)
+    parser.add_argument("--w", default="1", help="write concern for group commit (e.g. 1 or majority)")
+    parser.add_argument("--duplicate-every", type=int, default=10)
+    args = parser.parse_args()
+
+    client = MongoClient(os.environ.get("MONGO_URI", "mongodb://localhost:27017"))
+    collection = client["streakflow_bench"]["entries"]
+
+    collection.drop()
+    baseline = run("direct", lambda d, m: direct_submit(collection, d, m),
+                   args.threads, args.per_thread, args.duplicate_every)
+
+    collection.drop()
+    w = int(args.w) if args.w.isdigit() else args.w
+    committer = GroupCommitter(collection, window_ms=args.window_ms,
+                               max_batch=args.max_batch, write_concern=WriteConcern(w=w))
+    grouped = run("group-commit", committer.submit,
+                  args.threads, args.per_thread, args.duplicate_every)
+
+    print(f"speedup: {grouped / baseline:.2f}x")
+    collection.drop()
+
+
+if __name__ == "__main__":
+    main()
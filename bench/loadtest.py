@@ -0,0 +1,395 @@
+"""Load-test the whole app under gunicorn with realistic traffic mixes.
+
+Starts a stub Apps Script server that injects latency and faults, seeds a
+scratch SQLite database (the local stand-in for MongoDB, see storage.py)
+and the stub sheet with the same history, then runs the app under gunicorn
+and replays a weighted mix of `/`, `/data` and `/submit` from many
+simulated users. Each scenario restarts the app so caches start cold, and
+the report gives throughput and p50/p95/p99 latency per route and scenario:
+
+    python bench/loadtest.py --users 2000 --duration 30 --mix home=2,data=6,submit=2
+    python bench/loadtest.py --scenarios healthy,down --slo data:p95:250 --slo submit:p99:1000
+    python bench/loadtest.py --backend mongo --mongo-uri mongodb://localhost:27017
+
+Scenarios are "healthy", "slow" and "down" (see SCENARIOS), or your own
+from --scenario-file, a JSON object of name -> {latency, jitter, error_rate}.
+Responses shed by admission control (503) are counted apart from errors.
+"""
+import argparse
+import bisect
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from storage import SQLiteStore
+
+# Stub Apps Script behaviour: seconds of latency (+/- jitter) and the share of
+# requests answered with HTTP 500
+SCENARIOS = {
+    "healthy": {"latency": 0.08, "jitter": 0.04, "error_rate": 0.0},
+    "slow": {"latency": 2.0, "jitter": 1.0, "error_rate": 0.05},
+    "down": {"latency": 0.0, "jitter": 0.0, "error_rate": 1.0}
+}
+
+ROUTES = {
+    "home": ("GET", "/"),
+    "data": ("GET", "/data"),
+    "data_stream": ("GET", "/data?stream=1"),
+    "submit": ("POST", "/submit")
+}
+
+MOODS = ["happy", "neutral", "sad"]
+
+# --backend mongo only ever touches databases named like this
+SCRATCH_DB_PREFIX = "streakflow_loadtest_"
+
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # The app's Sheets timeout or a gunicorn restart hangs up mid-reply
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class StubSheet:
+    """In-memory sheet behind a fake Apps Script endpoint (same protocol as apps_script/Code.gs)."""
+
+    def __init__(self, rows):
+        self.lock = threading.Lock()
+        self.rows = list(rows)
+        self.revision = str(int(time.time() * 1000))
+        self.fault = SCENARIOS["healthy"]
+        self.server = None
+
+    def start(self):
+        sheet = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, body):
+                fault = sheet.fault
+                time.sleep(max(0.0, fault["latency"] + random.uniform(-fault["jitter"], fault["jitter"])))
+                if random.random() < fault["error_rate"]:
+                    self.send_response(500)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                payload = json.dumps(body()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                params = parse_qs(urlparse(self.path).query)
+                self._reply(lambda: sheet.fetch(params))
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                self._reply(lambda: sheet.append(body))
+
+        self.server = QuietHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_port}/exec"
+
+    def stop(self):
+        self.server.shutdown()
+
+    def fetch(self, params):
+        with self.lock:
+            total = len(self.rows)
+            try:
+                since = int(params.get("since", ["0"])[0])
+            except ValueError:
+                since = 0
+            if since < 0 or since > total or params.get("revision", [None])[0] != self.revision:
+                since = 0
+            return {
+                "status": "success",
+                "since": since,
+                "total": total,
+                "revision": self.revision,
+                "data": self.rows[since:]
+            }
+
+    def append(self, body):
+        with self.lock:
+            self.rows.append([body.get("date"), body.get("mood")])
+            return {"status": "success", "d2Value": len(self.rows)}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def seed_history(days):
+    start = datetime.now() - timedelta(days=days)
+    return [(start + timedelta(days=i), random.choice(MOODS)) for i in range(days)]
+
+
+def start_app(args, env, port):
+    cmd = [
+        sys.executable, "-m", "gunicorn", "app:app",
+        "--chdir", ROOT,
+        "--bind", f"127.0.0.1:{port}",
+        "--workers", str(args.workers),
+        "--threads", str(args.threads),
+        "--graceful-timeout", "5",
+        "--log-level", "warning"
+    ]
+    proc = subprocess.Popen(cmd, env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"gunicorn exited with status {proc.returncode}")
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/sw.js", timeout=1).status_code == 200:
+                return proc
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit("gunicorn did not become ready within 30s")
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        route, _, weight = part.partition("=")
+        if route not in ROUTES:
+            raise argparse.ArgumentTypeError(f"Unknown route {route!r}. Use one of: {', '.join(ROUTES)}")
+        mix[route] = float(weight or 1)
+    return mix
+
+
+def parse_slo(value):
+    try:
+        route, percentile, limit_ms = value.split(":")
+        if route not in ROUTES or percentile not in ("p50", "p95", "p99"):
+            raise ValueError
+        return route, percentile, float(limit_ms)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid SLO {value!r}. Use route:p50|p95|p99:milliseconds")
+
+
+def simulate(base_url, mix, users, duration, warmup, think_ms, timeout):
+    """Run `users` closed-loop users; return {route: [(latency_s, outcome), ...]} after warmup.
+
+    Users stop starting requests at the end of the window and then wait for
+    their last response, bounded by the client timeout.
+    """
+    routes = list(mix)
+    cumulative = []
+    total = 0
+    for route in routes:
+        total += mix[route]
+        cumulative.append(total)
+
+    samples = {route: [] for route in routes}
+    lock = threading.Lock()
+    started = time.monotonic()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    def user():
+        session = requests.Session()
+        local = {route: [] for route in routes}
+        while time.monotonic() < stop_at:
+            route = routes[bisect.bisect_left(cumulative, random.uniform(0, total))]
+            method, path = ROUTES[route]
+            kwargs = {"timeout": timeout}
+            if method == "POST":
+                day = datetime.now() - timedelta(days=random.randrange(3650))
+                kwargs["json"] = {"date": day.strftime("%Y-%m-%d"), "mood": random.choice(MOODS)}
+
+            t0 = time.monotonic()
+            try:
+                status = session.request(method, base_url + path, **kwargs).status_code
+                outcome = "ok" if status < 400 else "shed" if status == 503 else "error"
+            except requests.RequestException:
+                outcome = "error"
+            t1 = time.monotonic()
+            # Count everything started in the window, however late it finishes,
+            # so slow responses are not dropped from the tail
+            if t0 >= measure_from:
+                local[route].append((t1 - t0, outcome))
+
+            if think_ms:
+                time.sleep(random.expovariate(1000.0 / think_ms))
+        with lock:
+            for route, values in local.items():
+                samples[route].extend(values)
+
+    threads = []
+    for _ in range(users):
+        t = threading.Thread(target=user, daemon=True)
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()
+    return samples
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    # Nearest-rank: the smallest value with at least p% of samples at or below it
+    rank = max(1, math.ceil(p / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(samples, duration):
+    report = {}
+    for route, values in samples.items():
+        latencies = sorted(latency for latency, outcome in values if outcome == "ok")
+        report[route] = {
+            "requests": len(values),
+            "throughput": round(len(values) / duration, 1),
+            "ok": len(latencies),
+            "shed": sum(1 for _, outcome in values if outcome == "shed"),
+            "errors": sum(1 for _, outcome in values if outcome == "error"),
+            **{
+                name: round(percentile(latencies, p) * 1000, 1) if latencies else None
+                for name, p in (("p50", 50), ("p95", 95), ("p99", 99))
+            }
+        }
+    return report
+
+
+def print_report(results):
+    header = f"{'scenario':<10} {'route':<12} {'reqs':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'shed':>6} {'errors':>6}"
+    print(header)
+    print("-" * len(header))
+    fmt = lambda v: "-" if v is None else f"{v:.1f}"
+    for scenario, report in results.items():
+        for route, r in report.items():
+            print(f"{scenario:<10} {route:<12} {r['requests']:>7} {r['throughput']:>8.1f} "
+                  f"{fmt(r['p50']):>8} {fmt(r['p95']):>8} {fmt(r['p99']):>8} {r['shed']:>6} {r['errors']:>6}")
+
+
+def check_slos(results, slos):
+    failures = []
+    for scenario, report in results.items():
+        for route, name, limit_ms in slos:
+            value = report.get(route, {}).get(name)
+            if value is not None and value > limit_ms:
+                failures.append(f"{scenario}: {route} {name} {value:.1f}ms > {limit_ms:.0f}ms")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=500, help="simulated concurrent users")
+    parser.add_argument("--duration", type=float, default=20, help="measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=3, help="unmeasured seconds before each scenario")
+    parser.add_argument("--think-ms", type=float, default=500, help="mean pause between a user's requests")
+    parser.add_argument("--timeout", type=float, default=15, help="client timeout per request")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("home=2,data=6,submit=2"))
+    parser.add_argument("--scenarios", default="healthy,slow,down")
+    parser.add_argument("--scenario-file", help="JSON object of extra or overriding scenarios")
+    parser.add_argument("--seed-days", type=int, default=730, help="days of history in the database and sheet")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--backend", choices=["sqlite", "mongo"], default="sqlite")
+    parser.add_argument("--mongo-uri", help="server for --backend mongo; required, MONGO_URI is never used")
+    parser.add_argument("--mongo-db", default=f"{SCRATCH_DB_PREFIX}{uuid.uuid4().hex[:8]}",
+                        help=f"scratch database, dropped before each scenario and at the end (default {SCRATCH_DB_PREFIX}<random>)")
+    parser.add_argument("--slo", type=parse_slo, action="append", default=[], help="route:p95:ms, repeatable")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    scenarios = dict(SCENARIOS)
+    if args.scenario_file:
+        with open(args.scenario_file) as f:
+            for name, fault in json.load(f).items():
+                scenarios[name] = {"latency": 0.0, "jitter": 0.0, "error_rate": 0.0, **fault}
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in scenarios]
+    if unknown:
+        raise SystemExit(f"Unknown scenario(s): {', '.join(unknown)}")
+
+    mongo = None
+    if args.backend == "mongo":
+        # The benchmark drops its database, so it must never be the app's own
+        if not args.mongo_uri:
+            raise SystemExit("--backend mongo needs an explicit --mongo-uri (MONGO_URI is not used)")
+        if not args.mongo_db.startswith(SCRATCH_DB_PREFIX):
+            raise SystemExit(f"--mongo-db must start with {SCRATCH_DB_PREFIX!r}; it is dropped between scenarios")
+        from pymongo import MongoClient
+        mongo = MongoClient(args.mongo_uri)
+
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in names:
+                history = seed_history(args.seed_days)
+                env = dict(os.environ, STORAGE_BACKEND=args.backend)
+                if args.backend == "sqlite":
+                    env["SQLITE_PATH"] = os.path.join(tmp, f"{name}.db")
+                    SQLiteStore(env["SQLITE_PATH"]).bulk_upsert(history)
+                else:
+                    env.update(MONGO_URI=args.mongo_uri, MONGO_DB=args.mongo_db)
+                    # The whole database, so no collection's state leaks into the next scenario
+                    mongo.drop_database(args.mongo_db)
+                    mongo[args.mongo_db]["entries"].insert_many([{"date": date_obj, "mood": mood} for date_obj, mood in history])
+
+                sheet = StubSheet([[date_obj.strftime("%Y-%m-%d"), mood] for date_obj, mood in history])
+                sheet.fault = scenarios[name]
+                env["GOOGLE_SCRIPT_URL"] = sheet.start()
+
+                port = free_port()
+                proc = start_app(args, env, port)
+                print(f"{name}: {args.users} users for {args.duration:.0f}s, Sheets {scenarios[name]}", file=sys.stderr)
+                try:
+                    samples = simulate(f"http://127.0.0.1:{port}", args.mix, args.users,
+                                       args.duration, args.warmup, args.think_ms, args.timeout)
+                finally:
+                    proc.terminate()
+                    try:
+                        proc.wait(timeout=15)
+                    except subprocess.TimeoutExpired:
+                        proc.kill()
+                        proc.wait()
+                    sheet.stop()
+                results[name] = summarize(samples, args.duration)
+    finally:
+        if mongo is not None:
+            mongo.drop_database(args.mongo_db)
+
+    print_report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": {k: v for k, v in vars(args).items() if k != "slo"}, "results": results}, f, indent=2)
+
+    failures = check_slos(results, args.slo)
+    for failure in failures:
+        print(f"SLO FAIL {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
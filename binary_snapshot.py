@@ -0,0 +1,318 @@
+"""Memory-mapped binary snapshot of the entries.
+
+A new worker normally rebuilds its view of the data with a full scan of
+the storage backend before it can answer /data. Instead it can map a
+snapshot file written periodically by any process and scan only what
+changed since.
+
+File layout (little-endian):
+
+    header   64 bytes: magic, format, number of extra moods, number of years,
+             data version, written-at (unix seconds), entry count, run ending
+             at the newest day, longest run, newest epoch-day, and entry
+             counts for mood codes 0-3 (0 = any mood outside MOOD_CODES)
+    years    one (int32 year, uint32 entries) row per calendar year
+    moods    one 32-byte UTF-8 name per mood outside MOOD_CODES, coded 4, 5, ...
+    records  one 8-byte (int32 epoch-day, uint8 mood code, 3 padding) row per
+             entry, in day order
+
+Records are read in place through the mapping, never copied into Python
+lists up front. Entries are insert-only (the first entry for a day wins),
+so a year whose live count matches the snapshot's count for it is
+unchanged; only the other years are scanned from the backend. Live counts
+come from the hash-tree month nodes (see anti_entropy.py), one small read
+for every year, and from per-year counts only until those nodes exist.
+Pass the
+file to load_arrays() to get NumPy arrays for offline analytics:
+
+    python binary_snapshot.py --write snapshot.bin
+    python binary_snapshot.py --info snapshot.bin
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import date
+
+from schema import MOOD_CODES, MOOD_NAMES, entry_day, from_epoch_day, to_epoch_day
+from storage import doc_for_day
+from streaks import runs_from_days
+
+MAGIC = b"SFSNAP\x00\x00"
+FORMAT = 1
+HEADER = struct.Struct("<8sHHIqdIiii4I")
+YEAR = struct.Struct("<iI")
+MOOD = struct.Struct("<32s")
+RECORD = struct.Struct("<iB3x")
+NO_DAY = -(2 ** 31)
+FIRST_EXTRA_CODE = 4
+
+# Structured dtype matching RECORD, for np.frombuffer / np.memmap
+NUMPY_DTYPE = {"names": ["day", "mood"], "formats": ["<i4", "u1"], "offsets": [0, 4], "itemsize": RECORD.size}
+
+
+def _code(doc, extra):
+    if "mood" not in doc:
+        return doc.get("m", 0)
+    mood = doc["mood"]
+    if mood in MOOD_CODES:
+        return MOOD_CODES[mood]
+    if mood not in extra:
+        # Moods that do not fit a code or a name slot read back as ""
+        if len(extra) > 255 - FIRST_EXTRA_CODE or len(mood.encode()) > MOOD.size:
+            return 0
+        extra[mood] = FIRST_EXTRA_CODE + len(extra)
+    return extra[mood]
+
+
+def _year_range(year):
+    return to_epoch_day(date(year, 1, 1)), to_epoch_day(date(year + 1, 1, 1))
+
+
+def write_snapshot(path, docs, data_version):
+    """Write entry documents (in day order) to `path`; returns the number written.
+
+    The file is replaced atomically, so workers that already mapped the old
+    one keep reading it undisturbed.
+    """
+    records = bytearray()
+    years = {}
+    extra = {}
+    counts = [0, 0, 0, 0]
+    days = []
+    for doc in docs:
+        day, code = entry_day(doc), _code(doc, extra)
+        records += RECORD.pack(day, code)
+        year = from_epoch_day(day).year
+        years[year] = years.get(year, 0) + 1
+        counts[code if code < FIRST_EXTRA_CODE else 0] += 1
+        days.append(day)
+
+    run, longest, last_day = runs_from_days(days)
+    header = HEADER.pack(MAGIC, FORMAT, len(extra), len(years), data_version, time.time(), len(days),
+                         run, longest, NO_DAY if last_day is None else last_day, *counts)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(header)
+        for year in sorted(years):
+            f.write(YEAR.pack(year, years[year]))
+        for mood in extra:
+            f.write(MOOD.pack(mood.encode()))
+        f.write(records)
+    os.replace(tmp, path)
+    return len(days)
+
+
+class MappedSnapshot:
+    """Read-only view of a snapshot file through mmap."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        fields = HEADER.unpack_from(self._mmap, 0)
+        if fields[0] != MAGIC or fields[1] != FORMAT:
+            raise ValueError(f"{path} is not a format {FORMAT} snapshot")
+        (_, _, extra_count, year_count, self.data_version, self.written_at, self.count,
+         self.run, self.longest, last_day, *counts) = fields
+        self.last_day = None if last_day == NO_DAY else last_day
+        self.mood_counts = dict(zip(range(4), counts))
+
+        self.years = {}
+        for i in range(year_count):
+            year, count = YEAR.unpack_from(self._mmap, HEADER.size + i * YEAR.size)
+            self.years[year] = count
+        moods_offset = HEADER.size + year_count * YEAR.size
+        self.mood_names = dict(MOOD_NAMES)
+        for i in range(extra_count):
+            name = MOOD.unpack_from(self._mmap, moods_offset + i * MOOD.size)[0]
+            self.mood_names[FIRST_EXTRA_CODE + i] = name.rstrip(b"\x00").decode()
+        self.records_offset = moods_offset + extra_count * MOOD.size
+        self.records = memoryview(self._mmap)[self.records_offset:self.records_offset + self.count * RECORD.size]
+
+    def day_at(self, i):
+        return RECORD.unpack_from(self.records, i * RECORD.size)[0]
+
+    def _bisect(self, day):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.day_at(mid) < day:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def iter_records(self, start=None, end=None):
+        """(epoch-day, mood code) pairs in day order, for start <= day < end."""
+        lo = 0 if start is None else self._bisect(start)
+        hi = self.count if end is None else self._bisect(end)
+        return RECORD.iter_unpack(self.records[lo * RECORD.size:hi * RECORD.size])
+
+    def docs(self, start=None, end=None):
+        """Stored-form documents, as returned by a storage backend's scan()."""
+        for day, code in self.iter_records(start, end):
+            yield doc_for_day(day, self.mood_names.get(code, ""))
+
+    def stats(self):
+        return {
+            "data_version": self.data_version,
+            "written_at": self.written_at,
+            "total": self.count,
+            "run": self.run,
+            "longest": self.longest,
+            "last_day": self.last_day,
+            "counts": {MOOD_NAMES.get(code, "other"): n for code, n in self.mood_counts.items()},
+            "other_moods": [self.mood_names[code] for code in sorted(self.mood_names) if code >= FIRST_EXTRA_CODE],
+            "years": self.years
+        }
+
+
+def load_arrays(path):
+    """(days, mood codes) NumPy arrays backed by the file itself, without copying.
+
+    Codes 1-3 follow MOOD_CODES; MappedSnapshot(path).mood_names names the rest.
+    """
+    import numpy as np
+
+    with open(path, "rb") as f:
+        fields = HEADER.unpack(f.read(HEADER.size))
+    if fields[0] != MAGIC or fields[1] != FORMAT:
+        raise ValueError(f"{path} is not a format {FORMAT} snapshot")
+    offset = HEADER.size + fields[3] * YEAR.size + fields[2] * MOOD.size
+    records = np.memmap(path, dtype=np.dtype(NUMPY_DTYPE), mode="r", offset=offset, shape=(fields[6],))
+    return records["day"], records["mood"]
+
+
+class SnapshotEntries:
+    """Entry scans served from a mapped snapshot plus the years changed since it was written.
+
+    The per-year delta is recomputed only when the data version moves, at the
+    cost of one read of the hash-tree nodes; untouched years never hit the
+    backend.
+    """
+
+    def __init__(self, store, path, write_interval=None):
+        self.store = store
+        self.path = path
+        self.write_interval = write_interval
+        self.snapshot = None
+        self._lock = threading.Lock()
+        self._delta = None  # (snapshot, data version, {year: [docs]})
+        self._thread = None
+        self.reload()
+
+    def reload(self):
+        try:
+            snapshot = MappedSnapshot(self.path)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            print(f"Error loading binary snapshot {self.path}: {str(e)}")
+            return False
+        with self._lock:
+            self.snapshot, self._delta = snapshot, None
+        return True
+
+    def write(self):
+        """Write a fresh snapshot from the backend and map it."""
+        version = self.store.data_version()
+        written = write_snapshot(self.path, self.store.scan(), version)
+        self.reload()
+        return written
+
+    def _year_counts(self, years):
+        """Live entry count for each of `years`."""
+        nodes = self.store.hash_nodes()
+        if nodes is None:
+            # Counting an archived year decodes its block, so this is only the fallback
+            return {year: self.store.count(*_year_range(year)) for year in years}
+        counts = dict.fromkeys(years, 0)
+        for month, (_, _, count) in nodes.items():
+            year = int(month[:4])
+            if year in counts:
+                counts[year] += count
+        return counts
+
+    def _changed_years(self, snapshot, version):
+        with self._lock:
+            if self._delta and self._delta[0] is snapshot and self._delta[1] == version:
+                return self._delta[2]
+
+        changed = {}
+        if version != snapshot.data_version:
+            for year, count in self._year_counts(snapshot.years).items():
+                if count != snapshot.years[year]:
+                    changed[year] = list(self.store.scan(*_year_range(year)))
+            # Entries outside the years the snapshot knows about
+            first = min(snapshot.years, default=None)
+            last = max(snapshot.years, default=None)
+            outside = (list(self.store.scan()) if first is None else
+                       list(self.store.scan(None, _year_range(first)[0])) + list(self.store.scan(_year_range(last)[1])))
+            for doc in outside:
+                changed.setdefault(from_epoch_day(entry_day(doc)).year, []).append(doc)
+
+        with self._lock:
+            self._delta = (snapshot, version, changed)
+        return changed
+
+    def scan(self):
+        """All entries in day order, like store.scan()."""
+        self.ensure_writer()
+        snapshot = self.snapshot
+        if snapshot is None:
+            return self.store.scan()
+        changed = self._changed_years(snapshot, self.store.data_version())
+        return self._merge(snapshot, changed)
+
+    def _merge(self, snapshot, changed):
+        years = sorted(set(snapshot.years) | set(changed))
+        for year in years:
+            if year in changed:
+                yield from changed[year]
+            else:
+                yield from snapshot.docs(*_year_range(year))
+
+    def ensure_writer(self):
+        # Started lazily so that forked gunicorn workers each get their own thread
+        if not self.write_interval:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            snapshot = self.snapshot
+            age = time.time() - snapshot.written_at if snapshot else self.write_interval
+            time.sleep(max(self.write_interval - age, 1))
+            try:
+                # Another worker may have written it meanwhile
+                self.reload()
+                snapshot = self.snapshot
+                if snapshot is None or time.time() - snapshot.written_at >= self.write_interval:
+                    self.write()
+            except Exception as e:
+                print(f"Error writing binary snapshot: {str(e)}")
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Binary entry snapshot")
+    parser.add_argument("path")
+    parser.add_argument("--write", action="store_true", help="write a fresh snapshot from the storage backend")
+    parser.add_argument("--info", action="store_true", help="print the snapshot header")
+    args = parser.parse_args()
+    if not (args.write or args.info):
+        parser.error("nothing to do (try --write or --info)")
+
+    if args.write:
+        # Uses the same STORAGE_BACKEND / MONGO_URI / SQLITE_PATH settings as the app
+        from app import store
+
+        print(f"Wrote {write_snapshot(args.path, store.scan(), store.data_version())} entries to {args.path}")
+    if args.info:
+        print(json.dumps(MappedSnapshot(args.path).stats(), indent=2))
@@ -0,0 +1,319 @@
+"""Bitset calendar index over the entries collection.
+
+Each year of history is a 366-bit presence bitmap plus 2-bit packed mood
+codes (138 bytes per year), so streaks, missing days and per-mood counts are
+answered with a handful of big-int word operations instead of sorting and
+walking every entry. The index is persisted in the "calendar_index"
+collection, one small binary document per year, and kept up to date by
+/submit. Rebuild it from scratch with:
+
+    MONGO_URI=... python calendar_index.py
+"""
+import calendar
+import os
+import time
+from datetime import date
+
+from pymongo.errors import DuplicateKeyError
+
+from schema import MOOD_CODES, MOOD_NAMES, entry_day, epoch_day_to_str, from_epoch_day, parse_date_str, to_epoch_day
+
+YEAR_DAYS = 366
+PRESENCE_BYTES = (YEAR_DAYS + 7) // 8
+MOOD_BYTES = (YEAR_DAYS * 2 + 7) // 8
+
+# Low bit of every 2-bit mood slot
+LOW_BITS = int("01" * YEAR_DAYS, 2)
+
+BUILT_MARKER = "built"
+BUILDING_MARKER = "building"
+
+
+def _year_start(year):
+    return to_epoch_day(date(year, 1, 1))
+
+
+class YearIndex:
+    __slots__ = ("year", "presence", "moods")
+
+    def __init__(self, year, presence=0, moods=0):
+        self.year = year
+        self.presence = presence
+        self.moods = moods
+
+    def set_day(self, doy, code):
+        self.presence |= 1 << doy
+        shift = doy * 2
+        self.moods = (self.moods & ~(0b11 << shift)) | ((code & 0b11) << shift)
+
+    def mood_counts(self):
+        low = self.moods & LOW_BITS
+        high = (self.moods >> 1) & LOW_BITS
+        return {
+            MOOD_NAMES[1]: (low & ~high).bit_count(),
+            MOOD_NAMES[2]: (high & ~low).bit_count(),
+            MOOD_NAMES[3]: (low & high).bit_count(),
+        }
+
+    def to_doc(self):
+        return {
+            "_id": self.year,
+            "presence": self.presence.to_bytes(PRESENCE_BYTES, "little"),
+            "moods": self.moods.to_bytes(MOOD_BYTES, "little"),
+        }
+
+    @classmethod
+    def from_doc(cls, doc):
+        return cls(
+            doc["_id"],
+            int.from_bytes(doc["presence"], "little"),
+            int.from_bytes(doc["moods"], "little"),
+        )
+
+
+class CalendarIndex:
+    def __init__(self, years=None):
+        self.years = years or {}
+        self._combined = None
+
+    @classmethod
+    def from_docs(cls, docs):
+        """Build from stored entry documents in either schema."""
+        index = cls()
+        for doc in docs:
+            mood = MOOD_CODES.get(doc["mood"], 0) if "mood" in doc else doc.get("m", 0)
+            index.add(entry_day(doc), mood)
+        return index
+
+    @classmethod
+    def from_entries(cls, entries):
+        """Build from the {"date": "YYYY-MM-DD", "mood": str} form served by /data."""
+        index = cls()
+        for entry in entries:
+            index.add(to_epoch_day(parse_date_str(entry["date"])), MOOD_CODES.get(entry["mood"], 0))
+        return index
+
+    def add(self, day, code):
+        year = from_epoch_day(day).year
+        year_index = self.years.get(year)
+        if year_index is None:
+            year_index = self.years[year] = YearIndex(year)
+        year_index.set_day(day - _year_start(year), code)
+        self._combined = None
+
+    def _bitmap(self):
+        # All years as one bitmap, bit 0 being January 1st of the first year.
+        # Non-leap years leave bit 365 clear, so OR-ing the next year over it is safe.
+        if self._combined is None:
+            if not self.years:
+                self._combined = (0, 0)
+            else:
+                base = _year_start(min(self.years))
+                bitmap = 0
+                for year, year_index in self.years.items():
+                    bitmap |= year_index.presence << (_year_start(year) - base)
+                self._combined = (base, bitmap)
+        return self._combined
+
+    def current_streak(self):
+        """Consecutive days ending at the newest entry, whatever today is (streaks.py handles expiry)."""
+        _, bitmap = self._bitmap()
+        if not bitmap:
+            return 0
+        newest = bitmap.bit_length() - 1
+        gaps = ~bitmap & ((1 << (newest + 1)) - 1)
+        if not gaps:
+            return newest + 1
+        return newest - (gaps.bit_length() - 1)
+
+    def longest_streak(self):
+        _, bitmap = self._bitmap()
+        longest = 0
+        # Each step clears the last day of every run, so the loop count is the longest run
+        while bitmap:
+            bitmap &= bitmap >> 1
+            longest += 1
+        return longest
+
+    def missing_days(self, year, month, until=None):
+        """Dates in the month with no entry, up to and including `until` if given."""
+        first = date(year, month, 1)
+        days = calendar.monthrange(year, month)[1]
+        if until is not None:
+            if until < first:
+                return []
+            if until.year == year and until.month == month:
+                days = until.day
+
+        start = to_epoch_day(first)
+        year_index = self.years.get(year)
+        presence = year_index.presence if year_index else 0
+        window = presence >> (start - _year_start(year))
+        gaps = ~window & ((1 << days) - 1)
+
+        missing = []
+        while gaps:
+            low = gaps & -gaps
+            missing.append(epoch_day_to_str(start + low.bit_length() - 1))
+            gaps ^= low
+        return missing
+
+    def mood_counts(self):
+        counts = {mood: 0 for mood in MOOD_CODES}
+        for year_index in self.years.values():
+            for mood, count in year_index.mood_counts().items():
+                counts[mood] += count
+        return counts
+
+    def total(self):
+        return sum(year_index.presence.bit_count() for year_index in self.years.values())
+
+
+class CalendarIndexStore:
+    """Persists a CalendarIndex as one binary document per year.
+
+    A build first claims a lease document, so concurrent first requests do
+    not race each other: one request builds, the rest answer from a scan of
+    the entries until the built marker exists. record() keeps writing while
+    a build runs, and the build merges its years into whatever record()
+    wrote meanwhile, so entries inserted during a build are never lost.
+    """
+
+    def __init__(self, collection, max_retries=5, build_lease=300):
+        self.collection = collection
+        self.max_retries = max_retries
+        # Seconds before an abandoned build (a crashed worker) can be taken over
+        self.build_lease = build_lease
+
+    def is_built(self):
+        return self.collection.find_one({"_id": BUILT_MARKER}, {"_id": 1}) is not None
+
+    def is_live(self):
+        """True once record() must keep the index current: built, or being built."""
+        return self.collection.find_one({"_id": {"$in": [BUILT_MARKER, BUILDING_MARKER]}}, {"_id": 1}) is not None
+
+    def claim_build(self, now=None):
+        """Take the build lease; False if another live build holds it."""
+        now = time.time() if now is None else now
+        lease = {"_id": BUILDING_MARKER, "until": now + self.build_lease}
+        try:
+            self.collection.insert_one(lease)
+            return True
+        except DuplicateKeyError:
+            pass
+        # An expired lease can be taken over, by one claimant only
+        return self.collection.find_one_and_replace({"_id": BUILDING_MARKER, "until": {"$lt": now}}, lease) is not None
+
+    def load(self, entry_docs=None):
+        """Load the persisted index, building it first if it does not exist yet.
+
+        `entry_docs` is a callable returning every stored entry document; it
+        is only called when the index is not built. While another request
+        holds the build lease, the index is computed from it without saving.
+        """
+        docs = list(self.collection.find({}))
+        built = any(doc["_id"] == BUILT_MARKER for doc in docs)
+        if not built:
+            if entry_docs is None:
+                return None
+            if self.claim_build():
+                return self.rebuild(entry_docs, claimed=True)
+            return CalendarIndex.from_docs(entry_docs())
+        return CalendarIndex({
+            doc["_id"]: YearIndex.from_doc(doc) for doc in docs if isinstance(doc["_id"], int)
+        })
+
+    def _update_year(self, year, change):
+        """Apply change(year_index) to one year document with optimistic concurrency.
+
+        A per-year version counter means parallel writers retry instead of
+        overwriting each other's bits.
+        """
+        for _ in range(self.max_retries):
+            doc = self.collection.find_one({"_id": year})
+            year_index = YearIndex.from_doc(doc) if doc else YearIndex(year)
+            version = doc.get("v", 0) if doc else 0
+            change(year_index)
+
+            new_doc = year_index.to_doc()
+            new_doc["v"] = version + 1
+            if doc is None:
+                try:
+                    self.collection.insert_one(new_doc)
+                    return
+                except DuplicateKeyError:
+                    continue
+            elif self.collection.replace_one({"_id": year, "v": version}, new_doc).matched_count:
+                return
+        raise RuntimeError(f"Could not update calendar index for {year} after {self.max_retries} attempts")
+
+    def record(self, date_obj, mood):
+        """Mark a newly inserted entry in its year document.
+
+        Skipped while the index neither exists nor is being built; the first
+        build picks the entry up from the collection.
+        """
+        if not self.is_live():
+            return False
+
+        day = to_epoch_day(date_obj)
+        year = from_epoch_day(day).year
+        self._update_year(year, lambda year_index: year_index.set_day(day - _year_start(year), MOOD_CODES.get(mood, 0)))
+        return True
+
+    def save_year(self, year_index):
+        """Overwrite one year's document, e.g. from a partitioned rebuild (see rebuild.py)."""
+        self.collection.replace_one({"_id": year_index.year}, dict(year_index.to_doc(), v=0), upsert=True)
+
+    def finish_rebuild(self, years):
+        """Drop years no longer in `years` and mark the index built."""
+        self.collection.delete_many({"_id": {"$nin": list(years) + [BUILT_MARKER]}})
+        self.collection.replace_one({"_id": BUILT_MARKER}, {"_id": BUILT_MARKER}, upsert=True)
+
+    def rebuild(self, entry_docs, claimed=False):
+        """Rebuild from `entry_docs()` (a callable, read after the old years are cleared).
+
+        Takes the build lease unless `claimed` says the caller already holds
+        it (see claim_build), and releases it at the end. Raises RuntimeError
+        while another build holds the lease.
+        """
+        if not claimed and not self.claim_build():
+            raise RuntimeError("Another calendar index build is running")
+        try:
+            self.collection.delete_many({"_id": {"$nin": [BUILDING_MARKER]}})
+            # From here on record() writes into the fresh documents, and every
+            # entry inserted before this point is in the scan
+            index = CalendarIndex.from_docs(entry_docs())
+            for year, built in index.years.items():
+                # Entries are insert-only, so a day set by both sides has the same mood
+                def merge(year_index, built=built):
+                    year_index.presence |= built.presence
+                    year_index.moods |= built.moods
+                self._update_year(year, merge)
+            self.collection.replace_one({"_id": BUILT_MARKER}, {"_id": BUILT_MARKER}, upsert=True)
+        finally:
+            self.collection.delete_one({"_id": BUILDING_MARKER})
+        return self.load()
+
+
+if __name__ == "__main__":
+    from itertools import chain
+
+    from pymongo import MongoClient
+
+    from archive import ArchiveTier
+
+    mongo_uri = os.environ.get("MONGO_URI")
+    if not mongo_uri:
+        raise SystemExit("MONGO_URI is not set. Please set it as an environment variable.")
+
+    db = MongoClient(mongo_uri)[os.getenv("MONGO_DB", "streakflow")]
+    calendar_store = CalendarIndexStore(db["calendar_index"])
+    if not calendar_store.claim_build():
+        raise SystemExit("Another calendar index build is running; try again once it finishes.")
+
+    def entry_docs():
+        return chain(ArchiveTier(db["entries"], db["archive"]).iter_docs(), db["entries"].find({}, {"_id": 0}))
+
+    index = calendar_store.rebuild(entry_docs, claimed=True)
+    print(f"Rebuilt calendar index: {len(index.years)} years, {index.total()} days")
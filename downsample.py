@@ -0,0 +1,75 @@
+"""Server-side downsampling for long-range chart series.
+
+Both reducers take (x, y) points sorted by x and return at most `threshold`
+points, so the client can plot years of history without downloading every
+entry.
+"""
+
+
+def lttb(points, threshold):
+    """Largest-Triangle-Three-Buckets.
+
+    Keeps the first and last points and, from each bucket in between, the
+    point forming the largest triangle with the previously kept point and the
+    average of the next bucket. Preserves the visual shape (peaks and dips)
+    far better than plain averaging.
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third vertex of the triangle
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        next_count = next_end - next_start
+        avg_x = sum(points[j][0] for j in range(next_start, next_end)) / next_count
+        avg_y = sum(points[j][1] for j in range(next_start, next_end)) / next_count
+
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        ax, ay = points[a]
+
+        max_area = -1
+        max_index = start
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                max_index = j
+
+        sampled.append(points[max_index])
+        a = max_index
+
+    sampled.append(points[-1])
+    return sampled
+
+
+def bucket_average(points, threshold):
+    """Average x and y over `threshold` equal-count buckets."""
+    n = len(points)
+    if threshold >= n or threshold < 1:
+        return list(points)
+
+    bucket_size = n / threshold
+    sampled = []
+    for i in range(threshold):
+        start = int(i * bucket_size)
+        end = int((i + 1) * bucket_size)
+        bucket = points[start:end]
+        sampled.append((
+            sum(p[0] for p in bucket) / len(bucket),
+            sum(p[1] for p in bucket) / len(bucket)
+        ))
+    return sampled
+
+
+METHODS = {
+    "lttb": lttb,
+    "average": bucket_average,
+}
@@ -0,0 +1,150 @@
+"""Edge (CDN) caching and response compression.
+
+Cacheable responses get a Cache-Control header that lets shared caches keep
+them for `s_maxage` seconds and then serve them stale for up to
+`stale_while_revalidate` more while one request refreshes them in the
+background. Browsers always revalidate (max-age=0), so a user never sees
+their own write hidden behind a browser cache. Vercel's edge honours these
+directives as they are.
+
+Cacheable responses vary on Cookie, and the app marks responses private for
+a client carrying its recent-write cookie, so right after a write that
+client reads from the origin rather than from an edge copy.
+
+Each cached response is also tagged with surrogate keys naming what it
+depends on (e.g. "entries" and "streak"). Writes then purge by key through a
+pluggable purger instead of waiting for the TTL or purging everything:
+
+    WebhookPurger   POSTs {"keys": [...]} to a URL (a CDN API proxy, a
+                    deploy hook, or a local stub in tests)
+    FastlyPurger    Fastly's surrogate-key purge API
+    MemoryPurger    records purged keys, for tests
+
+A refresh right after a purge may still read a lagging secondary; s_maxage
+bounds how long such a response can be served.
+
+JSON and HTML bodies above `min_size` bytes are compressed with brotli
+(when the brotli package is installed) or gzip, per Accept-Encoding.
+"""
+import gzip
+
+import requests
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "text/html", "application/javascript", "text/plain")
+
+
+class WebhookPurger:
+    def __init__(self, url, token=None, timeout=5):
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+
+    def __call__(self, keys):
+        headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+        response = requests.post(self.url, json={"keys": keys}, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class FastlyPurger:
+    def __init__(self, service_id, token, soft=True, timeout=5):
+        self.url = f"https://api.fastly.com/service/{service_id}/purge"
+        self.token = token
+        # Soft purges mark content stale, so stale-while-revalidate still applies
+        self.soft = soft
+        self.timeout = timeout
+
+    def __call__(self, keys):
+        headers = {"Fastly-Key": self.token, "Surrogate-Key": " ".join(keys)}
+        if self.soft:
+            headers["Fastly-Soft-Purge"] = "1"
+        response = requests.post(self.url, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class MemoryPurger:
+    def __init__(self):
+        self.purged = []
+
+    def __call__(self, keys):
+        self.purged.append(list(keys))
+
+
+class EdgeCache:
+    def __init__(self, s_maxage=60, stale_while_revalidate=300, key_header="Surrogate-Key", purger=None):
+        self.s_maxage = s_maxage
+        self.stale_while_revalidate = stale_while_revalidate
+        # "Surrogate-Key" for Fastly, "Cache-Tag" for Cloudflare, etc.
+        self.key_header = key_header
+        self.purger = purger
+        self.purges = 0
+        self.purge_errors = 0
+
+    def cache_control(self):
+        return (f"public, max-age=0, s-maxage={self.s_maxage}, "
+                f"stale-while-revalidate={self.stale_while_revalidate}")
+
+    def mark(self, response, keys):
+        """Make a successful response cacheable at the edge, tagged with `keys`."""
+        # Errors and responses that set cookies are per-request, never shared
+        if response.status_code != 200 or "Set-Cookie" in response.headers:
+            return response
+        response.headers["Cache-Control"] = self.cache_control()
+        response.vary.add("Cookie")
+        if self.key_header:
+            response.headers[self.key_header] = " ".join(keys)
+        return response
+
+    def mark_private(self, response):
+        """Keep a response out of shared caches, e.g. one a client reads right after its own write."""
+        response.headers["Cache-Control"] = "private, max-age=0"
+        response.vary.add("Cookie")
+        return response
+
+    def purge(self, keys):
+        """Purge cached responses tagged with any of `keys`; failures are logged, not raised."""
+        if self.purger is None:
+            return False
+        try:
+            self.purger(list(keys))
+            self.purges += 1
+            return True
+        except Exception as e:
+            self.purge_errors += 1
+            print(f"Error purging edge cache keys {', '.join(keys)}: {str(e)}")
+            return False
+
+
+def best_encoding(accept_encodings):
+    """'br', 'gzip' or None, from a werkzeug Accept-Encoding header."""
+    if brotli is not None and accept_encodings["br"]:
+        return "br"
+    if accept_encodings["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress_response(response, accept_encodings, min_size=1024, gzip_level=6, brotli_quality=5):
+    """Compress a buffered response body in place when it is worth it."""
+    if (response.is_streamed or response.direct_passthrough or response.status_code < 200
+            or response.status_code in (204, 304) or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = best_encoding(accept_encodings)
+    body = response.get_data()
+    if encoding is None or len(body) < min_size:
+        return response
+
+    if encoding == "br":
+        compressed = brotli.compress(body, quality=brotli_quality)
+    else:
+        compressed = gzip.compress(body, compresslevel=gzip_level)
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    return response
@@ -0,0 +1,168 @@
+"""Group-commit batching for /submit writes.
+
+Submissions that arrive within a short window are merged into one unordered
+bulk_write, so a burst of entries pays a single Mongo round trip instead of a
+find_one + insert_one pair per request. Every caller still gets its own
+result back, including the "entry already exists" case.
+
+Each write is a $setOnInsert upsert on the day. The unique day indexes
+(storage.ensure_entry_indexes, created by MongoStore before its first write)
+turn a race with another worker into a duplicate-key error, which is
+reported as an existing entry, so a day never gets two entries.
+
+A caller waits at most `timeout` seconds for its batch and then gets
+GroupCommitTimeout. The write may still commit after that, so a write
+that lands after its caller gave up is handed to `on_late_commit`, which
+runs the side effects the request could not run.
+"""
+import threading
+import time
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from schema import encode_entry, entry_filter
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class GroupCommitTimeout(Exception):
+    pass
+
+
+class _PendingWrite:
+    def __init__(self, date_obj, mood):
+        self.date_obj = date_obj
+        self.mood = mood
+        self.inserted = None
+        self.error = None
+        # Set when the caller stopped waiting before the batch finished
+        self.abandoned = False
+        self.done = threading.Event()
+
+
+class GroupCommitter:
+    def __init__(self, collection, window_ms=3, max_batch=256, write_concern=None, compact=False,
+                 timeout=90, on_late_commit=None):
+        if write_concern is not None:
+            collection = collection.with_options(write_concern=write_concern)
+        self.collection = collection
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.compact = compact
+        self.timeout = timeout
+        self.on_late_commit = on_late_commit
+        self._cond = threading.Condition()
+        self._pending = []
+        self._thread = None
+
+    def submit(self, date_obj, mood):
+        """Queue an entry and block until the batch holding it is committed.
+
+        Returns True if the entry was inserted and False if an entry already
+        existed for that date. Raises GroupCommitTimeout after `timeout`
+        seconds; the entry may still be saved later (see on_late_commit).
+        """
+        write = _PendingWrite(date_obj, mood)
+        with self._cond:
+            self._ensure_flusher()
+            self._pending.append(write)
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+                self._cond.notify()
+
+        if not write.done.wait(self.timeout):
+            with self._cond:
+                # The flusher marks writes done under the same lock, so exactly one side wins
+                write.abandoned = not write.done.is_set()
+            if write.abandoned:
+                raise GroupCommitTimeout(f"Write for {write.date_obj:%Y-%m-%d} not committed within {self.timeout}s")
+        if write.error is not None:
+            raise write.error
+        return write.inserted
+
+    def _ensure_flusher(self):
+        # Started lazily so that forked gunicorn workers each get their own thread
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+
+                # Hold the batch open for one window, or until it is full
+                deadline = time.monotonic() + self.window
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+
+            try:
+                self._commit(batch)
+            except Exception as e:
+                # Never leave a caller waiting on a batch that will not finish
+                for write in batch:
+                    if write.inserted is None and write.error is None:
+                        write.error = e
+            self._finish(batch)
+
+    def _finish(self, batch):
+        with self._cond:
+            for write in batch:
+                write.done.set()
+            late = [write for write in batch if write.abandoned and write.inserted]
+        for write in late if self.on_late_commit else []:
+            try:
+                self.on_late_commit(write.date_obj, write.mood)
+            except Exception as e:
+                print(f"Error finishing late group-commit write for {write.date_obj:%Y-%m-%d}: {str(e)}")
+
+    def _commit(self, batch):
+        # Only the first submission for a date goes to Mongo; the rest of the
+        # batch sees it as an existing entry, just like sequential requests would
+        writes = []
+        seen = set()
+        for write in batch:
+            if write.date_obj in seen:
+                write.inserted = False
+            else:
+                seen.add(write.date_obj)
+                writes.append(write)
+
+        ops = [
+            UpdateOne(
+                entry_filter(w.date_obj),
+                {"$setOnInsert": encode_entry(w.date_obj, w.mood, self.compact)},
+                upsert=True
+            )
+            for w in writes
+        ]
+
+        try:
+            result = self.collection.bulk_write(ops, ordered=False)
+            upserted = set(result.upserted_ids)
+            errors = {}
+        except BulkWriteError as e:
+            upserted = {u["index"] for u in e.details.get("upserted", [])}
+            errors = {err["index"]: err for err in e.details.get("writeErrors", [])}
+        except Exception as e:
+            upserted = set()
+            errors = {i: e for i in range(len(writes))}
+
+        for i, write in enumerate(writes):
+            err = errors.get(i)
+            if err is None:
+                write.inserted = i in upserted
+            elif isinstance(err, dict) and err.get("code") == DUPLICATE_KEY_ERROR:
+                # Lost an upsert race against another writer
+                write.inserted = False
+            elif isinstance(err, dict):
+                write.error = RuntimeError(err.get("errmsg", "Bulk write failed"))
+            else:
+                write.error = err
@@ -0,0 +1,139 @@
+"""Multi-habit tracking on top of the metrics series in storage.py.
+
+Every habit is a (habit, date, value) time series stored together, indexed
+by (day, habit), so the dashboard fetches every habit for a date window in
+one range scan however many habits there are. Per-habit streaks and stats
+come from a single pass over the whole series and are cached by the app
+per data version, so adding a habit adds rows, not queries.
+
+A habit definition says what a value is and which days count towards its
+streak:
+
+    boolean   done or not; a day counts when the value is 1
+    number    e.g. sleep hours; a day counts when value >= goal (or is logged
+              at all if there is no goal)
+    scale     the mood score, 1 (sad) to 3 (happy); any logged day counts
+
+Mood is written here too (as its score) whenever a mood entry is inserted,
+so it appears alongside the other habits. Copy existing moods over once with
+
+    python habits.py --backfill-mood
+"""
+import json
+
+from schema import MOOD_CODES, decode_entry, epoch_day_to_datetime, epoch_day_to_str
+
+DEFAULT_HABITS = {
+    "mood": {"kind": "scale", "min": 1, "max": 3},
+    "exercise": {"kind": "boolean"},
+    "sleep": {"kind": "number", "min": 0, "max": 24, "goal": 7, "unit": "hours"},
+}
+
+KINDS = ("boolean", "number", "scale")
+
+
+def load_habits(overrides=None):
+    """Default habits updated with a JSON object of overrides, e.g. HABITS='{"water": {"kind": "number", "goal": 8}}'."""
+    habits = {name: dict(definition) for name, definition in DEFAULT_HABITS.items()}
+    for name, definition in json.loads(overrides or "{}").items():
+        if definition is None:
+            habits.pop(name, None)
+            continue
+        if definition.get("kind") not in KINDS:
+            raise ValueError(f"Habit {name!r} needs a kind: one of {', '.join(KINDS)}")
+        habits[name] = definition
+    return habits
+
+
+def parse_value(definition, value):
+    """Validate a submitted value for a habit, returning it as a number."""
+    if definition["kind"] == "boolean":
+        if value in (True, False, 0, 1):
+            return 1 if value else 0
+        raise ValueError("Value must be true or false")
+
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError("Value must be a number")
+    if "min" in definition and value < definition["min"]:
+        raise ValueError(f"Value must be at least {definition['min']}")
+    if "max" in definition and value > definition["max"]:
+        raise ValueError(f"Value must be at most {definition['max']}")
+    return value
+
+
+def counts_towards_streak(definition, value):
+    if definition["kind"] == "boolean":
+        return bool(value)
+    if definition.get("goal") is not None:
+        return value >= definition["goal"]
+    return True
+
+
+def habit_stats(rows, habits):
+    """Streaks and stats for every habit from one pass over (day, habit, value) rows in day order.
+
+    The current streak is the run of qualifying days ending at the habit's
+    newest qualifying day, computed like runs_from_days in streaks.py.
+    """
+    stats = {
+        name: {"logged": 0, "total": 0, "streak": 0, "longest_streak": 0,
+               "last_date": None, "last_value": None, "_last_day": None}
+        for name in habits
+    }
+    for day, habit, value in rows:
+        definition = habits.get(habit)
+        if definition is None:
+            continue
+        s = stats[habit]
+        s["logged"] += 1
+        s["total"] += value
+        s["last_date"] = epoch_day_to_str(day)
+        s["last_value"] = value
+        if counts_towards_streak(definition, value):
+            s["streak"] = s["streak"] + 1 if s["_last_day"] == day - 1 else 1
+            s["longest_streak"] = max(s["longest_streak"], s["streak"])
+            s["_last_day"] = day
+
+    for s in stats.values():
+        s["average"] = round(s["total"] / s["logged"], 2) if s["logged"] else None
+        s["streak_end"] = epoch_day_to_str(s["_last_day"]) if s["_last_day"] is not None else None
+        del s["total"], s["_last_day"]
+    return stats
+
+
+def window_by_day(rows):
+    """Group (day, habit, value) rows into [{"date", "values": {habit: value}}] in day order."""
+    days = []
+    for day, habit, value in rows:
+        if not days or days[-1]["_day"] != day:
+            days.append({"_day": day, "date": epoch_day_to_str(day), "values": {}})
+        days[-1]["values"][habit] = value
+    for entry in days:
+        del entry["_day"]
+    return days
+
+
+def mood_rows(entry_docs):
+    """("mood", date, score) rows for stored mood entries with a score."""
+    for doc in entry_docs:
+        entry = decode_entry(doc)
+        if entry["mood"] in MOOD_CODES:
+            yield "mood", epoch_day_to_datetime(doc["d"]) if "d" in doc else doc["date"], MOOD_CODES[entry["mood"]]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Habit metrics maintenance")
+    parser.add_argument("--backfill-mood", action="store_true", help="copy existing mood entries into the habit series")
+    args = parser.parse_args()
+    if not args.backfill_mood:
+        parser.error("nothing to do (try --backfill-mood)")
+
+    # Uses the same STORAGE_BACKEND / MONGO_URI / SQLITE_PATH settings as the app
+    from app import store
+
+    rows = list(mood_rows(store.scan()))
+    store.set_metrics(rows)
+    store.bump_data_version()
+    print(f"Copied {len(rows)} mood entries into the habit series")
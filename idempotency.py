@@ -0,0 +1,206 @@
+"""Idempotency keys for retried writes.
+
+A client that sends an `Idempotency-Key` header with /submit gets the
+first outcome for that key back on every retry, without the write or the
+Google Sheets call running again. Records live in the app's own database
+(an `idempotency` collection in MongoDB, a table in SQLite, or a dict for
+the memory backend), so a retry that lands on another worker or serverless
+instance still sees them.
+
+The first request for a key claims it with a short lease. A duplicate that
+arrives while the original is still running polls until the original
+finishes, and then replays its response. If the original dies, its lease
+expires and the next attempt takes the key over. Responses are kept for
+`ttl` seconds. Server errors (5xx) are not kept, so a failed attempt can be
+retried for real. Reusing a key for a different request body is rejected.
+"""
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timezone
+
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+from storage import sqlite_connect
+
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(method, path, body):
+    return hashlib.sha256(f"{method} {path}\n".encode() + (body or b"")).hexdigest()
+
+
+class MongoIdempotencyStore:
+    def __init__(self, collection):
+        self.collection = collection
+        self._indexed = False
+
+    def claim(self, key, fingerprint, now, lease_seconds, ttl):
+        """Claim `key` for this request; returns None if claimed, else the existing record."""
+        if not self._indexed:
+            # MongoDB drops expired records by itself; claim() also ignores them until then
+            self.collection.create_index([("expires", ASCENDING)], name="expires_ttl", expireAfterSeconds=0)
+            self._indexed = True
+
+        record = {"_id": key, "fingerprint": fingerprint, "status": "pending", "lease_until": now + lease_seconds,
+                  "expires_at": now + ttl, "expires": datetime.fromtimestamp(now + ttl, timezone.utc), "response": None}
+        try:
+            self.collection.insert_one(record)
+            return None
+        except DuplicateKeyError:
+            pass
+
+        # An expired record or an abandoned lease can be taken over, by one request only
+        taken = self.collection.find_one_and_replace(
+            {"_id": key, "$or": [{"expires_at": {"$lt": now}},
+                                 {"status": "pending", "lease_until": {"$lt": now}}]},
+            record
+        )
+        if taken is not None:
+            return None
+        return self.collection.find_one({"_id": key})
+
+    def get(self, key):
+        return self.collection.find_one({"_id": key})
+
+    def complete(self, key, response, now, ttl):
+        self.collection.update_one(
+            {"_id": key},
+            {"$set": {"status": "done", "response": response, "lease_until": None,
+                      "expires_at": now + ttl, "expires": datetime.fromtimestamp(now + ttl, timezone.utc)}}
+        )
+
+    def release(self, key):
+        self.collection.delete_one({"_id": key, "status": "pending"})
+
+
+class SQLiteIdempotencyStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS idempotency ("
+                "key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, status TEXT NOT NULL, "
+                "lease_until REAL, expires_at REAL NOT NULL, response TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idempotency_expires ON idempotency (expires_at)")
+
+    def _conn(self):
+        return sqlite_connect(self.path, self._local)
+
+    def _row_to_record(self, row):
+        if row is None:
+            return None
+        key, fingerprint, status, lease_until, expires_at, response = row
+        return {"_id": key, "fingerprint": fingerprint, "status": status, "lease_until": lease_until,
+                "expires_at": expires_at, "response": json.loads(response) if response else None}
+
+    def claim(self, key, fingerprint, now, lease_seconds, ttl):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM idempotency WHERE expires_at < ?", (now,))
+            cursor = conn.execute(
+                "INSERT INTO idempotency (key, fingerprint, status, lease_until, expires_at) "
+                "VALUES (?, ?, 'pending', ?, ?) ON CONFLICT(key) DO UPDATE SET "
+                "fingerprint = excluded.fingerprint, lease_until = excluded.lease_until, "
+                "expires_at = excluded.expires_at, response = NULL "
+                "WHERE status = 'pending' AND lease_until < ?",
+                (key, fingerprint, now + lease_seconds, now + ttl, now)
+            )
+        if cursor.rowcount == 1:
+            return None
+        return self.get(key)
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT key, fingerprint, status, lease_until, expires_at, response FROM idempotency WHERE key = ?", (key,)
+        ).fetchone()
+        return self._row_to_record(row)
+
+    def complete(self, key, response, now, ttl):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "UPDATE idempotency SET status = 'done', response = ?, lease_until = NULL, expires_at = ? WHERE key = ?",
+                (json.dumps(response), now + ttl, key)
+            )
+
+    def release(self, key):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM idempotency WHERE key = ? AND status = 'pending'", (key,))
+
+
+class MemoryIdempotencyStore:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records = {}
+
+    def claim(self, key, fingerprint, now, lease_seconds, ttl):
+        with self.lock:
+            record = self.records.get(key)
+            if record is None or record["expires_at"] < now or (record["status"] == "pending" and record["lease_until"] < now):
+                self.records[key] = {"_id": key, "fingerprint": fingerprint, "status": "pending",
+                                     "lease_until": now + lease_seconds, "expires_at": now + ttl, "response": None}
+                return None
+            return dict(record)
+
+    def get(self, key):
+        with self.lock:
+            record = self.records.get(key)
+            return dict(record) if record else None
+
+    def complete(self, key, response, now, ttl):
+        with self.lock:
+            if key in self.records:
+                self.records[key].update(status="done", response=response, lease_until=None, expires_at=now + ttl)
+
+    def release(self, key):
+        with self.lock:
+            if self.records.get(key, {}).get("status") == "pending":
+                del self.records[key]
+
+
+class IdempotencyCache:
+    def __init__(self, store, ttl=86400, lease_seconds=30, wait_timeout=15, poll_interval=0.05):
+        self.store = store
+        self.ttl = ttl
+        # Longer than the slowest request it guards, or a live request loses its key
+        self.lease_seconds = lease_seconds
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+
+    def begin(self, key, fingerprint):
+        """Decide what to do with a keyed request.
+
+        Returns ("run", None) when this request owns the key and must run,
+        ("replay", response) with the stored first outcome, ("mismatch",
+        None) when the key was used for a different request, or ("busy",
+        None) when the original is still running after wait_timeout.
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            record = self.store.claim(key, fingerprint, time.time(), self.lease_seconds, self.ttl)
+            if record is None:
+                return "run", None
+            if record["fingerprint"] != fingerprint:
+                return "mismatch", None
+            if record["status"] == "done":
+                return "replay", record["response"]
+            if time.monotonic() >= deadline:
+                return "busy", None
+            time.sleep(self.poll_interval)
+
+    def complete(self, key, status_code, body, mimetype):
+        """Keep the outcome for replay, or give the key back after a server error."""
+        if status_code >= 500:
+            self.store.release(key)
+            return
+        self.store.complete(key, {"status": status_code, "body": body, "mimetype": mimetype}, time.time(), self.ttl)
+
+    def release(self, key):
+        self.store.release(key)
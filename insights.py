@@ -0,0 +1,180 @@
+"""Dashboard insights from declarative rules over incrementally kept aggregates.
+
+Each rule names the windows it reads (the last N entries) and a function
+that turns those aggregates, the entry total and the current streak into
+an insight or None. The engine keeps one set of mood counts per window
+that any rule declares. It updates them in O(windows) when an entry is
+appended after the newest one, so evaluating every rule never touches
+the entries themselves. A backdated entry changes which entries fall in
+each window, so the caller rebuilds from the full list instead.
+
+The engine also follows the run of consecutive days ending at the newest
+entry, so the streak the rules see always comes from the same entries as
+the aggregates, whichever source (Google Sheets or the backend) they were
+loaded from.
+
+The rules are ports of the generateInsights function that used to run in
+the page script, and they produce the same text.
+"""
+import threading
+from collections import deque
+
+from schema import parse_date_str, to_epoch_day
+from streaks import evaluate
+
+MOOD_EMOJIS = {"happy": "😊", "neutral": "😐", "sad": "😞"}
+
+
+def _counts():
+    return {mood: 0 for mood in MOOD_EMOJIS}
+
+
+def long_streak(aggregates, streak):
+    if streak >= 7:
+        return {
+            "icon": "fas fa-fire",
+            "text": f"Amazing! You've maintained a {streak}-day streak. Keep up the excellent work!",
+            "type": "success"
+        }
+
+
+def recent_happiness(aggregates, streak):
+    happy = aggregates["windows"][7]["happy"]
+    if happy >= 5:
+        return {
+            "icon": "fas fa-sun",
+            "text": f"You've been feeling great lately! {happy} happy days in the last week.",
+            "type": "positive"
+        }
+    if happy <= 2:
+        return {
+            "icon": "fas fa-heart",
+            "text": "Remember to take care of yourself. Consider activities that bring you joy.",
+            "type": "care"
+        }
+
+
+def dominant_mood(aggregates, streak):
+    if aggregates["total"] < 30:
+        return None
+    counts = aggregates["windows"][30]
+    # Same tie-breaking as the page script's reduce: a later mood wins a tie
+    dominant = None
+    for mood in counts:
+        if dominant is None or not counts[dominant] > counts[mood]:
+            dominant = mood
+    return {
+        "icon": "fas fa-chart-pie",
+        "text": f"Over the last 30 days, your most common mood has been {dominant}. {MOOD_EMOJIS[dominant]}",
+        "type": "analysis"
+    }
+
+
+# Evaluated in order; each declares the entry windows it reads
+RULES = [
+    {"id": "long-streak", "windows": (), "evaluate": long_streak},
+    {"id": "recent-happiness", "windows": (7,), "evaluate": recent_happiness},
+    {"id": "dominant-mood", "windows": (30,), "evaluate": dominant_mood},
+]
+
+
+def _trailing_run(entries):
+    """(run ending at the newest entry, its epoch-day) for entries in date order; O(run)."""
+    run = 0
+    newest = previous = None
+    for entry in reversed(entries):
+        day = to_epoch_day(parse_date_str(entry["date"]))
+        if previous is None:
+            newest = day
+        elif day == previous:
+            continue
+        elif day != previous - 1:
+            break
+        run += 1
+        previous = day
+    return run, newest
+
+
+class InsightEngine:
+    def __init__(self, rules=RULES):
+        self.rules = rules
+        self.windows = sorted({size for rule in rules for size in rule["windows"]})
+        self.lock = threading.Lock()
+        # Data version the aggregates reflect (None = must rebuild); maintained by the caller
+        self.version = None
+        self.built_at = 0
+        self._reset()
+
+    def _reset(self):
+        self.total = 0
+        self.newest = None
+        # Run of consecutive days ending at the newest entry's epoch-day
+        self.run = 0
+        self.newest_day = None
+        # Moods of the last max(window) entries, oldest first
+        self.recent = deque(maxlen=max(self.windows, default=0))
+        self.window_counts = {size: _counts() for size in self.windows}
+
+    def _append(self, date_str, mood):
+        # The entry leaving each window is the one `size` places back from the end
+        for size, counts in self.window_counts.items():
+            if len(self.recent) >= size:
+                leaving = self.recent[-size]
+                if leaving in counts:
+                    counts[leaving] -= 1
+            if mood in counts:
+                counts[mood] += 1
+        if self.recent.maxlen:
+            self.recent.append(mood)
+        day = to_epoch_day(parse_date_str(date_str))
+        self.run = self.run + 1 if self.newest_day is not None and day == self.newest_day + 1 else 1
+        self.total += 1
+        self.newest = date_str
+        self.newest_day = day
+
+    def rebuild(self, entries, version=None, built_at=0):
+        """Recompute every aggregate from entries in date order."""
+        with self.lock:
+            self._reset()
+            # Only the last max(window) entries can be inside any window
+            tail = max(self.windows, default=0)
+            for entry in entries[-tail:] if tail else []:
+                self._append(entry["date"], entry["mood"])
+            self.total = len(entries)
+            self.newest = entries[-1]["date"] if entries else None
+            self.run, self.newest_day = _trailing_run(entries)
+            self.version = version
+            self.built_at = built_at
+
+    def add(self, date_str, mood, from_version, to_version):
+        """Fold in one new entry written between two data versions.
+
+        Only applies when the aggregates are exactly at `from_version` and the
+        entry is the newest; otherwise they are marked for a rebuild.
+        """
+        with self.lock:
+            if self.version is None or self.version != from_version or (self.newest is not None and date_str <= self.newest):
+                self.version = None
+                return False
+            self._append(date_str, mood)
+            self.version = to_version
+            return True
+
+    def streak(self, today):
+        """The streak of the entries the engine follows, as of local epoch-day `today`."""
+        with self.lock:
+            return evaluate({"run": self.run, "last_day": self.newest_day}, today)
+
+    def evaluate(self, streak):
+        """Every rule's insight, in rule order; O(rules)."""
+        with self.lock:
+            aggregates = {
+                "total": self.total,
+                "windows": {size: dict(counts) for size, counts in self.window_counts.items()}
+            }
+        insights = []
+        for rule in self.rules:
+            insight = rule["evaluate"](aggregates, streak)
+            if insight:
+                insights.append(dict(insight, id=rule["id"]))
+        return insights
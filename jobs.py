@@ -0,0 +1,338 @@
+"""Background jobs for reports too heavy for a request handler.
+
+Handlers enqueue a job and return straight away; a dispatcher thread in
+each app process claims queued jobs and runs them on a thread or process
+pool. The queue lives in the app's own database (a `jobs` collection in
+MongoDB, a `jobs` table in SQLite, or a dict for the memory backend), so
+there is no broker to run, and any worker process can pick up any job.
+
+A job's id is derived from its kind, its parameters and the data version
+it was requested at, so asking for the same report twice reuses the queued,
+running or finished job instead of computing it again. Finished results are
+kept for `result_ttl` seconds, after which the next request recomputes them
+(edits made directly in the sheet do not bump the data version).
+
+Jobs hold a lease while running; a job whose worker died is picked up again
+once the lease expires, up to `max_attempts` times.
+"""
+import hashlib
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from storage import sqlite_connect
+
+FINISHED = ("done", "failed")
+
+
+def job_id(kind, params, version):
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+    return f"{kind}.{version}.{digest}"
+
+
+def new_job(kind, params, version, now):
+    return {
+        "_id": job_id(kind, params, version),
+        "kind": kind,
+        "params": params,
+        "version": version,
+        "status": "queued",
+        "created_at": now,
+        "started_at": None,
+        "finished_at": None,
+        "lease_until": None,
+        "attempts": 0,
+        "result": None,
+        "error": None
+    }
+
+
+class MongoJobQueue:
+    def __init__(self, collection):
+        self.collection = collection
+        self._indexed = False
+
+    def insert(self, job):
+        # Created on first use rather than at import, so the app starts without Mongo
+        if not self._indexed:
+            self.collection.create_index([("status", ASCENDING), ("created_at", ASCENDING)], name="status_created")
+            self._indexed = True
+        try:
+            self.collection.insert_one(job)
+            return True
+        except DuplicateKeyError:
+            return False
+
+    def get(self, job_id):
+        return self.collection.find_one({"_id": job_id})
+
+    def requeue(self, job, now):
+        """Reset a finished job to queued unless another process already did."""
+        result = self.collection.update_one(
+            {"_id": job["_id"], "status": job["status"], "finished_at": job["finished_at"]},
+            {"$set": {"status": "queued", "created_at": now, "finished_at": None,
+                      "attempts": 0, "result": None, "error": None}}
+        )
+        return result.modified_count == 1
+
+    def claim(self, now, lease_seconds):
+        return self.collection.find_one_and_update(
+            {"$or": [{"status": "queued"}, {"status": "running", "lease_until": {"$lt": now}}]},
+            {"$set": {"status": "running", "started_at": now, "lease_until": now + lease_seconds},
+             "$inc": {"attempts": 1}},
+            sort=[("created_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def finish(self, job_id, status, result, error, now):
+        self.collection.update_one(
+            {"_id": job_id},
+            {"$set": {"status": status, "result": result, "error": error,
+                      "finished_at": now, "lease_until": None}}
+        )
+
+    def purge(self, before):
+        self.collection.delete_many({"status": {"$in": list(FINISHED)}, "finished_at": {"$lt": before}})
+
+
+class SQLiteJobQueue:
+    COLUMNS = ("id", "kind", "params", "version", "status", "created_at", "started_at",
+               "finished_at", "lease_until", "attempts", "result", "error")
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, params TEXT NOT NULL, version INTEGER NOT NULL, "
+                "status TEXT NOT NULL, created_at REAL NOT NULL, started_at REAL, finished_at REAL, "
+                "lease_until REAL, attempts INTEGER NOT NULL DEFAULT 0, result TEXT, error TEXT, claim TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+
+    def _conn(self):
+        return sqlite_connect(self.path, self._local)
+
+    def _row_to_job(self, row):
+        if row is None:
+            return None
+        job = dict(zip(self.COLUMNS, row))
+        job["_id"] = job.pop("id")
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def insert(self, job):
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO jobs (id, kind, params, version, status, created_at, attempts) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (job["_id"], job["kind"], json.dumps(job["params"]), job["version"], job["status"], job["created_at"])
+            )
+        return cursor.rowcount == 1
+
+    def get(self, job_id):
+        row = self._conn().execute(f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row)
+
+    def requeue(self, job, now):
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'queued', created_at = ?, finished_at = NULL, attempts = 0, "
+                "result = NULL, error = NULL WHERE id = ? AND status = ? AND finished_at IS ?",
+                (now, job["_id"], job["status"], job["finished_at"])
+            )
+        return cursor.rowcount == 1
+
+    def claim(self, now, lease_seconds):
+        # One statement, so two processes can never claim the same job
+        token = uuid.uuid4().hex
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, lease_until = ?, "
+                "attempts = attempts + 1, claim = ? WHERE id = ("
+                "SELECT id FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                "ORDER BY created_at LIMIT 1)",
+                (now, now + lease_seconds, token, now)
+            )
+        row = conn.execute(f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE claim = ?", (token,)).fetchone()
+        return self._row_to_job(row)
+
+    def finish(self, job_id, status, result, error, now):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_until = NULL WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, now, job_id)
+            )
+
+    def purge(self, before):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (before,))
+
+
+class MemoryJobQueue:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jobs = {}
+
+    def insert(self, job):
+        with self.lock:
+            if job["_id"] in self.jobs:
+                return False
+            self.jobs[job["_id"]] = dict(job)
+            return True
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def requeue(self, job, now):
+        with self.lock:
+            current = self.jobs.get(job["_id"])
+            if not current or current["status"] != job["status"] or current["finished_at"] != job["finished_at"]:
+                return False
+            current.update(status="queued", created_at=now, finished_at=None, attempts=0, result=None, error=None)
+            return True
+
+    def claim(self, now, lease_seconds):
+        with self.lock:
+            ready = [
+                job for job in self.jobs.values()
+                if job["status"] == "queued" or (job["status"] == "running" and job["lease_until"] < now)
+            ]
+            if not ready:
+                return None
+            job = min(ready, key=lambda j: j["created_at"])
+            job.update(status="running", started_at=now, lease_until=now + lease_seconds, attempts=job["attempts"] + 1)
+            return dict(job)
+
+    def finish(self, job_id, status, result, error, now):
+        with self.lock:
+            if job_id in self.jobs:
+                self.jobs[job_id].update(status=status, result=result, error=error, finished_at=now, lease_until=None)
+
+    def purge(self, before):
+        with self.lock:
+            for key in [k for k, job in self.jobs.items() if job["status"] in FINISHED and job["finished_at"] < before]:
+                del self.jobs[key]
+
+
+class JobRunner:
+    def __init__(self, queue, handlers, load_input, workers=2, use_processes=False,
+                 lease_seconds=300, result_ttl=600, max_attempts=3, poll_interval=0.5):
+        self.queue = queue
+        # kind -> function(entries, params) returning a JSON-serialisable result.
+        # With use_processes they must be importable top-level functions.
+        self.handlers = handlers
+        # Called in the dispatcher thread; its result is handed to every handler
+        self.load_input = load_input
+        self.workers = workers
+        self.use_processes = use_processes
+        self.lease_seconds = lease_seconds
+        self.result_ttl = result_ttl
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._slots = threading.Semaphore(workers)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._executor = None
+        self._last_purge = 0
+
+    def submit(self, kind, params, version):
+        """Return the job for (kind, params, version), enqueuing it unless a usable one exists."""
+        now = time.time()
+        job = new_job(kind, params, version, now)
+        if not self.queue.insert(job):
+            job = self.queue.get(job["_id"])
+            expired = job["status"] == "done" and now - job["finished_at"] > self.result_ttl
+            if (job["status"] == "failed" or expired) and self.queue.requeue(job, now):
+                job = self.queue.get(job["_id"])
+        self._ensure_dispatcher()
+        self._wake.set()
+        return job
+
+    def get(self, job_id):
+        return self.queue.get(job_id)
+
+    def wait(self, job_id, timeout):
+        """Poll until the job finishes or `timeout` seconds pass; return its latest state."""
+        deadline = time.monotonic() + timeout
+        job = self.queue.get(job_id)
+        while job and job["status"] not in FINISHED and time.monotonic() < deadline:
+            time.sleep(min(0.1, max(0.0, deadline - time.monotonic())))
+            job = self.queue.get(job_id)
+        return job
+
+    def _ensure_dispatcher(self):
+        # Started lazily so that forked gunicorn workers each get their own thread and pool
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                pool = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+                self._executor = pool(max_workers=self.workers)
+                self._thread = threading.Thread(target=self._run, name="job-dispatcher", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._slots.acquire()
+            job = None
+            try:
+                now = time.time()
+                if now - self._last_purge > self.result_ttl:
+                    self._last_purge = now
+                    self.queue.purge(now - self.result_ttl)
+                job = self.queue.claim(now, self.lease_seconds)
+            except Exception as e:
+                print(f"Error claiming job: {str(e)}")
+
+            if job is None:
+                self._slots.release()
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+
+            self._start(job)
+
+    def _start(self, job):
+        handler = self.handlers.get(job["kind"])
+        if handler is None:
+            self._finish(job, None, f"Unknown job kind {job['kind']!r}")
+            return
+        if job["attempts"] > self.max_attempts:
+            self._finish(job, None, f"Gave up after {self.max_attempts} attempts")
+            return
+
+        try:
+            future = self._executor.submit(handler, self.load_input(), job["params"])
+        except Exception as e:
+            self._finish(job, None, str(e))
+            return
+
+        def done(f):
+            error = f.exception()
+            self._finish(job, None if error else f.result(), str(error) if error else None)
+
+        future.add_done_callback(done)
+
+    def _finish(self, job, result, error):
+        try:
+            self.queue.finish(job["_id"], "failed" if error else "done", result, error, time.time())
+        except Exception as e:
+            print(f"Error saving job result: {str(e)}")
+        finally:
+            self._slots.release()
+            self._wake.set()
@@ -0,0 +1,114 @@
+"""Online migration of entries from the legacy to the compact schema.
+
+Rewrites {"date": datetime, "mood": "happy"} documents in place as
+{"d": epoch_day, "m": mood_code}, a batch at a time, while the app keeps
+serving (readers understand both forms). Progress is checkpointed in the
+"migrations" collection, so an interrupted run picks up where it stopped:
+
+    MONGO_URI=... python migrate_schema.py --batch-size 500 --sleep 0.05
+
+Set STORAGE_SCHEMA=compact on the app before migrating, so new writes are
+already compact and the migration converges.
+"""
+import argparse
+import os
+import time
+
+from pymongo import ASCENDING, MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from schema import MOOD_CODES, to_epoch_day
+from storage import ensure_entry_indexes
+
+MIGRATION_ID = "compact_schema"
+
+
+def migrate(db, batch_size=500, sleep=0.0, dry_run=False, reset=False):
+    entries = db["entries"]
+    migrations = db["migrations"]
+
+    if reset:
+        migrations.delete_one({"_id": MIGRATION_ID})
+
+    state = migrations.find_one({"_id": MIGRATION_ID}) or {
+        "_id": MIGRATION_ID, "last_id": None, "migrated": 0, "skipped": 0, "done": False
+    }
+    if state.get("done"):
+        print("Migration already complete (use --reset to run it again)")
+        return state
+
+    if not dry_run:
+        # Readers and the duplicate check look entries up by epoch-day, and the
+        # same indexes keep concurrent writers from storing a day twice
+        ensure_entry_indexes(entries)
+
+    while True:
+        query = {"date": {"$exists": True}}
+        if state["last_id"] is not None:
+            query["_id"] = {"$gt": state["last_id"]}
+        batch = list(entries.find(query).sort("_id", ASCENDING).limit(batch_size))
+        if not batch:
+            break
+
+        ops = []
+        for doc in batch:
+            mood = doc.get("mood")
+            if mood not in MOOD_CODES:
+                # Unknown moods stay in the legacy form rather than being lost
+                state["skipped"] += 1
+                continue
+            ops.append(UpdateOne(
+                # Matching on the old value too makes a concurrent rewrite a no-op
+                {"_id": doc["_id"], "date": doc["date"]},
+                {
+                    "$set": {"d": to_epoch_day(doc["date"]), "m": MOOD_CODES[mood]},
+                    "$unset": {"date": "", "mood": ""}
+                }
+            ))
+
+        if ops and not dry_run:
+            try:
+                state["migrated"] += entries.bulk_write(ops, ordered=False).modified_count
+            except BulkWriteError as e:
+                # The day already has a compact entry, which wins; the legacy copy stays as it is
+                errors = e.details.get("writeErrors", [])
+                if any(error.get("code") != 11000 for error in errors):
+                    raise
+                state["migrated"] += e.details.get("nModified", 0)
+                state["skipped"] += len(errors)
+        else:
+            state["migrated"] += len(ops)
+
+        state["last_id"] = batch[-1]["_id"]
+        if not dry_run:
+            migrations.replace_one({"_id": MIGRATION_ID}, state, upsert=True)
+        print(f"migrated={state['migrated']} skipped={state['skipped']} last_id={state['last_id']}")
+
+        if sleep:
+            time.sleep(sleep)
+
+    state["done"] = True
+    if not dry_run:
+        migrations.replace_one({"_id": MIGRATION_ID}, state, upsert=True)
+    print(f"Done: {state['migrated']} migrated, {state['skipped']} left in legacy form")
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate entries to the compact epoch-day schema")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--sleep", type=float, default=0.0, help="seconds to pause between batches")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    parser.add_argument("--reset", action="store_true", help="discard the saved checkpoint and start over")
+    args = parser.parse_args()
+
+    mongo_uri = os.environ.get("MONGO_URI")
+    if not mongo_uri:
+        raise SystemExit("MONGO_URI is not set. Please set it as an environment variable.")
+
+    db = MongoClient(mongo_uri)[os.getenv("MONGO_DB", "streakflow")]
+    migrate(db, batch_size=args.batch_size, sleep=args.sleep, dry_run=args.dry_run, reset=args.reset)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Journal notes attached to entries, with full-text search.
+
+Notes live beside the entries, not inside them (a `notes` collection with a
+text index in MongoDB, an FTS5 table in SQLite), so entry scans, /data and
+the snapshots never carry note text. A search is one index lookup that
+returns only the requested page of hits, ranked by the backend's relevance
+score (textScore in MongoDB, bm25 in SQLite).
+
+Queries are reduced to plain words and any word may match, so user input
+can never be a syntax error for either backend. Snippets are cut around the
+first matching word in Python, the same way for every backend.
+"""
+import re
+
+WORD = re.compile(r"\w+", re.UNICODE)
+MAX_TERMS = 8
+
+
+def parse_note(value, max_length):
+    """Validate a submitted note, returning it stripped ("" for none)."""
+    if value is None:
+        return ""
+    if not isinstance(value, str):
+        raise ValueError("Note must be a string")
+    value = value.strip()
+    if len(value) > max_length:
+        raise ValueError(f"Note must be at most {max_length} characters")
+    return value
+
+
+def query_terms(query):
+    """Lowercased words of a search query, deduplicated, at most MAX_TERMS."""
+    terms = []
+    for word in WORD.findall(query or ""):
+        word = word.lower()
+        if word not in terms:
+            terms.append(word)
+    return terms[:MAX_TERMS]
+
+
+def matches(terms, text):
+    """Number of words in `text` starting with a search term (a rough stem match)."""
+    return sum(1 for word in WORD.findall(text.lower()) if any(word.startswith(term) for term in terms))
+
+
+def snippet(text, terms, width=120, mark=("[", "]")):
+    """A window of `text` around the first matching word, with matches marked."""
+    hits = [m for m in WORD.finditer(text) if any(m.group().lower().startswith(term) for term in terms)]
+    start = 0
+    if hits and len(text) > width:
+        start = max(0, min(hits[0].start() - width // 3, len(text) - width))
+    end = min(len(text), start + width)
+
+    out = []
+    position = start
+    for hit in hits:
+        if hit.start() < start or hit.end() > end:
+            continue
+        out.append(text[position:hit.start()])
+        out.append(f"{mark[0]}{hit.group()}{mark[1]}")
+        position = hit.end()
+    out.append(text[position:end])
+    return ("…" if start > 0 else "") + "".join(out) + ("…" if end < len(text) else "")
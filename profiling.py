@@ -0,0 +1,138 @@
+"""On-demand request profiling.
+
+Arms cProfile (and optionally tracemalloc) for the next N requests to a
+route and keeps the results for download as collapsed stacks (one
+"frame;frame;frame count" line per stack, ready for flamegraph.pl or
+speedscope) plus the top allocation sites.
+
+Nothing here is hooked into the app unless PROFILING_TOKEN is set, so the
+normal request path pays nothing when profiling is off.
+"""
+import cProfile
+import pstats
+import threading
+import tracemalloc
+from collections import deque
+
+
+def _frame_name(func):
+    filename, line, name = func
+    if filename == "~":
+        # Built-ins such as {method 'sort' of 'list' objects}
+        return name
+    return f"{name} ({filename.rsplit('/', 1)[-1]}:{line})"
+
+
+def collapsed_stacks(profile):
+    """Turn a cProfile run into collapsed-stack lines weighted in microseconds.
+
+    cProfile records caller/callee edges rather than full stacks, so each
+    stack is rebuilt by walking callers from every function to a root and
+    attributing its own time along the heaviest caller at each step.
+    """
+    stats = pstats.Stats(profile).stats
+    lines = {}
+    for func, (_, _, self_time, _, callers) in stats.items():
+        weight = int(self_time * 1_000_000)
+        if weight <= 0:
+            continue
+
+        stack = [func]
+        seen = {func}
+        current = callers
+        while current:
+            caller = max(current, key=lambda c: current[c][3])
+            if caller in seen:
+                break
+            seen.add(caller)
+            stack.append(caller)
+            current = stats.get(caller, (0, 0, 0, 0, {}))[4]
+
+        key = ";".join(_frame_name(f) for f in reversed(stack))
+        lines[key] = lines.get(key, 0) + weight
+
+    return [f"{stack} {weight}" for stack, weight in sorted(lines.items(), key=lambda item: -item[1])]
+
+
+def top_allocations(before, after, limit=25):
+    return [
+        {
+            "location": str(stat.traceback[0]),
+            "size_kb": round(stat.size_diff / 1024, 1),
+            "count": stat.count_diff
+        }
+        for stat in after.compare_to(before, "lineno")[:limit]
+    ]
+
+
+class RequestProfiler:
+    def __init__(self, max_results=20):
+        self.lock = threading.Lock()
+        self.endpoint = None
+        self.remaining = 0
+        self.trace_memory = False
+        self.active = False
+        self.results = deque(maxlen=max_results)
+
+    def arm(self, endpoint, count, trace_memory=False):
+        with self.lock:
+            self.endpoint = endpoint
+            self.remaining = count
+            self.trace_memory = trace_memory
+
+    def status(self):
+        with self.lock:
+            return {
+                "endpoint": self.endpoint,
+                "remaining": self.remaining,
+                "trace_memory": self.trace_memory,
+                "captured": len(self.results)
+            }
+
+    def claim(self, endpoint):
+        """Return True if this request should be profiled.
+
+        Only one request is profiled at a time; concurrent ones simply wait
+        for a later slot.
+        """
+        if not self.remaining:
+            return False
+        with self.lock:
+            if self.remaining and endpoint == self.endpoint and not self.active:
+                self.remaining -= 1
+                self.active = True
+                return True
+        return False
+
+    def start(self):
+        profile = cProfile.Profile()
+        snapshot = None
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(10)
+            snapshot = tracemalloc.take_snapshot()
+        profile.enable()
+        return profile, snapshot
+
+    def stop(self, token, path, elapsed):
+        profile, before = token
+        profile.disable()
+        result = {
+            "path": path,
+            "elapsed_ms": round(elapsed * 1000, 2),
+            "collapsed": collapsed_stacks(profile)
+        }
+        if before is not None:
+            result["allocations"] = top_allocations(before, tracemalloc.take_snapshot())
+            with self.lock:
+                if not self.remaining:
+                    tracemalloc.stop()
+        with self.lock:
+            self.results.append(result)
+            self.active = False
+
+    def drain(self):
+        with self.lock:
+            results = list(self.results)
+            self.results.clear()
+            return results
@@ -0,0 +1,225 @@
+"""Rebuild derived data from the entries in parallel.
+
+Whenever a derived structure changes shape it has to be regenerated from
+the entries. This tool splits history into one partition per calendar
+year and rebuilds each partition in a process pool:
+
+    calendar     the bitset calendar index (MongoDB only), one document per year
+    streaks      streak state for mood and every habit; each partition returns
+                 a run summary and the summaries are stitched together in order
+    mood-habit   the mood scores in the habit series (see habits.py)
+
+Every worker streams its partition and holds at most one year of
+aggregates, and only `--workers * 2` partitions are in flight, so memory
+stays bounded however long the history is. Finished partitions are
+checkpointed to a JSON file, and an interrupted run resumes where it
+stopped. Workers run at lower CPU priority and cap their read rate, so a
+rebuild does not starve production traffic. The data version is bumped at
+the end so cached snapshots, charts, stats and reports are rebuilt too.
+
+Uses the app's STORAGE_BACKEND / MONGO_URI / SQLITE_PATH settings:
+
+    python rebuild.py streaks calendar --workers 4 --rate 5000
+    python rebuild.py --restart          # all targets, ignoring any checkpoint
+
+Live writes keep derived data up to date while this runs, but a partition
+read before a concurrent write can overwrite it; run it at a quiet time or
+run it again afterwards.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date
+
+from calendar_index import YearIndex
+from habits import counts_towards_streak
+from schema import MOOD_CODES, entry_day, epoch_day_to_datetime, from_epoch_day, to_epoch_day
+from streaks import combine_runs, run_summary
+
+TARGETS = ("calendar", "streaks", "mood-habit")
+
+_app = None
+_limiter = None
+
+
+class RateLimiter:
+    """Caps a worker at `rate` documents per second (0 = unlimited)."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.started = time.monotonic()
+        self.count = 0
+
+    def tick(self, n=1):
+        if not self.rate:
+            return
+        self.count += n
+        ahead = self.count / self.rate - (time.monotonic() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def _init_worker(rate, nice):
+    # Each worker imports the app itself so it gets its own database connections
+    global _app, _limiter
+    if nice:
+        os.nice(nice)
+    import app
+    _app = app
+    _limiter = RateLimiter(rate)
+
+
+def _throttled(rows):
+    for row in rows:
+        _limiter.tick()
+        yield row
+
+
+def rebuild_partition(year, targets, batch_size):
+    """Rebuild one calendar year; returns what the parent needs to finish the run."""
+    start = to_epoch_day(date(year, 1, 1))
+    end = to_epoch_day(date(year + 1, 1, 1))
+    result = {"year": year, "entries": 0}
+
+    year_index = YearIndex(year)
+    mood_days = []
+    batch = []
+    for doc in _throttled(_app.store.scan(start, end)):
+        day = entry_day(doc)
+        mood = MOOD_CODES.get(doc["mood"], 0) if "mood" in doc else doc.get("m", 0)
+        result["entries"] += 1
+        year_index.set_day(day - start, mood)
+        mood_days.append(day)
+        if "mood-habit" in targets and mood:
+            batch.append(("mood", epoch_day_to_datetime(day), mood))
+            if len(batch) >= batch_size:
+                _app.store.set_metrics(batch)
+                batch = []
+
+    if batch:
+        _app.store.set_metrics(batch)
+    if "calendar" in targets and result["entries"]:
+        _app.calendar_store.save_year(year_index)
+
+    if "streaks" in targets:
+        habit_days = {habit: [] for habit in _app.STREAK_SERIES if habit != "mood"}
+        for day, habit, value in _throttled(_app.store.scan_metrics(start, end)):
+            if habit in habit_days and counts_towards_streak(_app.HABITS[habit], value):
+                habit_days[habit].append(day)
+        result["streaks"] = {"mood": run_summary(mood_days)}
+        for habit, days in habit_days.items():
+            result["streaks"][habit] = run_summary(days)
+
+    return result
+
+
+def plan_years(store):
+    """Calendar years that hold entries or habit values, oldest first."""
+    first_entry = next(iter(store.scan()), None)
+    first_metric = next(iter(store.scan_metrics()), None)
+    starts = [entry_day(first_entry)] if first_entry else []
+    if first_metric:
+        starts.append(first_metric[0])
+    if not starts:
+        return []
+
+    year = from_epoch_day(min(starts)).year
+    years = []
+    # Walk forward until nothing is left; entries may be dated in the future
+    while True:
+        start = to_epoch_day(date(year, 1, 1))
+        if not store.count(start) and next(iter(store.scan_metrics(start)), None) is None:
+            return years
+        years.append(year)
+        year += 1
+
+
+def load_checkpoint(path, targets):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if sorted(checkpoint.get("targets", [])) != sorted(targets):
+        raise SystemExit(f"Checkpoint {path} is for targets {checkpoint.get('targets')}; use --restart to discard it")
+    return {int(year): result for year, result in checkpoint.get("done", {}).items()}
+
+
+def save_checkpoint(path, targets, done):
+    if not path:
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"targets": targets, "done": {str(year): result for year, result in done.items()}}, f)
+    # Atomic on POSIX, so an interrupted run never leaves a torn checkpoint
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild derived data from the entries in parallel")
+    parser.add_argument("targets", nargs="*",
+                        help=f"what to rebuild: {', '.join(TARGETS)} (default: all that apply)")
+    parser.add_argument("--workers", type=int, default=max(1, min(4, (os.cpu_count() or 2) // 2)))
+    parser.add_argument("--rate", type=float, default=2000, help="max documents read per second per worker (0 = unlimited)")
+    parser.add_argument("--nice", type=int, default=10, help="CPU priority increment for workers")
+    parser.add_argument("--batch-size", type=int, default=500, help="writes per batch")
+    parser.add_argument("--checkpoint", default=".rebuild-checkpoint.json", help="progress file ('' to disable)")
+    parser.add_argument("--restart", action="store_true", help="ignore and replace an existing checkpoint")
+    args = parser.parse_args()
+
+    import app
+
+    unknown = [t for t in args.targets if t not in TARGETS]
+    if unknown:
+        parser.error(f"unknown target(s): {', '.join(unknown)}")
+    targets = list(args.targets) or [t for t in TARGETS if t != "calendar" or app.calendar_store is not None]
+    if "calendar" in targets and app.calendar_store is None:
+        parser.error("the calendar index only exists with the mongo backend")
+    if app.STORAGE_BACKEND == "memory":
+        parser.error("the memory backend lives inside the app process; there is nothing to rebuild from here")
+
+    if args.restart and args.checkpoint and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    done = load_checkpoint(args.checkpoint, targets)
+    years = plan_years(app.store)
+    pending = [year for year in years if year not in done]
+    print(f"{len(years)} partitions, {len(done)} already done, rebuilding {', '.join(targets)} with {args.workers} workers")
+
+    # spawn: workers must not inherit the parent's MongoClient across a fork
+    context = multiprocessing.get_context("spawn")
+    started = time.monotonic()
+    with ProcessPoolExecutor(args.workers, mp_context=context, initializer=_init_worker,
+                             initargs=(args.rate, args.nice)) as pool:
+        queue = list(pending)
+        running = set()
+        while queue or running:
+            # Bound the number of partitions in flight (and their results in memory)
+            while queue and len(running) < args.workers * 2:
+                running.add(pool.submit(rebuild_partition, queue.pop(0), targets, args.batch_size))
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                result = future.result()
+                done[result["year"]] = result
+                save_checkpoint(args.checkpoint, targets, done)
+                print(f"  {result['year']}: {result['entries']} entries ({len(done)}/{len(years)})")
+
+    if "streaks" in targets:
+        summaries = {series: None for series in app.STREAK_SERIES}
+        for year in sorted(done):
+            for series, summary in done[year].get("streaks", {}).items():
+                if series in summaries:
+                    summaries[series] = combine_runs(summaries[series], summary)
+        app.streak_tracker.replace(summaries)
+    if "calendar" in targets:
+        app.calendar_store.finish_rebuild([year for year in years if done[year]["entries"]])
+
+    app.bump_data_version()
+    if args.checkpoint and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    print(f"Done in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
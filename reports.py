@@ -0,0 +1,152 @@
+"""Reports run as background jobs (see jobs.py).
+
+Each report has a parser that validates request parameters up front (so a
+bad request gets a 400 instead of a failed job), given the request body and
+the streak timezone "today" is judged in, and a runner that takes the
+entries in ascending date order plus those parameters and returns a
+JSON-serialisable result. Runners are plain top-level functions so they can
+run in a process pool.
+"""
+import csv
+import io
+from datetime import date
+
+from schema import MOOD_CODES, from_epoch_day, parse_date_str, to_epoch_day
+from streaks import local_today
+
+
+def _runs(days):
+    """Lengths of runs of consecutive epoch-days in a sorted list."""
+    runs = []
+    previous = None
+    for day in days:
+        if previous is not None and day - previous == 1:
+            runs[-1] += 1
+        elif day != previous:
+            runs.append(1)
+        previous = day
+    return runs
+
+
+def _mood_counts(entries):
+    counts = {mood: 0 for mood in MOOD_CODES}
+    for entry in entries:
+        counts[entry["mood"]] = counts.get(entry["mood"], 0) + 1
+    return counts
+
+
+def _average_score(entries):
+    scores = [MOOD_CODES[entry["mood"]] for entry in entries if entry["mood"] in MOOD_CODES]
+    return round(sum(scores) / len(scores), 2) if scores else None
+
+
+def parse_year_params(params, timezone):
+    try:
+        year = int(params.get("year", from_epoch_day(local_today(timezone)).year))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid year")
+    if not 1970 <= year <= 9999:
+        raise ValueError("Invalid year")
+    return {"year": year}
+
+
+def year_in_review(entries, params):
+    year = params["year"]
+    prefix = f"{year:04d}-"
+    logged = [entry for entry in entries if entry["date"].startswith(prefix)]
+    days = [to_epoch_day(parse_date_str(entry["date"])) for entry in logged]
+    days_in_year = to_epoch_day(date(year + 1, 1, 1)) - to_epoch_day(date(year, 1, 1))
+
+    months = []
+    for month in range(1, 13):
+        month_entries = [entry for entry in logged if int(entry["date"][5:7]) == month]
+        months.append({
+            "month": month,
+            "logged": len(month_entries),
+            "mood_counts": _mood_counts(month_entries),
+            "average_score": _average_score(month_entries)
+        })
+
+    scored_months = [m for m in months if m["average_score"] is not None]
+    counts = _mood_counts(logged)
+    return {
+        "year": year,
+        "logged": len(logged),
+        "coverage": round(len(logged) / days_in_year, 3),
+        "longest_streak": max(_runs(days), default=0),
+        "mood_counts": counts,
+        "top_mood": max(counts, key=counts.get) if logged else None,
+        "average_score": _average_score(logged),
+        "best_month": max(scored_months, key=lambda m: m["average_score"])["month"] if scored_months else None,
+        "months": months
+    }
+
+
+def parse_history_params(params, timezone):
+    return {"timezone": timezone}
+
+
+def history_summary(entries, params):
+    """Full-history recompute of the headline stats and a per-year breakdown."""
+    days = [to_epoch_day(parse_date_str(entry["date"])) for entry in entries]
+    runs = _runs(days)
+    today = local_today(params.get("timezone", "UTC"))
+    # The current streak only counts if it reaches today or yesterday
+    current = runs[-1] if runs and today - days[-1] <= 1 else 0
+
+    years = {}
+    for entry in entries:
+        years.setdefault(entry["date"][:4], []).append(entry)
+
+    return {
+        "total": len(entries),
+        "first_date": entries[0]["date"] if entries else None,
+        "last_date": entries[-1]["date"] if entries else None,
+        "current_streak": current,
+        "longest_streak": max(runs, default=0),
+        "mood_counts": _mood_counts(entries),
+        "average_score": _average_score(entries),
+        "years": [
+            {
+                "year": int(year),
+                "logged": len(year_entries),
+                "mood_counts": _mood_counts(year_entries),
+                "average_score": _average_score(year_entries)
+            }
+            for year, year_entries in sorted(years.items())
+        ]
+    }
+
+
+def parse_csv_params(params, timezone):
+    parsed = {}
+    for key in ("from", "to"):
+        if params.get(key):
+            try:
+                parsed[key] = parse_date_str(params[key]).isoformat()
+            except ValueError:
+                raise ValueError(f"Invalid {key} date. Use YYYY-MM-DD")
+    return parsed
+
+
+def entries_csv(entries, params):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["date", "mood", "score"])
+    rows = 0
+    for entry in entries:
+        if params.get("from") and entry["date"] < params["from"]:
+            continue
+        if params.get("to") and entry["date"] > params["to"]:
+            continue
+        writer.writerow([entry["date"], entry["mood"], MOOD_CODES.get(entry["mood"], "")])
+        rows += 1
+    return {"rows": rows, "csv": out.getvalue()}
+
+
+# kind -> (parse_params, run)
+REPORTS = {
+    "year-in-review": (parse_year_params, year_in_review),
+    "history": (parse_history_params, history_summary),
+    "csv": (parse_csv_params, entries_csv),
+}
@@ -0,0 +1,79 @@
+"""Entry document schemas.
+
+Legacy documents look like {"date": datetime, "mood": "happy"}. Compact
+documents store an integer epoch-day and a small mood code instead:
+{"d": 19723, "m": 3}. Readers accept both forms so the migration in
+migrate_schema.py can run online while the app keeps serving.
+"""
+from datetime import date, datetime
+from functools import lru_cache
+
+# Codes match the 1-3 mood score the dashboard plots; 0 is reserved for "no entry"
+MOOD_CODES = {"sad": 1, "neutral": 2, "happy": 3}
+MOOD_NAMES = {code: mood for mood, code in MOOD_CODES.items()}
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def to_epoch_day(value):
+    if isinstance(value, datetime):
+        value = value.date()
+    return value.toordinal() - EPOCH_ORDINAL
+
+
+def from_epoch_day(day):
+    return date.fromordinal(day + EPOCH_ORDINAL)
+
+
+def epoch_day_to_datetime(day):
+    d = from_epoch_day(day)
+    return datetime(d.year, d.month, d.day)
+
+
+@lru_cache(maxsize=8192)
+def epoch_day_to_str(day):
+    return from_epoch_day(day).isoformat()
+
+
+def parse_date_str(date_str):
+    """Parse a strict YYYY-MM-DD string, raising ValueError otherwise.
+
+    date.fromisoformat is implemented in C and is far cheaper than strptime.
+    """
+    if not isinstance(date_str, str) or len(date_str) != 10 or date_str[4] != "-" or date_str[7] != "-":
+        raise ValueError(f"Invalid date: {date_str!r}")
+    return date.fromisoformat(date_str)
+
+
+def is_compact(doc):
+    return "d" in doc
+
+
+def encode_entry(date_obj, mood, compact=True):
+    """Build the stored document for an entry.
+
+    Moods without a code are always stored in the legacy form so no
+    information is lost.
+    """
+    if compact and mood in MOOD_CODES:
+        return {"d": to_epoch_day(date_obj), "m": MOOD_CODES[mood]}
+    return {"date": date_obj, "mood": mood}
+
+
+def decode_entry(doc):
+    """Return the {"date": "YYYY-MM-DD", "mood": str} form served by /data."""
+    if "d" in doc:
+        return {"date": epoch_day_to_str(doc["d"]), "mood": MOOD_NAMES.get(doc.get("m"), "")}
+    return {"date": doc["date"].strftime("%Y-%m-%d"), "mood": doc["mood"]}
+
+
+def entry_day(doc):
+    """Epoch-day of a stored document in either form."""
+    if "d" in doc:
+        return doc["d"]
+    return to_epoch_day(doc["date"])
+
+
+def entry_filter(date_obj):
+    """Match the entry for a date whichever form it is stored in."""
+    return {"$or": [{"d": to_epoch_day(date_obj)}, {"date": date_obj}]}
@@ -0,0 +1,150 @@
+"""Incremental Google Sheets sync.
+
+Instead of pulling and re-validating the whole sheet on every request, the
+mirror asks the Apps Script for rows past the last one it has seen
+(`?action=fetch&since=<row>&revision=<rev>`) and merges them into a local,
+already-validated copy. The script bumps `revision` whenever an existing row
+is edited or deleted, and then answers with the full sheet again, so the
+mirror never serves rows the sheet no longer has. See apps_script/Code.gs
+for the reference handler; scripts that ignore `since` keep working, they
+just always return everything.
+
+Large bodies are parsed incrementally with ijson when it is installed.
+"""
+import threading
+
+import requests
+
+from schema import parse_date_str
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+def entries_from_sheet_rows(sheets_data):
+    entries = []
+    for row in sheets_data:
+        if len(row) >= 2:  # Ensure we have at least date and mood
+            try:
+                # Assuming Google Sheets data format: [date, mood, ...]
+                date_str = row[0]
+                mood_str = row[1]
+
+                # Validate date format
+                parse_date_str(date_str)
+
+                entries.append({
+                    "date": date_str,
+                    "mood": mood_str
+                })
+            except (ValueError, IndexError):
+                continue  # Skip invalid entries
+
+    # Sheet rows are in insertion order, not necessarily date order
+    entries.sort(key=lambda entry: entry["date"])
+    return entries
+
+
+def parse_fetch_response(stream):
+    """Parse a fetch body from a file-like object without buffering it whole."""
+    body = {}
+    rows = []
+    builder = None
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if prefix == "data.item" or prefix.startswith("data.item."):
+            if builder is None:
+                builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            if prefix == "data.item" and event in ("end_array", "end_map", "string", "number"):
+                rows.append(builder.value)
+                builder = None
+        elif prefix in ("status", "since", "total", "revision") and event in ("string", "number", "null"):
+            body[prefix] = value
+    body["data"] = rows
+    return body
+
+
+class SheetsMirror:
+    def __init__(self, url, timeout=10, stream_threshold=256 * 1024):
+        self.url = url
+        self.timeout = timeout
+        self.stream_threshold = stream_threshold
+        self.lock = threading.Lock()
+        self.entries = []
+        self.total = None
+        self.revision = None
+
+    def cached_entries(self):
+        """Last synced entries without contacting Apps Script ([] before the first sync)."""
+        with self.lock:
+            return list(self.entries)
+
+    def sync(self):
+        """Fetch new rows and return all entries in date order ([] on failure).
+
+        The Apps Script call runs outside the lock, so readers of the merged
+        copy never wait on Google; the result is merged under the lock only
+        if the mirror has not moved past it meanwhile.
+        """
+        with self.lock:
+            params = {"action": "fetch"}
+            if self.total is not None:
+                params["since"] = self.total
+                params["revision"] = self.revision
+
+        body = self._get(params)
+        if body is None:
+            return []
+
+        with self.lock:
+            self._merge(body)
+            return list(self.entries)
+
+    def _merge(self, body):
+        rows = body.get("data", [])
+        since = body.get("since")
+        if "total" not in body or since is None:
+            # Script without incremental support: always a full sheet
+            self.entries = entries_from_sheet_rows(rows)
+            self.total = None
+            self.revision = None
+            return
+
+        since, total = int(since), int(body["total"])
+        if since == 0 or self.total is None:
+            # A full sheet, unless a concurrent sync already applied a newer one
+            if self.total is None or self.revision != body.get("revision") or total >= self.total:
+                self.entries = entries_from_sheet_rows(rows)
+                self.total = total
+                self.revision = body.get("revision")
+            return
+
+        # Rows since..total; skip those a concurrent sync merged already
+        if self.revision != body.get("revision", self.revision) or not since <= self.total < total:
+            return
+        new_entries = entries_from_sheet_rows(rows[self.total - since:])
+        if new_entries:
+            merged = self.entries + new_entries
+            # New rows are usually the newest dates, which keeps this sort near-linear
+            if self.entries and new_entries[0]["date"] < self.entries[-1]["date"]:
+                merged.sort(key=lambda entry: entry["date"])
+            self.entries = merged
+        self.total = total
+
+    def _get(self, params):
+        try:
+            response = requests.get(self.url, params=params, timeout=self.timeout, stream=True)
+            if response.status_code != 200:
+                print(f"Failed to fetch Google Sheets data: HTTP {response.status_code}")
+                return None
+
+            length = int(response.headers.get("Content-Length") or 0)
+            if ijson is not None and (length == 0 or length > self.stream_threshold):
+                response.raw.decode_content = True
+                return parse_fetch_response(response.raw)
+            return response.json()
+        except Exception as e:
+            print(f"Error fetching Google Sheets data: {str(e)}")
+            return None
@@ -0,0 +1,645 @@
+"""Storage backends for entries.
+
+Every backend exposes the same small interface, used by /submit and the
+readers in app.py:
+
+    upsert(date_obj, mood)       insert unless the day already has an entry;
+                                 True if inserted, False if it existed
+    bulk_upsert(entries)         the same for many (date_obj, mood) pairs in
+                                 one write; returns the number inserted
+    scan(start=None, end=None)   stored documents for epoch-days [start, end)
+                                 in ascending date order, one per day
+    count(start=None, end=None)  number of entries in that range
+    data_version() / bump_data_version()
+                                 counter the app's caches are keyed on; bumping
+                                 returns the new value
+    setting(key) / set_setting(key, value)
+                                 small app-wide settings (e.g. the streak
+                                 timezone), None when unset
+
+Habit metrics (see habits.py) live in a second series keyed by (day, habit),
+so one range scan returns every habit for a date window:
+
+    set_metric(habit, date_obj, value)   insert or overwrite one value
+    set_metrics(rows)                    the same for many (habit, date_obj, value)
+    scan_metrics(start=None, end=None)   (day, habit, value) for epoch-days
+                                         [start, end), ordered by day then habit
+
+Streak state (see streaks.py) is one small document per series, carrying a
+version "v" for optimistic concurrency:
+
+    streak_states()                      {series: state} for every series
+    save_streak_states(states)           write many states in one batch, each
+                                         only if the stored version still equals
+                                         its "v" (None: only if absent); stores
+                                         v + 1 and returns how many were written
+
+Hash-tree month nodes (see anti_entropy.py) are kept next to the entries,
+so a consistency check never has to scan them all. A node holds the sums of
+the high and low 32-bit halves of its entries' digests, plus their count:
+plain integer adds ($inc) on the halves cannot overflow, and the month's
+hash is (hi << 32) + lo modulo 2**64.
+
+    add_hash_node(month, hi, lo)         add one entry's digest halves to "YYYY-MM"
+    hash_nodes()                         {"YYYY-MM": (hi, lo, count)}, or None until
+                                         a complete set has been saved
+    set_hash_nodes(nodes, complete=False)
+                                         overwrite the given nodes (count 0 deletes);
+                                         complete=True also drops every other node
+                                         and marks the tree built
+
+Journal notes (see notes.py) are kept apart from the entries, one per day,
+so entry scans never carry their text:
+
+    set_note(date_obj, text)             insert or overwrite a day's note ("" deletes it)
+    search_notes(terms, limit, offset)   (total, [(day, text, score)]) for notes
+                                         containing any of the words, best first
+
+Documents come back in the stored forms from schema.py ({"d", "m"} or
+{"date", "mood"}), so decode_entry and entry_day work on any backend.
+
+MongoStore wraps the existing collections (archive tier, group commit and
+read routing included). SQLiteStore keeps everything in one local file in
+WAL mode, for single-node deployments that want local reads and no network
+database. MemoryStore is a dict, for tests and throwaway runs.
+"""
+import bisect
+import heapq
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+from pymongo import ASCENDING, TEXT, DeleteMany, DeleteOne, InsertOne, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+from notes import matches
+from schema import MOOD_CODES, encode_entry, entry_day, entry_filter, epoch_day_to_datetime, to_epoch_day
+
+
+HASH_TREE_BUILT = "built"
+
+
+def doc_for_day(day, mood):
+    """Stored-form document for an epoch-day, matching encode_entry(compact=True)."""
+    code = MOOD_CODES.get(mood)
+    if code:
+        return {"d": day, "m": code}
+    return {"date": epoch_day_to_datetime(day), "mood": mood}
+
+
+def ensure_entry_indexes(collection):
+    """Unique indexes that make the day the key of an entry in either stored form.
+
+    Partial, so legacy documents (no "d") and compact ones (no "date") do not
+    collide on the missing field while both forms coexist. Of two concurrent
+    upserts for the same day, the loser gets a duplicate-key error instead of
+    inserting a second entry.
+    """
+    collection.create_index([("d", ASCENDING)], name="d_unique", unique=True,
+                            partialFilterExpression={"d": {"$exists": True}})
+    collection.create_index([("date", ASCENDING)], name="date_unique", unique=True,
+                            partialFilterExpression={"date": {"$exists": True}})
+
+
+def unique_days(docs):
+    previous_day = None
+    for doc in docs:
+        day = entry_day(doc)
+        if day != previous_day:
+            previous_day = day
+            yield doc
+
+
+def sqlite_connect(path, local):
+    """Per-thread WAL-mode connection; sqlite3 connections cannot be shared across threads."""
+    conn = getattr(local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Safe under WAL: a power loss may drop the last commits but never corrupts the file
+        conn.execute("PRAGMA synchronous=NORMAL")
+        local.conn = conn
+    return conn
+
+
+def _next_version(state):
+    return dict(state, v=(state.get("v") or 0) + 1)
+
+
+def _day_range(field, start, end, convert=None):
+    bounds = {}
+    if start is not None:
+        bounds["$gte"] = convert(start) if convert else start
+    if end is not None:
+        bounds["$lt"] = convert(end) if convert else end
+    return {field: bounds or {"$exists": True}}
+
+
+class MongoStore:
+    label = "MongoDB"
+
+    def __init__(self, collection, meta, archive_tier, compact=False, group_committer=None, reads=None,
+                 batch_size=500, metrics=None, streaks=None, notes=None, hash_tree=None):
+        self.collection = collection
+        self.meta = meta
+        self.metrics = metrics
+        self.streaks = streaks
+        self.notes = notes
+        self.hash_tree = hash_tree
+        self._entries_indexed = False
+        self._metrics_indexed = False
+        self._notes_indexed = False
+        self.archive_tier = archive_tier
+        self.compact = compact
+        self.group_committer = group_committer
+        # Maps a collection to the copy routed for the current request (see app.reads)
+        self.reads = reads or (lambda target: target)
+        self.batch_size = batch_size
+
+    def _ensure_entries_index(self):
+        if not self._entries_indexed:
+            try:
+                ensure_entry_indexes(self.collection)
+            except OperationFailure as e:
+                # Most likely duplicate days already stored; reads still keep the first
+                print(f"Warning: could not create unique entry indexes, so concurrent writes "
+                      f"for one day may both insert: {str(e)}")
+            self._entries_indexed = True
+
+    def upsert(self, date_obj, mood):
+        # Days in archived years are no longer in the hot collection
+        if self.in_archive(date_obj):
+            return False
+
+        self._ensure_entries_index()
+        if self.group_committer:
+            # Duplicate check and insert happen inside the batched upsert
+            return self.group_committer.submit(date_obj, mood)
+
+        # Duplicate check and insert in one atomic upsert
+        try:
+            result = self.collection.update_one(
+                entry_filter(date_obj), {"$setOnInsert": encode_entry(date_obj, mood, self.compact)}, upsert=True
+            )
+        except DuplicateKeyError:
+            # Another worker inserted the same day between our match and insert
+            return False
+        return result.upserted_id is not None
+
+    def bulk_upsert(self, entries):
+        self._ensure_entries_index()
+        ops = [
+            UpdateOne(entry_filter(date_obj), {"$setOnInsert": encode_entry(date_obj, mood, self.compact)}, upsert=True)
+            for date_obj, mood in entries if not self.in_archive(date_obj)
+        ]
+        if not ops:
+            return 0
+        try:
+            return self.collection.bulk_write(ops, ordered=False).upserted_count
+        except BulkWriteError as e:
+            # A duplicate key means another writer inserted that day first
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+            return e.details.get("nUpserted", 0)
+
+    def in_archive(self, date_obj):
+        return date_obj.year < datetime.now().year and self.archive_tier.contains(date_obj)
+
+    def scan(self, start=None, end=None):
+        """Archived years, compact and legacy documents are read in date order
+        and merged, so this stays a single pass while a schema migration or
+        archive run is in progress. A day present in two places is yielded once.
+        """
+        source = self.reads(self.collection)
+        archived = self.archive_tier.iter_docs(self.reads(self.archive_tier.archive), start, end)
+        compact = source.find(_day_range("d", start, end), {"_id": 0}).sort("d", 1).batch_size(self.batch_size)
+        legacy = source.find(_day_range("date", start, end, epoch_day_to_datetime), {"_id": 0}).sort("date", 1).batch_size(self.batch_size)
+        return unique_days(heapq.merge(archived, compact, legacy, key=entry_day))
+
+    def count(self, start=None, end=None):
+        source = self.reads(self.collection)
+        hot = source.count_documents({"$or": [
+            _day_range("d", start, end),
+            _day_range("date", start, end, epoch_day_to_datetime)
+        ]})
+        archived = sum(1 for _ in self.archive_tier.iter_docs(self.reads(self.archive_tier.archive), start, end))
+        return hot + archived
+
+    def data_version(self):
+        doc = self.meta.find_one({"_id": "data_version"})
+        return doc["v"] if doc else 0
+
+    def bump_data_version(self):
+        doc = self.meta.find_one_and_update(
+            {"_id": "data_version"}, {"$inc": {"v": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return doc["v"]
+
+    def setting(self, key):
+        # Always from the primary, like the streak states it governs
+        doc = self.meta.find_one({"_id": "settings"}, {key: 1})
+        return doc.get(key) if doc else None
+
+    def set_setting(self, key, value):
+        self.meta.update_one({"_id": "settings"}, {"$set": {key: value}}, upsert=True)
+
+    def _metric_op(self, habit, date_obj, value):
+        return UpdateOne({"d": to_epoch_day(date_obj), "h": habit}, {"$set": {"v": value}}, upsert=True)
+
+    def _ensure_metrics_index(self):
+        # Day first: a dashboard window is one contiguous index range across all habits
+        if not self._metrics_indexed:
+            self.metrics.create_index([("d", ASCENDING), ("h", ASCENDING)], name="d_1_h_1", unique=True)
+            self._metrics_indexed = True
+
+    def set_metric(self, habit, date_obj, value):
+        self._ensure_metrics_index()
+        self.metrics.bulk_write([self._metric_op(habit, date_obj, value)])
+
+    def set_metrics(self, rows):
+        self._ensure_metrics_index()
+        ops = [self._metric_op(habit, date_obj, value) for habit, date_obj, value in rows]
+        if ops:
+            self.metrics.bulk_write(ops, ordered=False)
+
+    def scan_metrics(self, start=None, end=None):
+        cursor = self.reads(self.metrics).find(_day_range("d", start, end), {"_id": 0})
+        cursor = cursor.sort([("d", ASCENDING), ("h", ASCENDING)]).batch_size(self.batch_size)
+        return ((doc["d"], doc["h"], doc["v"]) for doc in cursor)
+
+    def streak_states(self):
+        # Always from the primary: a sweep must not act on a lagging copy
+        return {doc["_id"]: dict(doc, v=doc.get("v", 0)) for doc in self.streaks.find({})}
+
+    def save_streak_states(self, states):
+        ops = []
+        for state in states:
+            if state.get("v") is None:
+                ops.append(InsertOne(_next_version(state)))
+            else:
+                # States saved before versioning have no "v"; {"v": None} matches those
+                version = state["v"] or {"$in": [0, None]}
+                ops.append(ReplaceOne({"_id": state["_id"], "v": version}, _next_version(state)))
+
+        written = 0
+        for i in range(0, len(ops), self.batch_size):
+            try:
+                result = self.streaks.bulk_write(ops[i:i + self.batch_size], ordered=False)
+                written += result.inserted_count + result.matched_count
+            except BulkWriteError as e:
+                # A duplicate key means another writer created the state first
+                if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                    raise
+                written += e.details.get("nInserted", 0) + e.details.get("nMatched", 0)
+        return written
+
+    def add_hash_node(self, month, hi, lo):
+        self.hash_tree.update_one({"_id": month}, {"$inc": {"hi": hi, "lo": lo, "n": 1}}, upsert=True)
+
+    def hash_nodes(self):
+        # From the primary, like the streak states: it is compared against the sheet
+        nodes = {}
+        built = False
+        for doc in self.hash_tree.find({}):
+            if doc["_id"] == HASH_TREE_BUILT:
+                built = True
+            else:
+                nodes[doc["_id"]] = (doc["hi"], doc["lo"], doc["n"])
+        return nodes if built else None
+
+    def set_hash_nodes(self, nodes, complete=False):
+        ops = [
+            ReplaceOne({"_id": month}, {"_id": month, "hi": hi, "lo": lo, "n": n}, upsert=True) if n
+            else DeleteOne({"_id": month})
+            for month, (hi, lo, n) in nodes.items()
+        ]
+        if complete:
+            ops.append(DeleteMany({"_id": {"$nin": list(nodes) + [HASH_TREE_BUILT]}}))
+            ops.append(ReplaceOne({"_id": HASH_TREE_BUILT}, {"_id": HASH_TREE_BUILT}, upsert=True))
+        if ops:
+            self.hash_tree.bulk_write(ops)
+
+    def _ensure_notes_index(self):
+        # $text queries fail without a text index, so searching a fresh database needs it too
+        if not self._notes_indexed:
+            self.notes.create_index([("text", TEXT)], name="text_text", default_language="english")
+            self._notes_indexed = True
+
+    def set_note(self, date_obj, text):
+        self._ensure_notes_index()
+        day = to_epoch_day(date_obj)
+        if text:
+            self.notes.replace_one({"_id": day}, {"_id": day, "text": text}, upsert=True)
+        else:
+            self.notes.delete_one({"_id": day})
+
+    def search_notes(self, terms, limit, offset=0):
+        self._ensure_notes_index()
+        query = {"$text": {"$search": " ".join(terms)}}
+        source = self.reads(self.notes)
+        score = {"$meta": "textScore"}
+        cursor = source.find(query, {"text": 1, "score": score}).sort([("score", score), ("_id", -1)])
+        hits = [(doc["_id"], doc["text"], doc["score"]) for doc in cursor.skip(offset).limit(limit)]
+        return source.count_documents(query), hits
+
+
+class SQLiteStore:
+    label = "SQLite"
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        with conn:
+            # The day is the primary key, so range scans walk the table in date order
+            conn.execute("CREATE TABLE IF NOT EXISTS entries (day INTEGER PRIMARY KEY, mood TEXT NOT NULL) WITHOUT ROWID")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS metrics (day INTEGER NOT NULL, habit TEXT NOT NULL, value NUMERIC NOT NULL, "
+                "PRIMARY KEY (day, habit)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS streaks (id TEXT PRIMARY KEY, state TEXT NOT NULL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS hash_tree (month TEXT PRIMARY KEY, hi INTEGER NOT NULL, lo INTEGER NOT NULL, "
+                "n INTEGER NOT NULL) WITHOUT ROWID"
+            )
+            # Full-text index over notes; the rowid is the note's epoch-day
+            conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS notes USING fts5(text, tokenize = 'porter unicode61')")
+
+    def _conn(self):
+        return sqlite_connect(self.path, self._local)
+
+    def upsert(self, date_obj, mood):
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute("INSERT OR IGNORE INTO entries (day, mood) VALUES (?, ?)", (to_epoch_day(date_obj), mood))
+        return cursor.rowcount == 1
+
+    def bulk_upsert(self, entries):
+        conn = self._conn()
+        before = conn.total_changes
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO entries (day, mood) VALUES (?, ?)",
+                ((to_epoch_day(date_obj), mood) for date_obj, mood in entries)
+            )
+        return conn.total_changes - before
+
+    def _where(self, start, end):
+        clauses, params = [], []
+        if start is not None:
+            clauses.append("day >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("day < ?")
+            params.append(end)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def scan(self, start=None, end=None):
+        where, params = self._where(start, end)
+        cursor = self._conn().execute(f"SELECT day, mood FROM entries{where} ORDER BY day", params)
+        return (doc_for_day(day, mood) for day, mood in cursor)
+
+    def count(self, start=None, end=None):
+        where, params = self._where(start, end)
+        return self._conn().execute(f"SELECT COUNT(*) FROM entries{where}", params).fetchone()[0]
+
+    def data_version(self):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = 'data_version'").fetchone()
+        return row[0] if row else 0
+
+    def bump_data_version(self):
+        conn = self._conn()
+        with conn:
+            return conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('data_version', 1) "
+                "ON CONFLICT(key) DO UPDATE SET value = value + 1 RETURNING value"
+            ).fetchone()[0]
+
+    def setting(self, key):
+        row = self._conn().execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_setting(self, key, value):
+        conn = self._conn()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def set_metrics(self, rows):
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT INTO metrics (day, habit, value) VALUES (?, ?, ?) "
+                "ON CONFLICT(day, habit) DO UPDATE SET value = excluded.value",
+                ((to_epoch_day(date_obj), habit, value) for habit, date_obj, value in rows)
+            )
+
+    def set_metric(self, habit, date_obj, value):
+        self.set_metrics([(habit, date_obj, value)])
+
+    def scan_metrics(self, start=None, end=None):
+        where, params = self._where(start, end)
+        return iter(self._conn().execute(f"SELECT day, habit, value FROM metrics{where} ORDER BY day, habit", params))
+
+    def streak_states(self):
+        states = {key: json.loads(state) for key, state in self._conn().execute("SELECT id, state FROM streaks")}
+        for state in states.values():
+            state.setdefault("v", 0)
+        return states
+
+    def save_streak_states(self, states):
+        conn = self._conn()
+        written = 0
+        with conn:
+            for state in states:
+                if state.get("v") is None:
+                    cursor = conn.execute(
+                        "INSERT INTO streaks (id, state) VALUES (?, ?) ON CONFLICT(id) DO NOTHING",
+                        (state["_id"], json.dumps(_next_version(state)))
+                    )
+                else:
+                    cursor = conn.execute(
+                        "UPDATE streaks SET state = ? WHERE id = ? AND COALESCE(json_extract(state, '$.v'), 0) = ?",
+                        (json.dumps(_next_version(state)), state["_id"], state["v"])
+                    )
+                written += cursor.rowcount
+        return written
+
+    def add_hash_node(self, month, hi, lo):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO hash_tree (month, hi, lo, n) VALUES (?, ?, ?, 1) "
+                "ON CONFLICT(month) DO UPDATE SET hi = hi + excluded.hi, lo = lo + excluded.lo, n = n + 1",
+                (month, hi, lo)
+            )
+
+    def hash_nodes(self):
+        conn = self._conn()
+        if not conn.execute("SELECT 1 FROM meta WHERE key = 'hash_tree_built'").fetchone():
+            return None
+        return {month: (hi, lo, n) for month, hi, lo, n in conn.execute("SELECT month, hi, lo, n FROM hash_tree")}
+
+    def set_hash_nodes(self, nodes, complete=False):
+        conn = self._conn()
+        with conn:
+            if complete:
+                conn.execute("DELETE FROM hash_tree")
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('hash_tree_built', 1)")
+            for month, (hi, lo, n) in nodes.items():
+                if n:
+                    conn.execute("INSERT OR REPLACE INTO hash_tree (month, hi, lo, n) VALUES (?, ?, ?, ?)", (month, hi, lo, n))
+                else:
+                    conn.execute("DELETE FROM hash_tree WHERE month = ?", (month,))
+
+    def set_note(self, date_obj, text):
+        conn = self._conn()
+        with conn:
+            if text:
+                conn.execute("INSERT OR REPLACE INTO notes (rowid, text) VALUES (?, ?)", (to_epoch_day(date_obj), text))
+            else:
+                conn.execute("DELETE FROM notes WHERE rowid = ?", (to_epoch_day(date_obj),))
+
+    def search_notes(self, terms, limit, offset=0):
+        # Quoted terms are plain words to FTS5, whatever the user typed
+        match = " OR ".join('"%s"' % term.replace('"', '""') for term in terms)
+        conn = self._conn()
+        total = conn.execute("SELECT COUNT(*) FROM notes WHERE notes MATCH ?", (match,)).fetchone()[0]
+        # bm25() is lower for better matches; negate it so higher scores rank first everywhere
+        hits = conn.execute(
+            "SELECT rowid, text, -bm25(notes) FROM notes WHERE notes MATCH ? "
+            "ORDER BY bm25(notes), rowid DESC LIMIT ? OFFSET ?",
+            (match, limit, offset)
+        ).fetchall()
+        return total, hits
+
+
+class MemoryStore:
+    label = "memory"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.days = []
+        self.moods = {}
+        self.version = 0
+        self.settings = {}
+        self.metric_keys = []
+        self.metric_values = {}
+        self.streaks = {}
+        self.notes = {}
+        self.hash_tree = {}
+        self.hash_tree_built = False
+
+    def upsert(self, date_obj, mood):
+        day = to_epoch_day(date_obj)
+        with self.lock:
+            if day in self.moods:
+                return False
+            self.moods[day] = mood
+            bisect.insort(self.days, day)
+            return True
+
+    def bulk_upsert(self, entries):
+        return sum(1 for date_obj, mood in entries if self.upsert(date_obj, mood))
+
+    def _slice(self, start, end):
+        lo = 0 if start is None else bisect.bisect_left(self.days, start)
+        hi = len(self.days) if end is None else bisect.bisect_left(self.days, end)
+        return self.days[lo:hi]
+
+    def scan(self, start=None, end=None):
+        with self.lock:
+            rows = [(day, self.moods[day]) for day in self._slice(start, end)]
+        return (doc_for_day(day, mood) for day, mood in rows)
+
+    def count(self, start=None, end=None):
+        with self.lock:
+            return len(self._slice(start, end))
+
+    def data_version(self):
+        return self.version
+
+    def bump_data_version(self):
+        with self.lock:
+            self.version += 1
+            return self.version
+
+    def setting(self, key):
+        with self.lock:
+            return self.settings.get(key)
+
+    def set_setting(self, key, value):
+        with self.lock:
+            self.settings[key] = value
+
+    def set_metric(self, habit, date_obj, value):
+        key = (to_epoch_day(date_obj), habit)
+        with self.lock:
+            if key not in self.metric_values:
+                bisect.insort(self.metric_keys, key)
+            self.metric_values[key] = value
+
+    def set_metrics(self, rows):
+        for habit, date_obj, value in rows:
+            self.set_metric(habit, date_obj, value)
+
+    def scan_metrics(self, start=None, end=None):
+        with self.lock:
+            lo = 0 if start is None else bisect.bisect_left(self.metric_keys, (start,))
+            hi = len(self.metric_keys) if end is None else bisect.bisect_left(self.metric_keys, (end,))
+            rows = [(day, habit, self.metric_values[(day, habit)]) for day, habit in self.metric_keys[lo:hi]]
+        return iter(rows)
+
+    def streak_states(self):
+        with self.lock:
+            return {key: dict(state) for key, state in self.streaks.items()}
+
+    def save_streak_states(self, states):
+        written = 0
+        with self.lock:
+            for state in states:
+                current = self.streaks.get(state["_id"])
+                if (current["v"] if current else None) == state.get("v"):
+                    self.streaks[state["_id"]] = _next_version(state)
+                    written += 1
+        return written
+
+    def add_hash_node(self, month, hi, lo):
+        with self.lock:
+            node = self.hash_tree.get(month, (0, 0, 0))
+            self.hash_tree[month] = (node[0] + hi, node[1] + lo, node[2] + 1)
+
+    def hash_nodes(self):
+        with self.lock:
+            return dict(self.hash_tree) if self.hash_tree_built else None
+
+    def set_hash_nodes(self, nodes, complete=False):
+        with self.lock:
+            if complete:
+                self.hash_tree = {}
+                self.hash_tree_built = True
+            for month, node in nodes.items():
+                if node[2]:
+                    self.hash_tree[month] = tuple(node)
+                else:
+                    self.hash_tree.pop(month, None)
+
+    def set_note(self, date_obj, text):
+        with self.lock:
+            if text:
+                self.notes[to_epoch_day(date_obj)] = text
+            else:
+                self.notes.pop(to_epoch_day(date_obj), None)
+
+    def search_notes(self, terms, limit, offset=0):
+        with self.lock:
+            notes = list(self.notes.items())
+        hits = []
+        for day, text in notes:
+            score = matches(terms, text)
+            if score:
+                hits.append((day, text, score))
+        hits.sort(key=lambda hit: (-hit[2], -hit[0]))
+        return len(hits), hits[offset:offset + limit]
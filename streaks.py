@@ -0,0 +1,327 @@
+"""Streak state with timezone-aware expiry.
+
+Each series (the mood entries and every habit) keeps one small state
+document: the length of the run of consecutive days ending at its newest
+qualifying day, the longest run, and the timezone the streak is judged in.
+Writes update it incrementally, so reading a streak never walks history.
+
+A run stays current until the end of the local day after its last entry:
+log today or yesterday and the streak holds; miss a whole local day and it
+drops to 0. A sweep re-evaluates every series at each local midnight and
+writes the results back in one batch, expiring broken streaks and
+confirming live ones. Reads also apply the same O(1) check, so a late or
+skipped sweep never shows a streak that has already ended.
+
+The sweep runs on a background thread in each app process. For serverless
+deployments, where threads do not outlive the request, run it from cron:
+
+    python streaks.py --sweep
+    python streaks.py --rebuild   # recompute every state from history
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+from schema import epoch_day_to_str, to_epoch_day
+
+
+def local_today(timezone, now=None):
+    """Epoch-day of the current date in `timezone`."""
+    now = now or datetime.now(pytz.utc)
+    return to_epoch_day(now.astimezone(pytz.timezone(timezone)).date())
+
+
+def seconds_until_midnight(timezone, now=None):
+    now = now or datetime.now(pytz.utc)
+    tz = pytz.timezone(timezone)
+    tomorrow = now.astimezone(tz).date() + timedelta(days=1)
+    midnight = tz.localize(datetime(tomorrow.year, tomorrow.month, tomorrow.day))
+    return max((midnight - now).total_seconds(), 0)
+
+
+def evaluate(state, today):
+    """The streak as of local epoch-day `today`."""
+    last_day = state["last_day"]
+    return state["run"] if last_day is not None and today - last_day <= 1 else 0
+
+
+def runs_from_days(days):
+    """(run ending at the newest day, longest run, newest day) for ascending epoch-days."""
+    run = longest = 0
+    last_day = None
+    for day in days:
+        if day == last_day:
+            continue
+        run = run + 1 if last_day is not None and day == last_day + 1 else 1
+        longest = max(longest, run)
+        last_day = day
+    return run, longest, last_day
+
+
+def run_summary(days):
+    """Summarise ascending epoch-days as [first, last, prefix run, suffix run, longest run].
+
+    Summaries of consecutive date ranges combine with combine_runs, so a
+    long history can be summarised in parallel partitions.
+    """
+    summary = None
+    for day in days:
+        if summary is None:
+            summary = [day, day, 1, 1, 1]
+            continue
+        first, last, prefix, suffix, longest = summary
+        if day == last:
+            continue
+        suffix = suffix + 1 if day == last + 1 else 1
+        if prefix == last - first + 1 and day == last + 1:
+            prefix += 1
+        summary = [first, day, prefix, suffix, max(longest, suffix)]
+    return summary
+
+
+def combine_runs(a, b):
+    """Summary of two adjacent ranges, `a` entirely before `b` (either may be None)."""
+    if a is None or b is None:
+        return a or b
+    joined = b[0] == a[1] + 1
+    a_full = a[2] == a[1] - a[0] + 1
+    b_full = b[2] == b[1] - b[0] + 1
+    prefix = a[2] + b[2] if a_full and joined else a[2]
+    suffix = b[3] + a[3] if b_full and joined else b[3]
+    longest = max(a[4], b[4], a[3] + b[2] if joined else 0)
+    return [a[0], b[1], prefix, suffix, longest]
+
+
+class StreakTracker:
+    """Streak states in the storage backend, kept current by writes and sweeps.
+
+    Every state carries a version; a write only lands if the stored version
+    is still the one it was computed from (see save_streak_states in
+    storage.py), so concurrent writers retry instead of losing updates.
+    """
+
+    def __init__(self, store, history, default_timezone="UTC", on_change=None, sweep_interval=None, max_retries=8):
+        self.store = store
+        # series -> qualifying epoch-days in ascending order; only used to (re)build a state
+        self.history = history
+        self.default_timezone = default_timezone
+        # Called after a sweep or timezone change alters a visible streak (e.g. to bump the data version)
+        self.on_change = on_change
+        self.sweep_interval = sweep_interval
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def timezone(self, states=None):
+        """The timezone set with set_timezone, shared by every app process."""
+        timezone = self.store.setting("streak_timezone")
+        if timezone:
+            return timezone
+        # Stores from before the setting existed: the timezone the states were judged in
+        states = self.store.streak_states() if states is None else states
+        for state in states.values():
+            return state["timezone"]
+        return self.default_timezone
+
+    def _build(self, series, timezone):
+        return self._state(series, timezone, *runs_from_days(self.history(series)))
+
+    def _state(self, series, timezone, run, longest, last_day):
+        today = local_today(timezone)
+        state = {
+            "_id": series,
+            "timezone": timezone,
+            "run": run,
+            "longest": longest,
+            "last_day": last_day,
+            "checked_day": today
+        }
+        state["streak"] = evaluate(state, today)
+        return state
+
+    def _update(self, series, change):
+        """Save change(current state or None, states) for one series, retrying on conflicts.
+
+        `change` returns the new state, or None to leave the series alone.
+        """
+        for _ in range(self.max_retries):
+            states = self.store.streak_states()
+            state = states.get(series)
+            new_state = change(state, states)
+            if new_state is None:
+                return state
+            new_state["v"] = state["v"] if state else None
+            if self.store.save_streak_states([new_state]):
+                return new_state
+        raise RuntimeError(f"Could not update streak state for {series} after {self.max_retries} attempts")
+
+    def replace(self, summaries):
+        """Save states computed elsewhere from {series: run_summary(...) or None}."""
+        timezone = self.timezone()
+        return [
+            self._update(series, lambda state, states, summary=summary, series=series: (
+                self._state(series, timezone, summary[3], summary[4], summary[1]) if summary
+                else self._state(series, timezone, 0, 0, None)
+            ))
+            for series, summary in summaries.items()
+        ]
+
+    def rebuild(self, series_list):
+        timezone = self.timezone()
+        return [
+            self._update(series, lambda state, states, series=series: self._build(series, timezone))
+            for series in series_list
+        ]
+
+    def get_all(self, series_list):
+        """Current view of several series from one read; missing states are built once."""
+        self.ensure_sweeper()
+        states = self.store.streak_states()
+        missing = [series for series in series_list if series not in states]
+        if missing:
+            timezone = self.timezone(states)
+            built = [self._build(series, timezone) for series in missing]
+            # Inserted only if still absent; a concurrent builder's copy is just as good
+            self.store.save_streak_states([dict(state, v=None) for state in built])
+            states.update((state["_id"], state) for state in built)
+
+        views = {}
+        today_by_tz = {}
+        for series in series_list:
+            state = states[series]
+            if state["timezone"] not in today_by_tz:
+                today_by_tz[state["timezone"]] = local_today(state["timezone"])
+            views[series] = self.view(state, today_by_tz[state["timezone"]])
+        return views
+
+    def get(self, series):
+        return self.get_all([series])[series]
+
+    def view(self, state, today):
+        streak = evaluate(state, today)
+        return {
+            "streak": streak,
+            "longest_streak": state["longest"],
+            "last_date": epoch_day_to_str(state["last_day"]) if state["last_day"] is not None else None,
+            "timezone": state["timezone"],
+            "expired": state["last_day"] is not None and streak == 0
+        }
+
+    def record(self, series, day, qualifies=True):
+        """Fold a written day into the series' state.
+
+        Appending the next day extends the run in O(1). Anything that can
+        change the middle of history (a backfilled day, or a value that no
+        longer counts) rebuilds that one series instead.
+        """
+        def change(state, states):
+            if state is None:
+                state = self._build(series, self.timezone(states))
+            elif state["last_day"] is None or day > state["last_day"]:
+                if not qualifies:
+                    return None
+                state = dict(state)
+                state["run"] = state["run"] + 1 if state["last_day"] is not None and day == state["last_day"] + 1 else 1
+                state["longest"] = max(state["longest"], state["run"])
+                state["last_day"] = day
+            elif day == state["last_day"] and qualifies:
+                return None
+            else:
+                state = self._build(series, state["timezone"])
+
+            today = local_today(state["timezone"])
+            state["streak"] = evaluate(state, today)
+            state["checked_day"] = today
+            return state
+
+        self._update(series, change)
+
+    def set_timezone(self, timezone):
+        pytz.timezone(timezone)  # raises pytz.UnknownTimeZoneError
+        today = local_today(timezone)
+
+        def change(state, states):
+            state = dict(state, timezone=timezone, checked_day=today)
+            state["streak"] = evaluate(state, today)
+            return state
+
+        # Saved first, so states built from now on use it even if nothing exists yet
+        self.store.set_setting("streak_timezone", timezone)
+        for series in self.store.streak_states():
+            self._update(series, change)
+        if self.on_change:
+            self.on_change()
+
+    def sweep(self, now=None):
+        """Expire or confirm every streak whose local day has moved on, in one batched write.
+
+        A state written concurrently is skipped: its writer already judged it
+        against the current day.
+        """
+        states = self.store.streak_states()
+        updated = []
+        expired = confirmed = 0
+        for state in states.values():
+            today = local_today(state["timezone"], now)
+            if state.get("checked_day") == today:
+                continue
+            streak = evaluate(state, today)
+            if streak == 0 and state.get("streak"):
+                expired += 1
+            elif streak:
+                confirmed += 1
+            state["streak"] = streak
+            state["checked_day"] = today
+            updated.append(state)
+
+        if updated:
+            self.store.save_streak_states(updated)
+        if expired and self.on_change:
+            self.on_change()
+        return {"checked": len(updated), "expired": expired, "confirmed": confirmed}
+
+    def ensure_sweeper(self):
+        # Started lazily so that forked gunicorn workers each get their own thread
+        if self.sweep_interval is None:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="streak-sweep", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                timezones = {state["timezone"] for state in self.store.streak_states().values()}
+                wait = min(seconds_until_midnight(tz) for tz in timezones or {self.timezone()})
+            except Exception as e:
+                print(f"Error scheduling streak sweep: {str(e)}")
+                wait = self.sweep_interval
+            # Wake just after the earliest local midnight, and at least every sweep_interval
+            time.sleep(min(wait + 1, self.sweep_interval))
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Error sweeping streaks: {str(e)}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Streak state maintenance")
+    parser.add_argument("--sweep", action="store_true", help="expire or confirm streaks for the current local day")
+    parser.add_argument("--rebuild", action="store_true", help="recompute every streak state from history")
+    args = parser.parse_args()
+    if not (args.sweep or args.rebuild):
+        parser.error("nothing to do (try --sweep or --rebuild)")
+
+    # Uses the same STORAGE_BACKEND / MONGO_URI / SQLITE_PATH settings as the app
+    from app import STREAK_SERIES, bump_data_version, streak_tracker
+
+    if args.rebuild:
+        print(f"Rebuilt {len(streak_tracker.rebuild(STREAK_SERIES))} streak states")
+        bump_data_version()
+    if args.sweep:
+        print(streak_tracker.sweep())
@@ -0,0 +1,46 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Must be set before app is first imported: the default backend connects to MongoDB
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ["STREAK_SWEEP_INTERVAL"] = "0"
+os.environ.pop("GOOGLE_SCRIPT_URL", None)
+os.environ.pop("BINARY_SNAPSHOT_PATH", None)
+
+
+@pytest.fixture
+def app_module(monkeypatch):
+    """A freshly imported app on the memory backend, so caches and stores start empty."""
+    for name in ("EDGE_CACHE", "EDGE_PURGE_URL", "FASTLY_SERVICE_ID", "ADMISSION_LIMITS", "READ_ROUTING"):
+        monkeypatch.delenv(name, raising=False)
+    import app
+    return importlib.reload(app)
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def entries(app_module, monkeypatch):
+    """The app's entry reads served from a list, and its data version from a counter."""
+    data = {"entries": [], "version": 0}
+    monkeypatch.setattr(app_module, "load_entries", lambda *args: list(data["entries"]))
+    monkeypatch.setattr(app_module, "get_data_version", lambda: data["version"])
+    return data
+
+
+def add_entry(entries, date, mood="happy"):
+    """Append an entry and bump the version, as /submit does."""
+    entries["entries"].append({"date": date, "mood": mood})
+    entries["version"] += 1
+
+
+def submit(client, date, mood="happy", **kwargs):
+    return client.post("/submit", json={"date": date, "mood": mood}, **kwargs)
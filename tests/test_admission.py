@@ -0,0 +1,71 @@
+import threading
+import time
+
+from admission import AdmissionController, RouteLimiter
+from conftest import add_entry
+
+
+def test_sheds_when_queue_is_full():
+    limiter = RouteLimiter("data", max_concurrent=1, max_queue=0, timeout=1)
+    assert limiter.acquire()
+    assert not limiter.acquire()
+    assert limiter.stats()["shed"] == 1
+
+    limiter.release()
+    assert limiter.acquire()
+
+
+def test_queued_request_is_shed_after_timeout():
+    limiter = RouteLimiter("data", max_concurrent=1, max_queue=1, timeout=0.05)
+    assert limiter.acquire()
+    assert not limiter.acquire()
+    stats = limiter.stats()
+    assert (stats["active"], stats["queue_depth"], stats["shed"]) == (1, 0, 1)
+
+
+def test_queued_request_runs_when_a_slot_frees():
+    limiter = RouteLimiter("data", max_concurrent=1, max_queue=1, timeout=5)
+    assert limiter.acquire()
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(limiter.acquire()))
+    waiter.start()
+    while limiter.stats()["queue_depth"] == 0:
+        time.sleep(0.01)
+    limiter.release()
+    waiter.join()
+    assert results == [True]
+
+
+def test_shed_request_gets_503_with_retry_after(app_module, client):
+    app_module.admission.limiters["data"] = RouteLimiter("data", max_concurrent=0, max_queue=0, timeout=0)
+    response = client.get("/data")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(app_module.admission.retry_after)
+    assert 'streakflow_admission_shed_total{route="data"} 1' in client.get("/metrics").get_data(as_text=True)
+
+
+def test_snapshot_served_stale_under_pressure(app_module, entries):
+    add_entry(entries, "2024-01-01")
+    stale = app_module.get_snapshot()
+    add_entry(entries, "2024-01-02")
+
+    limiter = RouteLimiter("home", max_concurrent=1, max_queue=1, timeout=5)
+    limiter.acquire()
+    # Every slot busy is not pressure until someone queues behind it
+    assert not limiter.under_pressure()
+    waiter = threading.Thread(target=lambda: limiter.acquire() and limiter.release())
+    waiter.start()
+    while limiter.stats()["queue_depth"] == 0:
+        time.sleep(0.01)
+
+    app_module.admission.limiters["home"] = limiter
+    with app_module.app.test_request_context("/"):
+        assert app_module.get_snapshot() is stale
+    assert limiter.stats()["degraded"] == 1
+    limiter.release()
+    waiter.join()
+
+
+def test_prometheus_lists_every_route():
+    controller = AdmissionController({"data": {"max_concurrent": 1, "max_queue": 1, "timeout": 1}})
+    assert 'streakflow_admission_active{route="data"} 0' in controller.prometheus()
@@ -0,0 +1,60 @@
+from datetime import datetime
+
+from anti_entropy import HashTree, compare, load_nodes, month_nodes, store_pairs
+from conftest import submit
+
+
+class FakeSheet:
+    """SheetHashes over in-memory (date, mood) rows."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.tree = HashTree.from_rows(rows)
+        self.bytes_received = 0
+
+    def years(self):
+        return self.tree.years()
+
+    def year_months(self, year):
+        return self.tree.year_months(year)
+
+    def month_rows(self, month):
+        return [row for row in self.rows if row[0].startswith(month)]
+
+
+def test_inserts_keep_the_stored_nodes_current(app_module, client):
+    store = app_module.store
+    submit(client, "2024-01-01")
+    # Backfilled once from a scan, then maintained by every insert
+    assert load_nodes(store) == month_nodes([("2024-01-01", "happy")])
+    submit(client, "2024-01-02", "sad")
+    submit(client, "2024-02-01")
+
+    scanned = month_nodes(store_pairs(store.scan()))
+    assert {month: list(node) for month, node in store.hash_nodes().items()} == scanned
+    assert HashTree.from_nodes(store.hash_nodes()).years() == HashTree.from_rows(store_pairs(store.scan())).years()
+
+
+def test_check_reads_only_months_that_differ(app_module, client):
+    for date in ("2023-12-31", "2024-01-01", "2024-02-01"):
+        submit(client, date)
+    store = app_module.store
+    sheet = FakeSheet([("2023-12-31", "happy"), ("2024-01-01", "happy"), ("2024-02-01", "sad"), ("2024-02-02", "happy")])
+    scanned = []
+
+    def month_rows(month):
+        scanned.append(month)
+        return [row for row in store_pairs(store.scan()) if row[0].startswith(month)]
+
+    report = compare(HashTree.from_nodes(load_nodes(store)), sheet, month_rows)
+    assert (report["years"], scanned) == (["2024"], ["2024-02"])
+    assert report["missing_in_store"] == [["2024-02-02", "happy"]]
+    assert report["conflicts"] == [{"date": "2024-02-01", "store": "happy", "sheet": "sad"}]
+
+
+def test_entries_written_without_a_node_are_backfilled(app_module):
+    store = app_module.store
+    store.upsert(datetime(2024, 3, 1), "happy")
+    assert store.hash_nodes() is None
+    assert load_nodes(store) == month_nodes([("2024-03-01", "happy")])
+    assert store.hash_nodes() == {"2024-03": tuple(month_nodes([("2024-03-01", "happy")])["2024-03"])}
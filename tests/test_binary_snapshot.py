@@ -0,0 +1,29 @@
+from datetime import datetime
+
+from anti_entropy import load_nodes, record_entry
+from binary_snapshot import SnapshotEntries, write_snapshot
+from schema import decode_entry
+from storage import MemoryStore
+
+
+def test_only_years_whose_node_counts_moved_are_rescanned(tmp_path, monkeypatch):
+    store = MemoryStore()
+    store.bulk_upsert([(datetime(year, 3, 1), "happy") for year in (2021, 2022, 2023)])
+    load_nodes(store)
+    path = str(tmp_path / "snapshot.bin")
+    write_snapshot(path, store.scan(), store.data_version())
+    entries = SnapshotEntries(store, path)
+
+    store.upsert(datetime(2022, 3, 2), "sad")
+    record_entry(store, "2022-03-02", "sad")
+    store.bump_data_version()
+
+    scanned = []
+    scan = store.scan
+    monkeypatch.setattr(store, "count", lambda *args: 1 / 0)
+    monkeypatch.setattr(store, "scan", lambda start=None, end=None: scanned.append((start, end)) or scan(start, end))
+    dates = [decode_entry(doc)["date"] for doc in entries.scan()]
+
+    assert dates == ["2021-03-01", "2022-03-01", "2022-03-02", "2023-03-01"]
+    # 2022, plus the (empty) ranges before and after the snapshot's years
+    assert len(scanned) == 3
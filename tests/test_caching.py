@@ -0,0 +1,46 @@
+from conftest import add_entry
+
+
+def test_snapshot_is_cached_per_data_version(app_module, entries):
+    add_entry(entries, "2024-01-01")
+    first = app_module.get_snapshot()
+    assert first["total"] == 1
+
+    # A write that does not bump the version is not seen until the TTL runs out
+    entries["entries"].append({"date": "2024-01-02", "mood": "sad"})
+    assert app_module.get_snapshot() is first
+
+    entries["version"] += 1
+    second = app_module.get_snapshot()
+    assert second["total"] == 2
+    assert second["version"] == entries["version"]
+
+
+def test_snapshot_expires_after_ttl(app_module, entries, monkeypatch):
+    add_entry(entries, "2024-01-01")
+    first = app_module.get_snapshot()
+    entries["entries"].append({"date": "2024-01-02", "mood": "sad"})
+
+    monkeypatch.setattr(app_module, "SNAPSHOT_TTL", 0)
+    assert app_module.get_snapshot()["total"] == 2
+    assert first["total"] == 1
+
+
+def test_home_page_embeds_the_current_snapshot(client, entries):
+    assert client.get("/").status_code == 200
+    add_entry(entries, "2024-03-05")
+    assert '"total": 1' in client.get("/").get_data(as_text=True)
+
+
+def test_chart_series_is_rebuilt_after_a_write(client, entries):
+    add_entry(entries, "2024-01-01", "sad")
+    before = client.get("/chart-series?range=all&points=10").get_json()
+    add_entry(entries, "2024-01-02", "happy")
+    after = client.get("/chart-series?range=all&points=10").get_json()
+
+    assert after["version"] > before["version"]
+    assert [point["date"] for point in after["points"]] == ["2024-01-01", "2024-01-02"]
+
+
+def test_chart_series_rejects_unknown_range(client, entries):
+    assert client.get("/chart-series?range=2w").status_code == 400
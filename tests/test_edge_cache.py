@@ -0,0 +1,41 @@
+import importlib
+
+import pytest
+
+from conftest import submit
+from edge_cache import MemoryPurger
+
+
+@pytest.fixture
+def purged(app_module, monkeypatch):
+    """Edge caching on, with purges recorded instead of sent."""
+    purger = MemoryPurger()
+    monkeypatch.setattr(app_module.edge_cache, "purger", purger)
+    monkeypatch.setattr(app_module, "EDGE_CACHE", True)
+    return purger
+
+
+def test_edge_cache_is_off_without_a_purger(app_module, client, monkeypatch):
+    assert not app_module.EDGE_CACHE
+    assert "s-maxage" not in client.get("/data").headers.get("Cache-Control", "")
+
+    monkeypatch.setenv("EDGE_PURGE_URL", "http://localhost/purge")
+    assert importlib.reload(app_module).EDGE_CACHE
+
+
+def test_reads_are_cacheable_and_vary_on_cookie(client, purged):
+    response = client.get("/data")
+    assert "s-maxage" in response.headers["Cache-Control"]
+    assert "Cookie" in response.headers["Vary"]
+
+
+def test_submit_then_get_is_fresh_and_private(client, purged):
+    assert client.get("/data").get_json()["logs"] == []
+    assert submit(client, "2024-01-01").status_code == 201
+    assert ["entries"] in purged.purged
+
+    # The test client sends back the sf_last_write cookie set by /submit
+    for path in ("/data", "/insights", "/"):
+        response = client.get(path)
+        assert response.headers["Cache-Control"] == "private, max-age=0"
+    assert client.get("/data").get_json()["logs"] == [{"date": "2024-01-01", "mood": "happy"}]
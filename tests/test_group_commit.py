@@ -0,0 +1,54 @@
+import threading
+from datetime import datetime
+
+import pytest
+
+from group_commit import GroupCommitTimeout, GroupCommitter
+
+
+class SlowCollection:
+    """Stands in for a collection whose bulk_write stalls until released."""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def bulk_write(self, ops, ordered=True):
+        self.release.wait(5)
+        return type("Result", (), {"upserted_ids": {i: i for i in range(len(ops))}})()
+
+
+def test_stalled_batch_times_out_and_finishes_late():
+    collection = SlowCollection()
+    late = []
+    finished = threading.Event()
+
+    def on_late_commit(date_obj, mood):
+        late.append((date_obj, mood))
+        finished.set()
+
+    committer = GroupCommitter(collection, window_ms=0, timeout=0.05, on_late_commit=on_late_commit)
+    with pytest.raises(GroupCommitTimeout):
+        committer.submit(datetime(2024, 1, 1), "happy")
+
+    collection.release.set()
+    assert finished.wait(5)
+    assert late == [(datetime(2024, 1, 1), "happy")]
+
+
+def test_write_committed_in_time_is_not_late():
+    collection = SlowCollection()
+    collection.release.set()
+    late = []
+    committer = GroupCommitter(collection, window_ms=0, timeout=5, on_late_commit=lambda *args: late.append(args))
+    assert committer.submit(datetime(2024, 1, 1), "happy") is True
+    assert late == []
+
+
+def test_submit_answers_503_when_the_write_is_not_confirmed(app_module, client, monkeypatch):
+    def stalled(date_obj, mood):
+        raise GroupCommitTimeout("not committed")
+
+    monkeypatch.setattr(app_module.store, "upsert", stalled)
+    response = client.post("/submit", json={"date": "2024-01-01", "mood": "happy"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(app_module.admission.retry_after)
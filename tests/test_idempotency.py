@@ -0,0 +1,59 @@
+import threading
+
+from conftest import submit
+from idempotency import IdempotencyCache, MemoryIdempotencyStore
+
+
+def test_retry_replays_first_response(app_module, client):
+    first = submit(client, "2024-01-01", headers={"Idempotency-Key": "abc"})
+    retry = submit(client, "2024-01-01", headers={"Idempotency-Key": "abc"})
+
+    assert first.status_code == retry.status_code == 201
+    assert retry.get_data() == first.get_data()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert app_module.store.count() == 1
+
+
+def test_key_reused_for_another_body_is_rejected(client):
+    submit(client, "2024-01-01", headers={"Idempotency-Key": "abc"})
+    response = submit(client, "2024-01-02", headers={"Idempotency-Key": "abc"})
+    assert response.status_code == 422
+
+
+def test_invalid_key_is_rejected(client):
+    assert submit(client, "2024-01-01", headers={"Idempotency-Key": "x" * 300}).status_code == 400
+
+
+def test_server_error_releases_the_key(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, "save_submission", lambda: (app_module.jsonify({"error": "boom"}), 500))
+    assert submit(client, "2024-01-01", headers={"Idempotency-Key": "abc"}).status_code == 500
+    monkeypatch.undo()
+
+    retry = submit(client, "2024-01-01", headers={"Idempotency-Key": "abc"})
+    assert retry.status_code == 201
+    assert "Idempotent-Replayed" not in retry.headers
+
+
+def test_duplicate_waits_for_the_original():
+    cache = IdempotencyCache(MemoryIdempotencyStore(), wait_timeout=5, poll_interval=0.01)
+    assert cache.begin("k", "f") == ("run", None)
+
+    outcomes = []
+    waiter = threading.Thread(target=lambda: outcomes.append(cache.begin("k", "f")))
+    waiter.start()
+    cache.complete("k", 201, '{"message": "ok"}', "application/json")
+    waiter.join()
+    assert outcomes == [("replay", {"status": 201, "body": '{"message": "ok"}', "mimetype": "application/json"})]
+
+
+def test_duplicate_is_busy_while_original_runs():
+    cache = IdempotencyCache(MemoryIdempotencyStore(), wait_timeout=0.05, poll_interval=0.01)
+    assert cache.begin("k", "f") == ("run", None)
+    assert cache.begin("k", "f") == ("busy", None)
+
+
+def test_abandoned_lease_is_taken_over():
+    cache = IdempotencyCache(MemoryIdempotencyStore(), lease_seconds=-1, wait_timeout=0)
+    assert cache.begin("k", "f") == ("run", None)
+    assert cache.begin("k", "f") == ("run", None)
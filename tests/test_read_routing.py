@@ -0,0 +1,31 @@
+import time
+
+from flask import Response
+from pymongo import MongoClient
+
+# Only the routed read preference is inspected, so this never connects
+ENTRIES = MongoClient("mongodb://localhost:27017", connect=False)["streakflow"]["entries"]
+
+
+def test_dashboard_reads_go_to_secondaries(app_module):
+    with app_module.app.test_request_context("/data"):
+        assert app_module.reads(ENTRIES).read_preference.mongos_mode == "secondaryPreferred"
+    # Outside a request (CLI tools, background work) reads stay on the primary
+    assert app_module.reads(ENTRIES).read_preference.mongos_mode == "primary"
+
+
+def test_reads_after_a_write_stay_on_the_primary(app_module):
+    with app_module.app.test_request_context("/data", headers={"Cookie": f"sf_last_write={time.time()}"}):
+        assert app_module.recently_wrote()
+        assert app_module.reads(ENTRIES).read_preference.mongos_mode == "primary"
+
+    expired = time.time() - app_module.READ_YOUR_WRITES_SECONDS - 1
+    with app_module.app.test_request_context("/data", headers={"Cookie": f"sf_last_write={expired}"}):
+        assert not app_module.recently_wrote()
+
+
+def test_write_sets_read_your_writes_cookie(app_module):
+    with app_module.app.test_request_context("/submit", method="POST"):
+        assert "Set-Cookie" not in app_module.remember_write(Response()).headers
+        app_module.g.wrote = True
+        assert "sf_last_write=" in app_module.remember_write(Response()).headers["Set-Cookie"]
@@ -0,0 +1,42 @@
+from datetime import datetime
+
+import pytest
+
+from conftest import submit
+from schema import decode_entry, to_epoch_day
+from storage import MemoryStore, SQLiteStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteStore(str(tmp_path / "streakflow.db"))
+    return MemoryStore()
+
+
+def test_first_write_for_a_day_wins(store):
+    assert store.upsert(datetime(2024, 1, 1), "happy")
+    assert not store.upsert(datetime(2024, 1, 1), "sad")
+    assert [decode_entry(doc) for doc in store.scan()] == [{"date": "2024-01-01", "mood": "happy"}]
+
+
+def test_scan_is_in_date_order_within_range(store):
+    assert store.bulk_upsert([(datetime(2024, 1, day), "neutral") for day in (5, 1, 3, 1)]) == 3
+    days = [to_epoch_day(datetime(2024, 1, day)) for day in (1, 3, 5)]
+
+    assert [decode_entry(doc)["date"] for doc in store.scan()] == ["2024-01-01", "2024-01-03", "2024-01-05"]
+    assert [decode_entry(doc)["date"] for doc in store.scan(days[1], days[2])] == ["2024-01-03"]
+    assert store.count(days[1]) == 2
+
+
+def test_data_version_counts_bumps(store):
+    assert store.data_version() == 0
+    store.bump_data_version()
+    store.bump_data_version()
+    assert store.data_version() == 2
+
+
+def test_duplicate_day_keeps_first_entry(client):
+    assert submit(client, "2024-01-01", "happy").status_code == 201
+    assert submit(client, "2024-01-01", "sad").status_code == 200
+    assert client.get("/data").get_json()["logs"] == [{"date": "2024-01-01", "mood": "happy"}]
@@ -0,0 +1,71 @@
+import threading
+from datetime import date
+
+from conftest import submit
+from schema import epoch_day_to_str, to_epoch_day
+from storage import MemoryStore
+from streaks import StreakTracker, local_today, runs_from_days
+
+
+def test_stale_state_is_not_saved():
+    store = MemoryStore()
+    assert store.save_streak_states([{"_id": "mood", "run": 1, "v": None}]) == 1
+    state = store.streak_states()["mood"]
+    assert store.save_streak_states([dict(state, run=2)]) == 1
+    # Written from the version read before the last save
+    assert store.save_streak_states([dict(state, run=3)]) == 0
+    assert store.streak_states()["mood"]["run"] == 2
+
+
+def test_concurrent_records_are_not_lost():
+    store = MemoryStore()
+    written = set()
+    lock = threading.Lock()
+
+    def history(series):
+        with lock:
+            return iter(sorted(written))
+
+    tracker = StreakTracker(store, history)
+    start = to_epoch_day(date.today()) - 119
+
+    def writer(days):
+        for day in days:
+            with lock:
+                written.add(day)
+            tracker.record("mood", day)
+
+    days = list(range(start, start + 120))
+    threads = [threading.Thread(target=writer, args=(days[i::4],)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    state = store.streak_states()["mood"]
+    assert (state["run"], state["longest"], state["last_day"]) == runs_from_days(days)
+    assert tracker.get("mood")["streak"] == 120
+
+
+def test_streak_comes_from_the_same_source_as_the_logs(app_module, client, monkeypatch):
+    today = local_today(app_module.streak_tracker.timezone())
+    submit(client, epoch_day_to_str(today - 10))
+    assert client.get("/data").get_json()["streak"] == 0
+
+    sheet = [{"date": epoch_day_to_str(day), "mood": "happy"} for day in range(today - 2, today + 1)]
+    monkeypatch.setattr(app_module, "fetch_google_sheets_entries", lambda: sheet)
+    app_module.bump_data_version()
+    body = client.get("/data").get_json()
+    assert (body["logs"], body["streak"]) == (sheet, 3)
+    assert client.get("/insights").get_json()["streak"] == 3
+    assert client.get("/data?stream=1").get_json()["streak"] == 3
+
+
+def test_timezone_is_shared_before_any_state_exists():
+    store = MemoryStore()
+    StreakTracker(store, lambda series: iter([])).set_timezone("Asia/Tokyo")
+    # Another process starts with the configured default and no states
+    other = StreakTracker(store, lambda series: iter([]))
+    assert other.timezone() == "Asia/Tokyo"
+    other.record("mood", local_today("Asia/Tokyo"))
+    assert store.streak_states()["mood"]["timezone"] == "Asia/Tokyo"